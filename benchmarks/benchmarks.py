@@ -153,8 +153,9 @@ def parse_args():
     plot = sp.add_parser('plot', help='plot graph')
     plot_summary = sp.add_parser('plot-summary', help='plot summary graph')
     latex = sp.add_parser('latex', help='write out LaTeX table')
+    compare = sp.add_parser('compare', help='compare two SlipCover versions, failing on a slowdown')
 
-    for p in [run, show, plot, plot_summary, latex]:
+    for p in [run, show, plot, plot_summary, latex, compare]:
         p.add_argument('--case', choices=[c.name for c in cases] + ['all'],
                        action='extend', nargs='+', help='select case(s) to run/plot')
         p.add_argument('--omit-case', action='extend', nargs='+', help='select case(s) to omit from run/plot')
@@ -167,6 +168,20 @@ def parse_args():
 
     latex.add_argument('--absolute', action='store_true', help='emit absolute numbers')
 
+    run.add_argument('--tracemalloc', action='store_true',
+                     help='also run each case once under tracemalloc, recording memory allocated by SlipCover')
+
+    compare.add_argument('old', type=str,
+                         help='git revision, or Python interpreter with SlipCover installed, to compare against')
+    compare.add_argument('new', type=str, nargs='?', default='.',
+                         help='git revision or Python interpreter to compare; defaults to the working tree ("."))')
+    compare.add_argument('--tries', type=int, help='number of (interleaved) repetitions')
+    compare.add_argument('--threshold', type=float, default=2.0,
+                         help='slowdown (in %%) to tolerate, beyond the confidence interval')
+
+    for p in [plot, plot_summary]:
+        p.add_argument('--memory', action='store_true', help='plot peak RSS rather than execution time')
+
     for p in [show, plot, plot_summary, latex]:
         p.add_argument('--os', type=str, help='select OS name (conflicts with --run)')
         p.add_argument('--python', type=str, help='select python version (conflicts with --run)')
@@ -192,7 +207,7 @@ def parse_args():
     args = ap.parse_args()
 
     if not args.case:
-        if args.cmd == 'run':
+        if args.cmd in ('run', 'compare'):
             args.case = ['slipcover', 'slipcover-branch']
         else:
             args.case = ['coveragepy', 'coveragepy-branch', 'slipcover', 'slipcover-branch']
@@ -218,6 +233,8 @@ def parse_args():
 
 
 def run_command(command: str, cwd=None, env=None):
+    """Runs a command, returning its elapsed time (in seconds) and its peak RSS (in bytes),
+       if available."""
     import shlex
     import time
     import os
@@ -230,13 +247,39 @@ def run_command(command: str, cwd=None, env=None):
     print(command)
 
     begin = time.perf_counter_ns()
-    subprocess.run(shlex.split(command), cwd=cwd, check=True, env=env) # capture_output=True)
+    proc = subprocess.Popen(shlex.split(command), cwd=cwd, env=env)
+    if hasattr(os, 'wait4'):
+        # wait4 gives us resource usage for this child alone, unlike getrusage(RUSAGE_CHILDREN)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in kilobytes on Linux, bytes on MacOS
+        max_rss = rusage.ru_maxrss * (1 if platform.system() == 'Darwin' else 1024)
+    else:
+        proc.wait()
+        max_rss = None
     end = time.perf_counter_ns()
 
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+
     elapsed = (end - begin)/1000000000
-    print(round(elapsed, 1))
+    print(round(elapsed, 1), f"{max_rss/2**20:.1f}MB" if max_rss is not None else "")
+
+    return elapsed, max_rss
+
 
-    return elapsed
+def run_tracemalloc(command: str, cwd=None, env=None):
+    """Runs a Python command under tracemalloc (see tracemalloc_run.py), returning its stats."""
+    import tempfile
+
+    assert command.startswith(sys.executable + " ")
+    wrapper = BENCHMARK_JSON.parent.resolve() / 'tracemalloc_run.py'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "tracemalloc.json"
+        run_command(f"{sys.executable} {wrapper} {out} {command[len(sys.executable)+1:]}", cwd=cwd, env=env)
+        with out.open() as f:
+            return json.load(f)
 
 
 def load_results(args):
@@ -327,6 +370,7 @@ def show_results():
         for bench in benchmarks:
             if bench.name not in results['base']: continue
             base_median = median(results['base'][bench.name]['times'])
+            base_rss = results['base'][bench.name].get('max_rss')
             for case in cases:
                 if case.name not in results or bench.name not in results[case.name]: continue
 
@@ -335,16 +379,24 @@ def show_results():
                 r = rd['times']
 
                 oh = round(overhead(median(r), base_median),1) if case.name != 'base' else None
+
+                rss = round(median(rd['max_rss'])/2**20,1) if 'max_rss' in rd else None
+                rss_oh = round(overhead(median(rd['max_rss']), median(base_rss)),1) \
+                         if 'max_rss' in rd and base_rss and case.name != 'base' else None
+                sc_alloc = round(rd['tracemalloc']['slipcover_current']/2**20,1) if 'tracemalloc' in rd else None
+
                 yield [bench.name, case.name, len(r), round(median(r),2), round(mean(r),2),
                        round(stdev(r),2),
                        round(stdev(r)/sqrt(len(r)),2), oh,
+                       rss, rss_oh, sc_alloc,
                        date,
                        rd['version'] if 'version' in rd else (rd['git_head'] if 'git_head' in rd else None)
                 ]
 
     print("")
     print(tabulate(get_stats(), headers=["bench", "case", "samples", "median", "mean", "stdev",
-                                         "SE", "overhead %", "date", "version"]))
+                                         "SE", "overhead %", "RSS MB", "RSS overhead %", "SlipCover MB",
+                                         "date", "version"]))
     print("")
 
 
@@ -366,6 +418,9 @@ def plot_results(args):
     common_benchmarks = set.intersection(*(set(results[c].keys()) for c in relevant_cases))
     all_benchmarks = all_benchmarks.intersection(args.bench)
     common_benchmarks = common_benchmarks.intersection(args.bench)
+    if args.memory:     # results from before RSS was recorded lack it
+        common_benchmarks = {b for b in common_benchmarks
+                             if all('max_rss' in results[c][b] for c in relevant_cases)}
 
     for c in relevant_cases:
         if not all_benchmarks.issubset(results[c].keys()):
@@ -395,11 +450,13 @@ def plot_results(args):
     if args.style:
         plt.style.use(args.style)
 
+    metric = 'max_rss' if args.memory else 'times'
+
     def getValue(caseName, benchName):
         if args.speedup:
-            return median(results[getBase(caseName)][benchName]['times']) / median(results[caseName][benchName]['times'])
+            return median(results[getBase(caseName)][benchName][metric]) / median(results[caseName][benchName][metric])
 
-        return median(results[caseName][benchName]['times']) / median(results['base'][benchName]['times'])
+        return median(results[caseName][benchName][metric]) / median(results['base'][benchName][metric])
 
     min_range, max_range = None, None
     times = 'x' if args.speedup else ''
@@ -426,9 +483,11 @@ def plot_results(args):
 
     ax.set_title(args.title, size=18+args.font_size_delta, weight='bold')
     if args.speedup:
-        ax.set_ylabel('Speedup over coverage.py', size=15+args.font_size_delta)
+        ax.set_ylabel('Speedup over coverage.py' + (' (peak RSS)' if args.memory else ''),
+                      size=15+args.font_size_delta)
     else:
-        ax.set_ylabel('Normalized execution time', size=15+args.font_size_delta)
+        ax.set_ylabel('Normalized peak RSS' if args.memory else 'Normalized execution time',
+                      size=15+args.font_size_delta)
     ax.set_yscale(args.yscale)
     if args.yscale == 'log':
         from matplotlib.ticker import ScalarFormatter
@@ -473,6 +532,9 @@ def plot_summary_results(args):
     common_benchmarks = set.intersection(*(set(results[c].keys()) for c in relevant_cases))
     all_benchmarks = all_benchmarks.intersection(args.bench)
     common_benchmarks = common_benchmarks.intersection(args.bench)
+    if args.memory:     # results from before RSS was recorded lack it
+        common_benchmarks = {b for b in common_benchmarks
+                             if all('max_rss' in results[c][b] for c in relevant_cases)}
 
     for c in relevant_cases:
         if not all_benchmarks.issubset(results[c].keys()):
@@ -495,9 +557,11 @@ def plot_summary_results(args):
     if args.style:
         plt.style.use(args.style)
 
+    metric = 'max_rss' if args.memory else 'times'
+
     def getValue(caseName, benchName):
-        exectime = median(results[caseName][benchName]['times'])
-        base = median(results['base'][benchName]['times'])
+        exectime = median(results[caseName][benchName][metric])
+        base = median(results['base'][benchName][metric])
 #        return 100*(exectime - base) / base
         return overhead(exectime, base)
 
@@ -530,7 +594,8 @@ def plot_summary_results(args):
             ax.set_ylim(0, max(data)*args.extra_space)
 
     ax.set_title(args.title, size=18+args.font_size_delta, weight='bold')
-    ax.set_ylabel('Execution time overhead' + (" (log scale)" if args.yscale=='log' else ""),
+    ax.set_ylabel(('Peak RSS overhead' if args.memory else 'Execution time overhead') +
+                  (" (log scale)" if args.yscale=='log' else ""),
                   size=15+args.font_size_delta)
     ax.set_yscale(args.yscale)
     ax.yaxis.set_major_formatter('{x:,.0f}%')
@@ -641,8 +706,124 @@ def latex_results(args):
     print("")
 
 
+def mean_ci(values):
+    """Returns the mean of a sample and the half-width of its 95% confidence interval."""
+    from math import sqrt
+    from statistics import mean, stdev
+
+    # Student's t distribution's 97.5% quantiles, by degrees of freedom
+    T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+             2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+             2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+    n = len(values)
+    if n < 2:
+        return mean(values), float('inf')
+
+    t = T_975[n-2] if n-2 < len(T_975) else 1.960
+    return mean(values), t * stdev(values) / sqrt(n)
+
+
+def compare_versions(args) -> int:
+    """Runs the selected benchmarks for two SlipCover versions, interleaving their repetitions,
+       and returns non-zero if the new one is significantly slower."""
+    import contextlib
+    import tempfile
+    import random
+    from math import exp, log
+    from tabulate import tabulate
+
+    repo = Path(subprocess.run("git rev-parse --show-toplevel", shell=True, check=True, cwd=BENCHMARK_JSON.parent,
+                               capture_output=True, text=True).stdout.strip())
+
+    class Version:
+        def __init__(self, spec, python=sys.executable, src=None):
+            self.spec = spec
+            self.python = python
+            self.env = {'PYTHONPATH': str(src)} if src else {}
+
+        def command(self, case, bench):
+            return self.python + case.command.format(**bench.format)[len(sys.executable):]
+
+    def prepare(spec: str, stack: contextlib.ExitStack) -> Version:
+        if spec == '.':
+            return Version(spec, src=repo / 'src')
+
+        if Path(spec).is_file():
+            return Version(spec, python=str(Path(spec).resolve()))
+
+        tmp = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        worktree = tmp / 'slipcover'
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, spec], cwd=repo, check=True)
+        stack.callback(subprocess.run, ['git', 'worktree', 'remove', '--force', worktree], cwd=repo)
+        subprocess.run([sys.executable, 'setup.py', '-q', 'build_ext', '--inplace'], cwd=worktree, check=True)
+        return Version(spec, src=worktree / 'src')
+
+    selected_cases = [c for c in cases if c.name in args.case and c.name != 'base']
+    base_case = next(c for c in cases if c.name == 'base')
+
+    rows = []
+    slower = []
+    with contextlib.ExitStack() as stack:
+        old, new = prepare(args.old, stack), prepare(args.new, stack)
+
+        for bench in [b for b in benchmarks if b.name in args.bench]:
+            tries = args.tries if args.tries else bench.tries
+
+            # base -> interpreter -> times; case -> version -> times
+            base_times = {v.python: [] for v in (old, new)}
+            times = {c.name: {old.spec: [], new.spec: []} for c in selected_cases}
+
+            for t in range(tries):
+                # interleave and shuffle the runs, so that drifts in system load affect all alike
+                runs = [(base_case, v) for v in {v.python: v for v in (old, new)}.values()] + \
+                       [(c, v) for c in selected_cases for v in (old, new)]
+                random.shuffle(runs)
+
+                for case, version in runs:
+                    print(f"--- {case.name} {bench.name} {version.spec} #{t+1}/{tries} ---")
+                    elapsed, _ = run_command(version.command(case, bench), cwd=bench.cwd,
+                                             env={**(case.env or {}), **version.env})
+                    if case is base_case:
+                        base_times[version.python].append(elapsed)
+                    else:
+                        times[case.name][version.spec].append(elapsed)
+
+            for case in selected_cases:
+                old_t, new_t = times[case.name][old.spec], times[case.name][new.spec]
+                old_oh = mean_ci([overhead(c, b) for c, b in zip(old_t, base_times[old.python])])
+                new_oh = mean_ci([overhead(c, b) for c, b in zip(new_t, base_times[new.python])])
+
+                # compare paired repetitions' log ratios, as slowdowns are multiplicative
+                change, ci = mean_ci([log(n/o) for n, o in zip(new_t, old_t)])
+                low, high = (exp(change-ci)-1)*100, (exp(change+ci)-1)*100
+
+                significant = low > args.threshold
+                if significant:
+                    slower.append(f"{bench.name}/{case.name}")
+
+                rows.append([bench.name, case.name, tries,
+                             f"{old_oh[0]:.1f} ± {old_oh[1]:.1f}", f"{new_oh[0]:.1f} ± {new_oh[1]:.1f}",
+                             f"{(exp(change)-1)*100:+.1f}", f"[{low:+.1f}, {high:+.1f}]",
+                             "SLOWER" if significant else ""])
+
+    print("")
+    print(tabulate(rows, headers=["bench", "case", "samples", f"{args.old} overhead %",
+                                  f"{args.new} overhead %", "change %", "95% CI", ""]))
+    print("")
+
+    if slower:
+        print(f"Significant slowdown (over {args.threshold}%) in: {', '.join(slower)}")
+        return 1
+
+    return 0
+
+
 if __name__ == "__main__":
     args = parse_args()
+    if args.cmd == 'compare':
+        sys.exit(compare_versions(args))
+
     saved_results, results = load_results(args)
 
     if args.cmd == 'run':
@@ -664,9 +845,12 @@ if __name__ == "__main__":
                         results[case.name][bench.name] = {'times': results[case.name][bench.name]}
 
                 times = []
+                max_rss = []
                 for t in range(bench.tries):
                     print(f"--- {case.name} {bench.name} #{t+1}/{bench.tries} ---")
-                    times.append(run_command(case.command.format(**bench.format), cwd=bench.cwd, env=case.env))
+                    elapsed, rss = run_command(case.command.format(**bench.format), cwd=bench.cwd, env=case.env)
+                    times.append(elapsed)
+                    max_rss.append(rss)
 
                 results[case.name][bench.name] = {
                     'datetime': datetime.now().isoformat(),
@@ -674,6 +858,14 @@ if __name__ == "__main__":
                     'times': times
                 }
 
+                if None not in max_rss:
+                    results[case.name][bench.name]['max_rss'] = max_rss
+
+                if args.tracemalloc:
+                    print(f"--- {case.name} {bench.name} tracemalloc ---")
+                    results[case.name][bench.name]['tracemalloc'] = \
+                        run_tracemalloc(case.command.format(**bench.format), cwd=bench.cwd, env=case.env)
+
                 if case.name == 'coveragepy':
                     import coverage
                     results[case.name][bench.name]['coveragepy_version'] = coverage.__version__
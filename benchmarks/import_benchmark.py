@@ -0,0 +1,216 @@
+"""Measures the time it takes to import a large (synthetic) package tree with no coverage,
+SlipCover line coverage and SlipCover line+branch coverage, with cold and warm bytecode caches.
+
+Results are saved to benchmarks.json, under the "imports" case of this system's entry,
+with a history of medians by version (git commit), as for microbenchmarks.py.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+
+from benchmarks import BENCHMARK_JSON, load_results, overhead
+
+IMPORTS_CASE = 'imports'
+
+MODES = {
+    'none': [],
+    'line': ['-m', 'slipcover', '--json', '--out', os.devnull],
+    'branch': ['-m', 'slipcover', '--branch', '--json', '--out', os.devnull],
+}
+
+CACHES = ['cold', 'warm']
+
+PACKAGE = "synthpkg"
+
+DRIVER = f"""\
+import sys, time
+begin = time.perf_counter()
+import {PACKAGE}
+print(time.perf_counter() - begin, file=sys.stderr)
+"""
+
+
+def module_source(functions: int) -> str:
+    src = ["import os", ""]
+    for f in range(functions):
+        src.append(f"def f{f}(x):")
+        src.append("    if x > 0:")
+        src.append(f"        return x + {f}")
+        src.append("    for i in range(x):")
+        src.append("        x += i")
+        src.append("    return x")
+        src.append("")
+
+    src.append("class C:")
+    for f in range(functions):
+        src.append(f"    def m{f}(self):")
+        src.append(f"        return f{f}(1)")
+    src.append("")
+    return "\n".join(src)
+
+
+def generate_tree(root: Path, modules: int, depth: int, fanout: int, functions: int) -> None:
+    """Generates a package tree with the given total number of modules, spread over
+       packages nested up to 'depth' levels, each with 'fanout' subpackages."""
+    packages = [root / PACKAGE]
+    level = packages
+    for _ in range(depth-1):
+        level = [p / f"sub{i}" for p in level for i in range(fanout)]
+        packages.extend(level)
+
+    contents = {p: [] for p in packages}
+    for p in packages[1:]:
+        contents[p.parent].append(p.name)
+
+    for m in range(modules):
+        p = packages[m % len(packages)]
+        name = f"mod{m}"
+        contents[p].append(name)
+        p.mkdir(parents=True, exist_ok=True)
+        (p / f"{name}.py").write_text(module_source(functions))
+
+    for p, children in contents.items():
+        p.mkdir(parents=True, exist_ok=True)
+        (p / "__init__.py").write_text("".join(f"from . import {c}\n" for c in children))
+
+    (root / "driver.py").write_text(DRIVER)
+
+
+def time_import(root: Path, mode: str, pycache: Path) -> float:
+    """Runs the driver in a new interpreter, returning the time it took to import the tree."""
+    env = os.environ.copy()
+    env['PYTHONPYCACHEPREFIX'] = str(pycache)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)    # warm runs need the cache written
+
+    cmd = [sys.executable, *MODES[mode]]
+    if mode != 'none':
+        cmd += ['--source', str(root)]
+    cmd += [str(root / "driver.py")]
+
+    p = subprocess.run(cmd, cwd=root, env=env, check=True, capture_output=True, text=True)
+    return float(p.stderr.strip().splitlines()[-1])
+
+
+def parse_args():
+    import argparse
+    ap = argparse.ArgumentParser()
+
+    sp = ap.add_subparsers(dest='cmd', required=True)
+    run = sp.add_parser('run', help='run import benchmark')
+    show = sp.add_parser('show', help='show import benchmark results')
+
+    run.add_argument('--mode', choices=list(MODES), action='extend', nargs='+', help='select mode(s) to run')
+    run.add_argument('--cache', choices=CACHES, action='extend', nargs='+', help='select cache state(s) to run')
+    run.add_argument('--tries', type=int, default=5, help='number of times to run each case')
+    run.add_argument('--modules', type=int, default=2000, help='number of modules to generate')
+    run.add_argument('--depth', type=int, default=3, help='package nesting depth')
+    run.add_argument('--fanout', type=int, default=4, help='number of subpackages in each package')
+    run.add_argument('--functions', type=int, default=10, help='number of functions in each module')
+    run.add_argument('--dry-run', action='store_true', help="don't save results")
+
+    show.add_argument('--os', type=str, help='select OS name')
+    show.add_argument('--python', type=str, help='select python version')
+
+    args = ap.parse_args()
+
+    if args.cmd == 'run':
+        args.mode = args.mode if args.mode else list(MODES)
+        args.cache = args.cache if args.cache else CACHES
+
+    return args
+
+
+def git_head() -> str:
+    return subprocess.run("git rev-parse --short HEAD", shell=True, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def run_import_benchmark(args, saved_results, results):
+    imports = results.setdefault(IMPORTS_CASE, dict())
+    version = git_head()
+    params = {'modules': args.modules, 'depth': args.depth, 'fanout': args.fanout,
+              'functions': args.functions}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "tree"
+        generate_tree(root, args.modules, args.depth, args.fanout, args.functions)
+
+        for mode in args.mode:
+            for cache in args.cache:
+                name = f"{mode}-{cache}"
+                times = []
+                for t in range(args.tries):
+                    if cache == 'cold':
+                        pycache = Path(tempfile.mkdtemp(dir=tmp))
+                    else:
+                        pycache = tmp / "pycache"
+                        if t == 0:
+                            time_import(root, mode, pycache)   # warm up
+                    times.append(time_import(root, mode, pycache))
+
+                print(f"{name:15} median: {median(times):8.3f}s")
+
+                prev = imports.get(name, dict())
+                history = prev.get('history', [])
+                if prev.get('params') != params:
+                    history = []    # not comparable
+
+                history.append({'version': version, 'datetime': datetime.now().isoformat(),
+                                'median': median(times)})
+
+                imports[name] = {
+                    'datetime': datetime.now().isoformat(),
+                    'version': version,
+                    'params': params,
+                    'times': times,
+                    'history': history
+                }
+
+                if not args.dry_run:
+                    with open(BENCHMARK_JSON, 'w') as f:
+                        json.dump(saved_results, f, indent=4)
+
+
+def show_import_benchmark(args, results):
+    from tabulate import tabulate
+
+    imports = results.get(IMPORTS_CASE, dict())
+
+    def get_stats():
+        for mode in MODES:
+            for cache in CACHES:
+                name = f"{mode}-{cache}"
+                if name not in imports: continue
+
+                r = imports[name]
+                base = imports.get(f"none-{cache}")
+                oh = round(overhead(median(r['times']), median(base['times'])), 1) \
+                     if base and mode != 'none' else None
+
+                prev = next((h for h in reversed(r.get('history', [])) if h['version'] != r['version']), None)
+                change = round((median(r['times'])/prev['median']-1)*100, 1) if prev else None
+
+                yield [mode, cache, len(r['times']), round(median(r['times']), 3), oh,
+                       r['version'], prev['version'] if prev else None, change]
+
+    print("")
+    print(tabulate(get_stats(), headers=["mode", "cache", "samples", "median", "overhead %",
+                                         "version", "vs. version", "change %"]))
+    print("")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    saved_results, results = load_results(args)
+
+    if args.cmd == 'run':
+        run_import_benchmark(args, saved_results, results)
+
+    elif args.cmd == 'show':
+        show_import_benchmark(args, results)
@@ -0,0 +1,295 @@
+"""Microbenchmarks for SlipCover's internals, isolating the cost of instrumentation,
+de-instrumentation and reporting from that of running whole programs (see benchmarks.py).
+
+Results are saved to benchmarks.json, under the "micro" case of this system's entry;
+each result keeps a history of medians by version (git commit), so that they can be
+compared across commits.
+"""
+import json
+import sys
+import time
+import types
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+
+from benchmarks import BENCHMARK_JSON, load_results
+
+import slipcover.slipcover as sc
+import slipcover.branch as br
+if sys.version_info[0:2] < (3,12):
+    import slipcover.bytecode as bc
+
+MICRO_CASE = 'micro'
+MICRO_BENCHMARKS = dict()
+
+
+def microbenchmark(name, available=True):
+    """Registers a microbenchmark: a function that, given a scale factor, returns the time
+       (in seconds) taken by the operation measured."""
+    def decorator(func):
+        if available:
+            MICRO_BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def synthetic_source(functions: int, lines: int) -> str:
+    """Generates the source for a module with the given number of functions,
+       each with about the given number of lines and half as many branches."""
+    src = []
+    for f in range(functions):
+        src.append(f"def f{f}(x):")
+        src.append("    y = 0")
+        for i in range(lines//2):
+            src.append(f"    if x > {i}:")
+            src.append(f"        y += {i}")
+        src.append("    return y")
+        src.append("")
+    return "\n".join(src)
+
+
+def synthetic_coverage(files: int, lines: int, offset: int = 0, branch: bool = False) -> dict:
+    """Generates coverage results for the given number of files and lines each, with
+       every other line executed."""
+    def file_cov():
+        executed = list(range(1+offset, lines+1, 2))
+        missing = list(range(2-offset, lines+1, 2))
+        f_cov = {'executed_lines': executed, 'missing_lines': missing}
+        if branch:
+            f_cov['executed_branches'] = [[l, l+1] for l in executed]
+            f_cov['missing_branches'] = [[l, l+1] for l in missing]
+        return f_cov
+
+    cov = {
+        'meta': sc.Slipcover._make_meta(branch),
+        'files': {f"src/module_{f}.py": file_cov() for f in range(files)}
+    }
+    sc.add_summaries(cov)
+    return cov
+
+
+def compile_synthetic(scale: float, branch: bool, name: str = "synthetic.py") -> types.CodeType:
+    import ast
+    t = ast.parse(synthetic_source(int(200*scale), 50))
+    if branch:
+        t = br.preinstrument(t)
+    return compile(t, name, "exec")
+
+
+def timed(func, *args, **kwargs) -> float:
+    begin = time.perf_counter_ns()
+    func(*args, **kwargs)
+    return (time.perf_counter_ns() - begin)/1e9
+
+
+def run_synthetic(sci, scale: float, branch: bool, modules: int = 1) -> None:
+    """Instruments, registers and runs synthetic modules, leaving their lines "newly seen"."""
+    for m in range(modules):
+        mod = types.ModuleType(f"synthetic_{m}")
+        code = sci.instrument(compile_synthetic(scale, branch, f"synthetic_{m}.py"))
+        sci.register_module(mod)
+        exec(code, mod.__dict__)
+        for name, f in list(mod.__dict__.items()):
+            if name.startswith('f'):
+                f(10)
+
+
+@microbenchmark('instrument')
+def bench_instrument(scale):
+    code = compile_synthetic(scale, branch=False)
+    return timed(sc.Slipcover().instrument, code)
+
+
+@microbenchmark('instrument-branch')
+def bench_instrument_branch(scale):
+    code = compile_synthetic(scale, branch=True)
+    return timed(sc.Slipcover(branch=True).instrument, code)
+
+
+@microbenchmark('preinstrument')
+def bench_preinstrument(scale):
+    import ast
+    t = ast.parse(synthetic_source(int(200*scale), 50))
+    return timed(br.preinstrument, t)
+
+
+@microbenchmark('editor', available=sys.version_info[0:2] < (3,12))
+def bench_editor(scale):
+    # one large code object, with a call inserted at every line
+    co = compile(synthetic_source(1, int(5000*scale)), "editor.py", "exec")
+    co = next(c for c in co.co_consts if isinstance(c, types.CodeType))
+
+    def edit():
+        ed = bc.Editor(co)
+        func_index = ed.add_const(print)
+        arg_index = ed.add_const(None)
+        delta = 0
+        for off, _ in sc.findlinestarts(co):
+            delta += ed.insert_function_call(off+delta, func_index, (arg_index,))
+        ed.finish()
+
+    return timed(edit)
+
+
+@microbenchmark('deinstrument_seen', available=sys.version_info[0:2] < (3,12))
+def bench_deinstrument_seen(scale):
+    sci = sc.Slipcover(d_miss_threshold=-1)    # so that it doesn't de-instrument during setup
+    run_synthetic(sci, scale, branch=False, modules=10)
+    return timed(sci.deinstrument_seen)
+
+
+def probe_loop(sci) -> types.FunctionType:
+    """Returns an instrumented function with a tight loop, for measuring the cost of probes."""
+    def loop(n):
+        x = 0
+        for i in range(n):
+            x += i
+        return x
+
+    sci.instrument(loop)
+    return loop
+
+
+@microbenchmark('probe-hit', available=sys.version_info[0:2] < (3,12))
+def bench_probe_hit(scale):
+    # probes called every time, as they're never de-instrumented
+    loop = probe_loop(sc.Slipcover(d_miss_threshold=-1))
+    return timed(loop, int(1_000_000*scale))
+
+
+@microbenchmark('probe-disabled', available=sys.version_info[0:2] < (3,12))
+def bench_probe_disabled(scale):
+    # probes jumped over, as they're disabled upon their first execution
+    loop = probe_loop(sc.Slipcover(immediate=True))
+    loop(1)
+    return timed(loop, int(1_000_000*scale))
+
+
+@microbenchmark('get_coverage')
+def bench_get_coverage(scale):
+    sci = sc.Slipcover(branch=True, d_miss_threshold=-1)
+    run_synthetic(sci, scale, branch=True, modules=5)
+    return timed(sci.get_coverage)
+
+
+@microbenchmark('merge_coverage')
+def bench_merge_coverage(scale):
+    a = synthetic_coverage(int(1000*scale), 500, branch=True)
+    b = synthetic_coverage(int(1000*scale), 500, offset=1, branch=True)
+    return timed(sc.merge_coverage, a, b)
+
+
+@microbenchmark('print_coverage')
+def bench_print_coverage(scale):
+    import io
+    cov = synthetic_coverage(int(1000*scale), 500, branch=True)
+    return timed(sc.print_coverage, cov, outfile=io.StringIO(), missing_width=80)
+
+
+@microbenchmark('json_dumps')
+def bench_json_dumps(scale):
+    cov = synthetic_coverage(int(1000*scale), 500, branch=True)
+    return timed(json.dumps, cov)
+
+
+def parse_args():
+    import argparse
+    ap = argparse.ArgumentParser()
+
+    sp = ap.add_subparsers(dest='cmd', required=True)
+    run = sp.add_parser('run', help='run microbenchmarks')
+    show = sp.add_parser('show', help='show microbenchmark results')
+
+    for p in [run, show]:
+        p.add_argument('--bench', choices=list(MICRO_BENCHMARKS),
+                       action='extend', nargs='+', help='select microbenchmark(s) to run/show')
+
+    run.add_argument('--tries', type=int, default=10, help='number of times to run each microbenchmark')
+    run.add_argument('--scale', type=float, default=1.0, help='scale the size of the microbenchmarks\' inputs')
+    run.add_argument('--dry-run', action='store_true', help="don't save results")
+
+    show.add_argument('--os', type=str, help='select OS name')
+    show.add_argument('--python', type=str, help='select python version')
+
+    args = ap.parse_args()
+
+    if not args.bench:
+        args.bench = list(MICRO_BENCHMARKS)
+
+    return args
+
+
+def git_head() -> str:
+    import subprocess
+    return subprocess.run("git rev-parse --short HEAD", shell=True, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def run_microbenchmarks(args, saved_results, results):
+    micro = results.setdefault(MICRO_CASE, dict())
+    version = git_head()
+
+    for name in args.bench:
+        func = MICRO_BENCHMARKS[name]
+        func(args.scale)    # warm up
+
+        times = [func(args.scale) for _ in range(args.tries)]
+        print(f"{name:20} median: {median(times)*1000:10.2f} ms")
+
+        prev = micro.get(name, dict())
+        history = prev.get('history', [])
+        if prev.get('scale') != args.scale:
+            history = []    # not comparable
+
+        history.append({'version': version, 'datetime': datetime.now().isoformat(), 'median': median(times)})
+
+        micro[name] = {
+            'datetime': datetime.now().isoformat(),
+            'version': version,
+            'scale': args.scale,
+            'times': times,
+            'history': history
+        }
+
+        if not args.dry_run:
+            # save after each benchmark, in case we abort running others
+            with open(BENCHMARK_JSON, 'w') as f:
+                json.dump(saved_results, f, indent=4)
+
+
+def show_microbenchmarks(args, results):
+    from tabulate import tabulate
+    from statistics import mean, stdev
+
+    micro = results.get(MICRO_CASE, dict())
+
+    def get_stats():
+        for name in args.bench:
+            if name not in micro: continue
+
+            r = micro[name]
+            history = r.get('history', [])
+            # compare against the latest result from a different version
+            prev = next((h for h in reversed(history) if h['version'] != r['version']), None)
+            change = round((median(r['times'])/prev['median']-1)*100, 1) if prev else None
+
+            yield [name, len(r['times']), round(median(r['times'])*1000, 2), round(mean(r['times'])*1000, 2),
+                   round(stdev(r['times'])*1000, 2) if len(r['times']) > 1 else None,
+                   r['version'], prev['version'] if prev else None, change]
+
+    print("")
+    print(tabulate(get_stats(), headers=["bench", "samples", "median ms", "mean ms", "stdev ms",
+                                         "version", "vs. version", "change %"]))
+    print("")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    saved_results, results = load_results(args)
+
+    if args.cmd == 'run':
+        run_microbenchmarks(args, saved_results, results)
+
+    elif args.cmd == 'show':
+        show_microbenchmarks(args, results)
@@ -60,7 +60,9 @@ def load_data():
         raise RuntimeException(f"Results sets mixes data from different systems: {systems}")
 
     # Python version -> results
-    v2r = {e['system']['python']: e['results'] for e in entries}
+    # skip results from microbenchmarks.py and import_benchmark.py, which aren't comparable with these
+    case_names = set(c.name for c in cases)
+    v2r = {e['system']['python']: {c: r for c, r in e['results'].items() if c in case_names} for e in entries}
 
     for v in args.skip_version:
         del v2r[v]
@@ -0,0 +1,53 @@
+"""Runs a Python script or module (as in "python [-m] ...") under tracemalloc, writing to a JSON
+file the peak traced memory and the memory allocated by SlipCover that is still in use at exit.
+
+Usage: python tracemalloc_run.py OUT_JSON (-m MODULE | SCRIPT) [ARGS...]
+"""
+import atexit
+import json
+import runpy
+import sys
+import tracemalloc
+from pathlib import Path
+
+
+def main():
+    out = Path(sys.argv[1])
+    args = sys.argv[2:]
+
+    tracemalloc.start()
+
+    # locate SlipCover without importing it, so as not to allocate anything for cases without it
+    import importlib.util
+    slipcover_dir = str(Path(importlib.util.find_spec('slipcover').origin).parent)
+
+    # registered before running the command, so that it runs after any of its atexit handlers
+    @atexit.register
+    def write_stats():
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        sc_stats = snapshot.filter_traces([tracemalloc.Filter(True, slipcover_dir + "/*")]) \
+                           .statistics('filename')
+
+        with out.open("w") as f:
+            json.dump({
+                'peak': peak,
+                'slipcover_current': sum(s.size for s in sc_stats),
+                'slipcover_blocks': sum(s.count for s in sc_stats),
+            }, f)
+
+    # replace this script's directory on sys.path, as "python [-m] ..." would
+    if args[0] == '-m':
+        sys.argv = [args[1], *args[2:]]
+        sys.path[0] = str(Path.cwd())
+        runpy.run_module(args[1], run_name='__main__', alter_sys=True)
+    else:
+        sys.argv = args
+        sys.path[0] = str(Path(args[0]).resolve().parent)
+        runpy.run_path(args[0], run_name='__main__')
+
+
+if __name__ == "__main__":
+    main()
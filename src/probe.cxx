@@ -7,6 +7,9 @@
 #endif
 
 
+static const char* THRESHOLD_CAPSULE = "slipcover.threshold";
+
+
 /**
  * Tracks code coverage.
  */
@@ -16,17 +19,47 @@ class Probe {
     PyPtr<> _lineno_or_branch;
     bool _signalled;
     bool _removed;
-    int _d_miss_count;
-    int _d_miss_threshold;
+    bool _sweep_requested;
+    long _d_miss_count;
+    // The D miss threshold is either the probe's own or, so that changes to it reach
+    // existing probes, one shared through a capsule created by new_threshold()
+    long _own_threshold;
+    PyPtr<> _shared_threshold;
+    long* _d_miss_threshold;
+    // When recording coverage contexts, the get() of the ContextVar giving the context and
+    // its value when last reported, so that repeated hits within a context needn't call
+    // into Python code
+    PyPtr<> _context_get;
+    PyPtr<> _last_context;
+    bool _context_reported;
     std::byte* _code;
 
 public:
-    Probe(PyObject* sci, PyObject* filename, PyObject* lineno_or_branch, PyObject* d_miss_threshold):
+    Probe(PyObject* sci, PyObject* filename, PyObject* lineno_or_branch, PyObject* d_miss_threshold,
+          PyObject* context_var):
         _sci(PyPtr<>::borrowed(sci)), _filename(PyPtr<>::borrowed(filename)),
         _lineno_or_branch(PyPtr<>::borrowed(lineno_or_branch)),
-        _signalled(false), _removed(false),
-        _d_miss_count(-1),
-        _d_miss_threshold(PyLong_AsLong(d_miss_threshold)), _code(nullptr) {}
+        _signalled(false), _removed(false), _sweep_requested(false),
+        _d_miss_count(-1), _own_threshold(0), _shared_threshold(nullptr),
+        _d_miss_threshold(&_own_threshold),
+        _context_get(nullptr), _last_context(nullptr), _context_reported(false),
+        _code(nullptr) {
+
+        if (context_var != nullptr && context_var != Py_None) {
+            _context_get = PyObject_GetAttrString(context_var, "get");
+            if (_context_get == nullptr) {
+                PyErr_Clear();
+            }
+        }
+
+        if (PyCapsule_IsValid(d_miss_threshold, THRESHOLD_CAPSULE)) {
+            _shared_threshold = PyPtr<>::borrowed(d_miss_threshold);
+            _d_miss_threshold = static_cast<long*>(PyCapsule_GetPointer(d_miss_threshold, THRESHOLD_CAPSULE));
+        }
+        else {
+            _own_threshold = PyLong_AsLong(d_miss_threshold);
+        }
+    }
 
 
     static PyObject*
@@ -38,11 +71,35 @@ public:
     }
 
 
+    bool new_context() {
+        // Returns whether the context changed since last reported; without a ContextVar
+        // (or a value for it) we can't tell, so every hit is reported.
+        if (_context_get == nullptr) {
+            return true;
+        }
+
+        PyPtr<> context = PyObject_CallNoArgs(_context_get);
+        if (context == nullptr) {   // LookupError, without a value
+            PyErr_Clear();
+            return true;
+        }
+
+        if (_context_reported && (PyObject*)context == (PyObject*)_last_context) {
+            return false;
+        }
+
+        _last_context = context;
+        _context_reported = true;
+        return true;
+    }
+
+
     PyObject* signal() {
         // _d_miss_threshold == -1 means de-instrument (disable) this block,
         //      but don't de-instrument Python;
-        // _d_miss_threshold == -2 means don't de-instrument either
-        if (!_signalled || (_code == nullptr && _d_miss_threshold < -1)) {
+        // _d_miss_threshold == -2 means don't de-instrument either, reporting each hit
+        //      in a context other than the last reported (for coverage contexts)
+        if (!_signalled || (_code == nullptr && *_d_miss_threshold < -1 && new_context())) {
             _signalled = true;
 
             PyPtr<> newly_seen = PyObject_GetAttrString(_sci, "newly_seen");
@@ -73,12 +130,29 @@ public:
             }
             else
 #endif
-            if (_d_miss_count == _d_miss_threshold) {
+            // A shared threshold may be lowered below the D misses already counted
+            if (!_sweep_requested && *_d_miss_threshold >= 0 && _d_miss_count >= *_d_miss_threshold) {
                 // Limit D misses by deinstrumenting once we see several for a line
                 // Any other lines getting D misses get deinstrumented at the same time,
                 // so this needn't be a large threshold.
-                PyPtr<> deinstrument_seen = PyUnicode_FromString("deinstrument_seen");
-                PyPtr<> result = PyObject_CallMethodObjArgs(_sci, deinstrument_seen, NULL);
+                PyPtr<> threshold_reached = PyUnicode_FromString("d_miss_threshold_reached");
+                PyPtr<> d_misses = PyLong_FromLong(_d_miss_count);
+                PyPtr<> result = PyObject_CallMethodObjArgs(_sci, threshold_reached, (PyObject*)d_misses, NULL);
+                _d_miss_count = 0;
+
+                if (result && PyLong_Check(result)) {
+                    // De-instrumentation was deferred; a shared threshold is updated by
+                    // Slipcover itself, but our own takes the new threshold to wait for
+                    if (_shared_threshold == nullptr) {
+                        _own_threshold = PyLong_AsLong(result);
+                    }
+                }
+                else {
+                    // As before shared thresholds, ask only once: a probe still in place after
+                    // a sweep (as when get_coverage() collected its line first) would otherwise
+                    // bring about a sweep every few hits
+                    _sweep_requested = true;
+                }
             }
         }
         else {
@@ -101,13 +175,33 @@ public:
         Py_RETURN_FALSE;
     }
 
-    PyObject* set_immediate(PyObject* code_bytes, PyObject* offset) {
+    PyObject* set_immediate(PyObject* code, PyObject* offset) {
 #ifdef PYPY_VERSION
         PyErr_SetString(PyExc_Exception, "Error: set_immediate does not work with PyPy");
         return NULL;
 #endif
 
-        _code = reinterpret_cast<std::byte*>(PyBytes_AsString(code_bytes));
+        if (PyBytes_Check(code)) {
+            // up to 3.10, the interpreter executes co_code's bytes
+            _code = reinterpret_cast<std::byte*>(PyBytes_AsString(code));
+        }
+        else {
+            // 3.11+ executes an (adaptive) copy kept at the end of the code object,
+            // the variable-size part of its type; co_code only returns a copy of it.
+            PyPtr<> basicsize = PyObject_GetAttrString((PyObject*)Py_TYPE(code), "__basicsize__");
+            PyPtr<> itemsize = PyObject_GetAttrString((PyObject*)Py_TYPE(code), "__itemsize__");
+            if (!basicsize || !itemsize) {
+                return NULL;
+            }
+
+            if (PyLong_AsLong(itemsize) != 2) { // sizeof(_Py_CODEUNIT)
+                PyErr_SetString(PyExc_Exception, "Error: unexpected code object layout");
+                return NULL;
+            }
+
+            _code = reinterpret_cast<std::byte*>(code) + PyLong_AsLong(basicsize);
+        }
+
         if (_code == nullptr) {
             return NULL;
         }
@@ -125,7 +219,48 @@ probe_new(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
         return NULL;
     }
 
-    return Probe::newCapsule(new Probe(args[0], args[1], args[2], args[3]));
+    return Probe::newCapsule(new Probe(args[0], args[1], args[2], args[3], nargs > 4 ? args[4] : nullptr));
+}
+
+
+PyObject*
+probe_new_threshold(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    if (nargs < 1) {
+        PyErr_SetString(PyExc_Exception, "Missing argument");
+        return NULL;
+    }
+
+    long threshold = PyLong_AsLong(args[0]);
+    if (threshold == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    return PyCapsule_New(new long(threshold), THRESHOLD_CAPSULE,
+                         [](PyObject* cap) {
+                             delete (long*)PyCapsule_GetPointer(cap, THRESHOLD_CAPSULE);
+                         });
+}
+
+
+PyObject*
+probe_set_threshold(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    if (nargs < 2) {
+        PyErr_SetString(PyExc_Exception, "Missing argument(s)");
+        return NULL;
+    }
+
+    long* threshold = static_cast<long*>(PyCapsule_GetPointer(args[0], THRESHOLD_CAPSULE));
+    if (threshold == nullptr) {
+        return NULL;
+    }
+
+    long value = PyLong_AsLong(args[1]);
+    if (value == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    *threshold = value;
+    Py_RETURN_NONE;
 }
 
 
@@ -155,12 +290,57 @@ METHOD_WRAPPER(mark_removed);
 METHOD_WRAPPER(was_removed);
 
 
+/**
+ * Signals a probe bound as 'self', so that the bytecode inserted needs only
+ * load and call it, without any arguments.
+ */
+static PyObject*
+probe_bound_signal(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    return static_cast<Probe*>(PyCapsule_GetPointer(self, NULL))->signal();
+}
+
+// METH_FASTCALL allows CPython 3.11+ to specialize calls to it
+static PyMethodDef bound_signal_def = {
+    "signal", (PyCFunction)probe_bound_signal, METH_FASTCALL, "signals this probe's line or branch was reached"
+};
+
+
+PyObject*
+probe_bind(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    if (nargs < 1) {
+        PyErr_SetString(PyExc_Exception, "Missing argument");
+        return NULL;
+    }
+
+    return PyCFunction_New(&bound_signal_def, args[0]);
+}
+
+
+PyObject*
+probe_is_bound(PyObject* self, PyObject* const* args, Py_ssize_t nargs) {
+    if (nargs < 1) {
+        PyErr_SetString(PyExc_Exception, "Missing argument");
+        return NULL;
+    }
+
+    if (PyCFunction_Check(args[0]) &&
+        PyCFunction_GetFunction(args[0]) == (PyCFunction)probe_bound_signal) {
+        Py_RETURN_TRUE;
+    }
+    Py_RETURN_FALSE;
+}
+
+
 static PyMethodDef methods[] = {
     {"new", (PyCFunction)probe_new, METH_FASTCALL, "creates a new probe"},
+    {"new_threshold", (PyCFunction)probe_new_threshold, METH_FASTCALL, "creates a D miss threshold shared by probes"},
+    {"set_threshold", (PyCFunction)probe_set_threshold, METH_FASTCALL, "sets a shared D miss threshold"},
     {"set_immediate", (PyCFunction)probe_set_immediate, METH_FASTCALL, "sets up for immediate removal"},
     {"signal", (PyCFunction)probe_signal, METH_FASTCALL, "signals this probe's line or branch was reached"},
     {"mark_removed", (PyCFunction)probe_mark_removed, METH_FASTCALL, "marks a probe removed (de-instrumented)"},
     {"was_removed", (PyCFunction)probe_was_removed, METH_FASTCALL, "returns whether probe was removed"},
+    {"bind", (PyCFunction)probe_bind, METH_FASTCALL, "returns a callable signaling the probe"},
+    {"is_bound", (PyCFunction)probe_is_bound, METH_FASTCALL, "returns whether an object is a bound probe"},
     {NULL, NULL, 0, NULL}
 };
 
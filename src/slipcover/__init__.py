@@ -1,4 +1,6 @@
 from .version import __version__
-from .slipcover import Slipcover, merge_coverage, print_coverage
-from .importer import FileMatcher, ImportManager, wrap_pytest
+from .slipcover import Slipcover, SlipcoverError, merge_coverage, merge_coverage_files, print_coverage
+from .policy import DeinstrumentPolicy, FixedThreshold, AdaptiveThreshold
+from .contexts import coverage_context, ASGIContextMiddleware
+from .importer import FileMatcher, DiffMatcher, ImportManager, wrap_pytest
 from .fuzz import wrap_function
@@ -3,8 +3,11 @@ from pathlib import Path
 from typing import Any, Dict
 import slipcover as sc
 import slipcover.branch as br
+from slipcover.contexts import current_context
+from slipcover.formats import read_json, write_json, open_read, open_write, compression_for, check_compression
 import ast
 import atexit
+import contextlib
 import platform
 import functools
 import os
@@ -27,7 +30,7 @@ def fork_shim(sci):
     def wrapper(*pargs, **kwargs):
         global input_tmpfiles, output_tmpfile
 
-        tmp_file = tempfile.NamedTemporaryFile(mode="r+", encoding="utf-8", delete=False)
+        tmp_file = tempfile.NamedTemporaryFile(mode="w+b", delete=False)
 
         if (pid := original_fork(*pargs, **kwargs)):
             input_tmpfiles.append(tmp_file)
@@ -55,8 +58,9 @@ def get_coverage(sci):
                 # If the file is empty, it was likely closed, possibly upon exec
                 if f.tell() != 0:
                     f.seek(0)
-                    sc.merge_coverage(cov, json.load(f))
-            except json.JSONDecodeError as e:
+                    with open_read(f) as text:
+                        sc.merge_coverage_files(cov, *read_json(text))
+            except (json.JSONDecodeError, EOFError, OSError) as e:
                 warnings.warn(f"Error reading {fname}: {e}")
             finally:
                 f.close()
@@ -68,9 +72,9 @@ def get_coverage(sci):
     return cov
 
 
-def exit_shim(sci):
+def exit_shim(sci, compression=None):
     """Shims os._exit(), so a previously forked child process writes its coverage to
-       a temporary file read by the parent.
+       a temporary file read by the parent, compressed as given.
     """
     original_exit = os._exit
 
@@ -78,38 +82,176 @@ def exit_shim(sci):
     def wrapper(*pargs, **kwargs):
         global output_tmpfile
 
-        if output_tmpfile:
-            json.dump(get_coverage(sci), output_tmpfile)
-            output_tmpfile.flush()
+        try:
+            if output_tmpfile:
+                cov = get_coverage(sci)
+                with open_write(output_tmpfile, compression) as f:
+                    write_json(cov['meta'], cov['files'].items(), f)
+        finally:
+            original_exit(*pargs, **kwargs)
 
+    return wrapper
+
+
+def daemon_exit_shim(client):
+    """Shims os._exit(), so that a process (such as a forked child) sending its coverage
+       to a coverage server sends what remains before exiting.
+    """
+    original_exit = os._exit
+
+    @functools.wraps(original_exit)
+    def wrapper(*pargs, **kwargs):
+        client.close()
         original_exit(*pargs, **kwargs)
 
     return wrapper
 
 
+@contextlib.contextmanager
+def read_coverage_file(path: Path, runs=None):
+    """Reads coverage from a JSON file or, merging the given range of runs, a coverage database,
+       providing its 'meta' entry and its (file name, coverage) pairs; JSON files are read
+       incrementally, and so must be consumed within this context.
+    """
+    from slipcover.database import CoverageDatabase, is_database
+
+    if is_database(path):
+        with CoverageDatabase(path) as db:
+            cov = db.get_coverage(*(runs or (None, None)))
+            yield cov['meta'], cov['files'].items()
+        return
+
+    with open_read(path) as jf:
+        yield read_json(jf, expand_ranges=False)
+
+
 def merge_files(args):
     """Merges coverage files."""
 
+    merged = None
+    for i, f in enumerate(args.merge):
+        try:
+            with read_coverage_file(f, args.runs) as (meta, files):
+                if merged is None:
+                    merged = {'meta': meta, 'files': {}}
+                sc.merge_coverage_files(merged, meta, files)
+        except Exception as e:
+            warnings.warn(f"Error merging in {f}: {e}" if i else f"Error reading in {f}: {e}")
+            return 1
+
     try:
-        with args.merge[0].open() as jf:
-            merged = json.load(jf)
+        with open_write(args.out) as jf:
+            write_json(merged['meta'], merged['files'].items(), jf, line_ranges=args.line_ranges)
     except Exception as e:
-        warnings.warn(f"Error reading in {args.merge[0]}: {e}")
+        warnings.warn(e)
         return 1
 
+    return 0
+
+
+def run_range(value: str):
+    """Parses a FIRST:LAST range of runs, where either end may be omitted."""
+    import argparse
+    first, sep, last = value.partition(':')
     try:
-        for f in args.merge[1:]:
-            with f.open() as jf:
-                sc.merge_coverage(merged, json.load(jf))
-    except Exception as e:
-        warnings.warn(f"Error merging in {f}: {e}")
+        first_run = int(first) if first else None
+        last_run = (int(last) if last else None) if sep else first_run
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid range of runs: {value}")
+    return (first_run, last_run)
+
+
+def write_reports(args, files) -> None:
+    """Writes any LCOV and Cobertura XML reports requested; 'files' is a callable
+       returning a new iterable of (file name, coverage) pairs each time.
+    """
+    from slipcover.formats import write_lcov, write_cobertura
+
+    if args.lcov:
+        with open_write(args.lcov) as f:
+            write_lcov(files(), f)
+
+    if args.xml:
+        with open_write(args.xml) as f:
+            write_cobertura(files, f)
+
+
+def write_output(args, meta, files, coverage=None, source_cache=None) -> None:
+    """Writes the JSON or text report, as well as any HTML report or database run requested;
+       'coverage' holds the complete results, needed unless only streaming JSON output.
+       Source for the HTML report is read through 'source_cache', if given.
+    """
+    def printit(outfile):
+        if args.json:
+            write_json(meta, files, outfile, indent=(4 if args.pretty_print else None),
+                       line_ranges=args.line_ranges)
+            print(file=outfile)
+        else:
+            sc.print_coverage(coverage, outfile=outfile, skip_covered=args.skip_covered,
+                              missing_width=args.missing_width, jobs=None)
+
+    if args.out:
+        with open_write(args.out) as outfile:
+            printit(outfile)
+    else:
+        printit(sys.stdout)
+
+    if args.html:
+        from slipcover.html_report import write_html
+        write_html(coverage, args.html, source_cache=source_cache)
+
+    if args.db:
+        from slipcover.database import CoverageDatabase
+        with CoverageDatabase(args.db) as db:
+            db.add_run(coverage['meta'], coverage['files'].items())
+
+
+def serve(args):
+    """Runs a coverage server, collecting coverage from processes run with --daemon
+       until terminated (or asked to shut down), then reporting on it.
+    """
+    import signal
+    from slipcover.daemon import CoverageServer
+
+    try:
+        server = CoverageServer(args.serve)
+    except (sc.SlipcoverError, OSError) as e:
+        warnings.warn(f"Unable to serve on {args.serve}: {e}")
         return 1
 
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        # give clients still connected a chance to finish sending
+        server.wait_for_clients(timeout=5)
+
+    coverage = server.get_coverage()
+    if not args.silent:
+        write_reports(args, lambda: coverage['files'].items())
+        write_output(args, coverage['meta'], coverage['files'].items(), coverage)
+
+    if args.fail_under and coverage['summary']['percent_covered'] < args.fail_under:
+        return 2
+
+    return 0
+
+
+def convert_file(args):
+    """Converts a JSON coverage file, reading it incrementally."""
+    from slipcover.formats import json_file_coverage
+
     try:
-        with args.out.open("w", encoding='utf-8') as jf:
-            json.dump(merged, jf)
+        write_reports(args, json_file_coverage(args.convert))
     except Exception as e:
-        warnings.warn(e)
+        warnings.warn(f"Error converting {args.convert}: {e}")
         return 1
 
     return 0
@@ -130,15 +272,36 @@ def main():
     ap.add_argument('--branch', action='store_true', help="measure both branch and line coverage")
     ap.add_argument('--json', action='store_true', help="select JSON output")
     ap.add_argument('--pretty-print', action='store_true', help="pretty-print JSON output")
-    ap.add_argument('--out', type=Path, help="specify output file name")
+    ap.add_argument('--line-ranges', action='store_true', help="write lines in JSON output as [first, last] ranges")
+    ap.add_argument('--out', type=Path, help="specify output file name; a .gz, .bz2, .xz or .zst suffix compresses it")
+    ap.add_argument('--html', type=Path, metavar="DIR",
+                    help="also write an HTML report to DIR, regenerating only pages whose inputs changed")
+    ap.add_argument('--lcov', type=Path, metavar="FILE", help="also write an LCOV tracefile to FILE")
+    ap.add_argument('--xml', type=Path, metavar="FILE", help="also write a Cobertura XML report to FILE")
+    ap.add_argument('--db', type=Path, metavar="FILE", help="also record this run's coverage in the SQLite database FILE")
+    ap.add_argument('--runs', type=run_range, metavar="FIRST:LAST",
+                    help="range of runs to read from coverage databases given to --merge")
+    ap.add_argument('--daemon', type=Path, metavar="SOCKET",
+                    help="send coverage to the coverage server (see --serve) at SOCKET, rather than reporting it")
     ap.add_argument('--source', help="specify directories to cover")
     ap.add_argument('--omit', help="specify file(s) to omit")
     ap.add_argument('--immediate', action='store_true',
                     help=(argparse.SUPPRESS if platform.python_implementation() == "PyPy" else "request immediate de-instrumentation"))
     ap.add_argument('--skip-covered', action='store_true', help="omit fully covered files (from text, non-JSON output)")
     ap.add_argument('--fail-under', type=float, default=0, help="fail execution with RC 2 if the overall coverage lays lower than this")
+    ap.add_argument('--diff-base', metavar="REV",
+                    help="only measure lines changed relative to the given git revision (diff coverage)")
+    ap.add_argument('--diff-file', type=Path, metavar="PATCH",
+                    help="only measure lines changed according to the given unified diff (diff coverage)")
     ap.add_argument('--threshold', type=int, default=50, metavar="T",
                     help="threshold for de-instrumentation (if not immediate)")
+    ap.add_argument('--adaptive-threshold', action='store_true',
+                    help="adapt the de-instrumentation threshold, starting from --threshold, to limit its overhead")
+    ap.add_argument('--background-deinstrument', action='store_true',
+                    help="de-instrument on a separate thread, rather than on the thread that triggers it")
+    ap.add_argument('--contexts', action='store_true',
+                    help="record coverage per context, as set with slipcover.coverage_context (JSON output only)")
+    ap.add_argument('--stats', action='store_true', help="print statistics about SlipCover's operation to stderr")
     ap.add_argument('--missing-width', type=int, default=80, metavar="WIDTH", help="maximum width for `missing' column")
 
     # intended for slipcover development only
@@ -151,7 +314,10 @@ def main():
 
     g = ap.add_mutually_exclusive_group(required=True)
     g.add_argument('-m', dest='module', nargs=1, help="run given module as __main__")
-    g.add_argument('--merge', nargs='+', type=Path, help="merge JSON coverage files, saving to --out")
+    g.add_argument('--merge', nargs='+', type=Path, help="merge JSON coverage files and/or databases, saving to --out")
+    g.add_argument('--convert', type=Path, metavar="JSON", help="convert a JSON coverage file to --lcov and/or --xml")
+    g.add_argument('--serve', type=Path, metavar="SOCKET",
+                   help="collect coverage from processes run with --daemon SOCKET, reporting on it once terminated")
     g.add_argument('script', nargs='?', type=Path, help="the script to run")
     ap.add_argument('script_or_module_args', nargs=argparse.REMAINDER)
 
@@ -162,11 +328,26 @@ def main():
     else:
         args = ap.parse_args(sys.argv[1:])
 
+    # rather than failing only once done
+    for path in (args.out, args.lcov, args.xml):
+        if path:
+            try:
+                check_compression(path)
+            except sc.SlipcoverError as e:
+                ap.error(str(e))
 
     if args.merge:
         if not args.out: ap.error("--out is required with --merge")
         return merge_files(args)
 
+    if args.convert:
+        if not (args.lcov or args.xml): ap.error("--lcov and/or --xml are required with --convert")
+        return convert_file(args)
+
+    if args.serve:
+        if platform.system() == 'Windows': ap.error("--serve requires Unix domain sockets")
+        return serve(args)
+
 
     base_path = Path(args.script).resolve().parent if args.script \
                 else Path('.').resolve()
@@ -185,37 +366,80 @@ def main():
         for o in args.omit.split(','):
             file_matcher.addOmit(o)
 
+    only_lines = None
+    if args.diff_base or args.diff_file:
+        if args.diff_base and args.diff_file: ap.error("--diff-base and --diff-file are mutually exclusive")
+
+        from slipcover.diff import git_changed_lines, patch_changed_lines
+        try:
+            only_lines = git_changed_lines(args.diff_base) if args.diff_base \
+                         else patch_changed_lines(args.diff_file)
+        except sc.SlipcoverError as e:
+            ap.error(str(e))
+
+        file_matcher = sc.DiffMatcher(only_lines, file_matcher)
+
+
+    policy = None
+    if args.adaptive_threshold and args.threshold >= 0:
+        policy = sc.AdaptiveThreshold(initial=max(1, args.threshold))
 
     sci = sc.Slipcover(immediate=args.immediate,
                        d_miss_threshold=args.threshold, branch=args.branch,
-                       disassemble=args.dis, source=args.source)
+                       disassemble=args.dis, source=args.source,
+                       deinstrument_policy=policy,
+                       background_deinstrument=args.background_deinstrument,
+                       context_var=(current_context if args.contexts else None),
+                       only_lines=only_lines)
 
 
     if not args.dont_wrap_pytest:
         sc.wrap_pytest(sci, file_matcher)
 
 
-    if platform.system() != 'Windows':
+    client = None
+    if args.daemon:
+        if args.contexts: ap.error("--contexts is not supported with --daemon")
+
+        from slipcover.daemon import DaemonClient
+        try:
+            client = DaemonClient(sci, args.daemon)
+        except OSError as e:
+            ap.error(f"unable to connect to {args.daemon}: {e}")
+
+        # forked children connect on their own
+        os._exit = daemon_exit_shim(client)
+
+    elif platform.system() != 'Windows':
         os.fork = fork_shim(sci)
-        os._exit = exit_shim(sci)
+        # forked children's results are compressed like the output
+        os._exit = exit_shim(sci, compression_for(args.out) if args.out else None)
 
     def sci_atexit():
         global output_tmpfile
 
-        def printit(coverage, outfile):
-            if args.json:
-                print(json.dumps(coverage, indent=(4 if args.pretty_print else None)), file=outfile)
-            else:
-                sc.print_coverage(coverage, outfile=outfile, skip_covered=args.skip_covered,
-                                  missing_width=args.missing_width)
-
-        if not args.silent:
-            coverage = get_coverage(sci)
-            if args.out:
-                with open(args.out, "w") as outfile:
-                    printit(coverage, outfile)
+        if client:
+            client.close()
+
+        elif not args.silent:
+            # stream straight from the collector, unless forked children's coverage needs merging in
+            streaming = not input_tmpfiles
+            if streaming:
+                write_reports(args, sci.iter_file_coverage)
+
+            if streaming and args.json and not (args.html or args.db):
+                # nothing else needs the complete results, so write them out as they're gathered
+                meta, files, coverage = sci.get_meta(), sci.iter_file_coverage(), None
             else:
-                printit(coverage, sys.stdout)
+                coverage = get_coverage(sci)
+                meta, files = coverage['meta'], coverage['files'].items()
+                if not streaming:
+                    write_reports(args, lambda: coverage['files'].items())
+
+            write_output(args, meta, files, coverage, sci.source_cache)
+
+        if args.stats:
+            print(json.dumps(sci.get_stats(), indent=4), file=sys.stderr)
 
     atexit.register(sci_atexit)
 
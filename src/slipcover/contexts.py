@@ -0,0 +1,157 @@
+import contextlib
+import contextvars
+from collections import defaultdict, Counter
+from typing import Any, Callable, Dict, Hashable, Iterator
+
+
+# The context used by the helpers below, and by the command line's --contexts
+current_context: contextvars.ContextVar = contextvars.ContextVar("slipcover_context", default="")
+
+# Contexts beyond CoverageContexts.max_contexts are all recorded as this one
+OTHER_CONTEXT = "<other>"
+
+
+class CoverageContexts:
+    """Records the lines and branches seen within each coverage context.
+
+    The context is the value of a ContextVar at the time a line or branch executes, so that
+    it follows asyncio tasks (and threads).  Only the first time a line or branch is seen
+    within each context is recorded.
+
+    Each new context requires lines already seen to be monitored again (on 3.12+, restarting
+    sys.monitoring events), and takes up memory, so once 'max_contexts' are known, any others
+    are recorded together as OTHER_CONTEXT.
+    """
+
+    def __init__(self, var: contextvars.ContextVar = current_context, max_contexts: int = 1000):
+        self.var = var
+        self.max_contexts = max_contexts
+
+        # context -> file -> lines/branches seen
+        self.seen: Dict[Hashable, Dict[str, set]] = defaultdict(lambda: defaultdict(set))
+
+        # (file, line/branch) -> number of contexts in which it has been seen
+        self.n_contexts: Counter = Counter()
+
+
+    def _context(self) -> Hashable:
+        try:
+            ctx = self.var.get()
+        except LookupError:     # no value, nor default
+            ctx = ""
+
+        if ctx not in self.seen and len(self.seen) >= self.max_contexts:
+            return OTHER_CONTEXT
+
+        return ctx
+
+
+    def __getitem__(self, filename: str) -> set:
+        """Returns the set of lines/branches seen within the current context; used by probes."""
+        return self.seen[self._context()][filename]
+
+
+    def check_new_context(self) -> bool:
+        """Returns whether the current context is new, registering it if so."""
+        ctx = self._context()
+        if ctx in self.seen:
+            return False
+
+        self.seen[ctx]  # registers it
+        return True
+
+
+    def add(self, filename: str, line_or_branch) -> bool:
+        """Records a line or branch seen within the current context.
+
+        Returns whether it has now been seen within all contexts known so far.
+        """
+        ctx_seen = self.seen[self._context()][filename]
+        if line_or_branch not in ctx_seen:
+            ctx_seen.add(line_or_branch)
+            self.n_contexts[(filename, line_or_branch)] += 1
+
+        return self.n_contexts[(filename, line_or_branch)] == len(self.seen)
+
+
+    def files(self) -> Dict[str, set]:
+        """Returns the lines/branches seen within any context, by file."""
+        all_seen: Dict[str, set] = defaultdict(set)
+        for ctx_files in self.seen.values():
+            for filename, seen in ctx_files.items():
+                all_seen[filename].update(seen)
+        return all_seen
+
+
+    def line_contexts(self, filename: str) -> Dict[str, list]:
+        """Returns a map from each line seen to the sorted names of contexts that saw it,
+           in the same format as coverage.py's JSON 'contexts'."""
+        contexts: Dict[int, set] = defaultdict(set)
+        for ctx, ctx_files in self.seen.items():
+            for line in ctx_files.get(filename, ()):
+                if not isinstance(line, tuple):    # skip branches
+                    contexts[line].add(str(ctx))
+
+        return {str(line): sorted(contexts[line]) for line in sorted(contexts)}
+
+
+    def clear(self) -> None:
+        self.seen.clear()
+        self.n_contexts.clear()
+
+
+@contextlib.contextmanager
+def coverage_context(name: Hashable, var: contextvars.ContextVar = current_context) -> Iterator[None]:
+    """Attributes coverage for code executed within the 'with' block to the given context."""
+    token = var.set(name)
+    try:
+        yield
+    finally:
+        var.reset(token)
+
+
+def asgi_path_context(scope: dict) -> str:
+    """Returns a request's method and path."""
+    return f"{scope.get('method', scope['type'])} {scope.get('path', '')}"
+
+
+def asgi_route_context(scope: dict) -> str:
+    """Returns a request's method and route template, if the ASGI scope provides a route
+       (as Starlette's does, once routed), or else its method and path.
+
+       The route is only known once the request has been routed, so this is meant for
+       middleware placed after routing, such as on each route or endpoint.
+    """
+    route = scope.get('route')
+    if (path := getattr(route, 'path_format', None) or getattr(route, 'path', None)) is None:
+        return asgi_path_context(scope)
+
+    return f"{scope.get('method', scope['type'])} {path}"
+
+
+class ASGIContextMiddleware:
+    """ASGI middleware attributing coverage for each request to a context (by default,
+       its method and path, as given by asgi_path_context).
+
+       Wrapping an application, the middleware runs before routing, so paths with parameters
+       (such as IDs) yield a context each; beyond CoverageContexts.max_contexts, contexts are
+       recorded together.  To attribute coverage by route instead, wrap each route's endpoint
+       with get_context=asgi_route_context, or pass a 'get_context' that returns a bounded set
+       of names.
+    """
+
+    def __init__(self, app, get_context: Callable[[dict], Hashable] = asgi_path_context,
+                 var: contextvars.ContextVar = current_context):
+        self.app = app
+        self.get_context = get_context
+        self.var = var
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> Any:
+        if scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        token = self.var.set(self.get_context(scope))
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            self.var.reset(token)
@@ -0,0 +1,272 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import warnings
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from .slipcover import (Slipcover, SlipcoverError, PathSimplifier, add_summaries, file_summary,
+                        to_line_ranges, from_line_ranges)
+
+
+# Messages are JSON objects, one per line:
+#   {"meta": {...}}         sent by each client upon connecting, as in Slipcover.get_meta()
+#   {"files": {...}}        lines and branches found ("lines", "branches") and seen
+#                           ("executed_lines", "executed_branches") since the last message,
+#                           per file; lines are sent as [first, last] ranges
+#   {"shutdown": true}      asks the server to stop and write its report
+
+
+def _encode_delta(delta: Dict[str, Tuple[set, set]]) -> dict:
+    files = dict()
+    for filename, (code, seen) in delta.items():
+        f_delta = dict()
+        for (lines_key, branches_key), items in ((('lines', 'branches'), code),
+                                                 (('executed_lines', 'executed_branches'), seen)):
+            branches = sorted(x for x in items if isinstance(x, tuple))
+            if len(branches) != len(items):
+                f_delta[lines_key] = to_line_ranges(sorted(x for x in items if not isinstance(x, tuple)))
+            if branches:
+                f_delta[branches_key] = branches
+
+        if f_delta:
+            files[filename] = f_delta
+
+    return files
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+
+        try:
+            for line in self.rfile:
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as e:
+                    warnings.warn(f"Ignoring malformed coverage message: {e}")
+                    break
+
+                if 'meta' in message:
+                    server.add_meta(message['meta'])
+                if 'files' in message:
+                    server.add_files(message['files'])
+                if message.get('shutdown'):
+                    # shutdown() waits for serve_forever() to return, so it can't be called here
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+        finally:
+            with server.lock:
+                server.active -= 1
+                server.idle.notify_all()
+
+
+class CoverageServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Collects coverage from any number of processes, as sent by DaemonClient over a Unix
+    domain socket, keeping it merged in memory so that a single report can be written.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path):
+        self.socket_path = Path(socket_path)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.active = 0
+
+        self.branch_coverage: Optional[bool] = None
+        self.code_lines: Dict[str, set] = defaultdict(set)
+        self.code_branches: Dict[str, set] = defaultdict(set)
+        self.all_seen: Dict[str, set] = defaultdict(set)
+
+        if self.socket_path.is_socket():
+            # remove it if left over by a previous server, but not if one is still listening
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect(str(self.socket_path))
+                    raise SlipcoverError(f'Already serving on {self.socket_path}')
+                except ConnectionRefusedError:
+                    self.socket_path.unlink()
+
+        super().__init__(str(self.socket_path), _Handler)
+
+
+    def add_meta(self, meta: dict) -> None:
+        """Notes a client's 'meta', as in Slipcover.get_meta()."""
+        if meta.get('show_contexts', False):
+            warnings.warn('Coverage contexts are not collected by the coverage server')
+
+        with self.lock:
+            # branches are reported only if all clients measured them
+            self.branch_coverage = (self.branch_coverage is not False) and bool(meta.get('branch_coverage'))
+
+
+    def add_files(self, files: dict) -> None:
+        """Merges in a client's coverage delta (the 'files' of a message)."""
+        with self.lock:
+            for filename, f_delta in files.items():
+                self.code_lines[filename].update(from_line_ranges(f_delta.get('lines', ())))
+                self.code_branches[filename].update(tuple(b) for b in f_delta.get('branches', ()))
+
+                seen = self.all_seen[filename]
+                seen.update(from_line_ranges(f_delta.get('executed_lines', ())))
+                seen.update(tuple(b) for b in f_delta.get('executed_branches', ()))
+
+
+    def wait_for_clients(self, timeout: Optional[float] = None) -> bool:
+        """Waits for connected clients to disconnect, returning whether they did."""
+        with self.lock:
+            return self.idle.wait_for(lambda: self.active == 0, timeout)
+
+
+    def iter_file_coverage(self) -> Iterator[Tuple[str, dict]]:
+        """Yields (file name, coverage information) for each file, as in Slipcover.iter_file_coverage()."""
+        with self.lock:
+            branch = bool(self.branch_coverage)
+            simp = PathSimplifier()
+
+            for f in sorted(self.code_lines.keys() | self.all_seen.keys()):
+                seen = self.all_seen.get(f, set())
+                branches_seen = {x for x in seen if isinstance(x, tuple)}
+                lines_seen = seen - branches_seen
+                code_lines = self.code_lines.get(f, set())
+
+                f_cov = {
+                    'executed_lines': sorted(lines_seen),
+                    'missing_lines': sorted(code_lines - lines_seen)
+                }
+
+                if branch:
+                    f_cov['executed_branches'] = sorted(branches_seen)
+                    f_cov['missing_branches'] = sorted(self.code_branches.get(f, set()) - branches_seen)
+
+                f_cov['summary'] = file_summary(f_cov)
+                yield simp.simplify(f), f_cov
+
+
+    def get_coverage(self) -> dict:
+        """Returns the coverage collected, in the format of Slipcover.get_coverage()."""
+        cov = {
+            'meta': Slipcover._make_meta(bool(self.branch_coverage)),
+            'files': dict(self.iter_file_coverage())
+        }
+        add_summaries(cov)
+        return cov
+
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def request_shutdown(socket_path: Path) -> None:
+    """Asks a CoverageServer to stop and write its report."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(str(socket_path))
+        s.sendall(json.dumps({'shutdown': True}).encode() + b'\n')
+
+
+class DaemonClient:
+    """Sends the coverage a Slipcover collects to a CoverageServer, as deltas sent periodically
+    (every 'interval' seconds) from a background thread, and upon close().
+
+    Forked child processes connect on their own, and so need to call close() before exiting.
+    """
+
+    def __init__(self, sci: Slipcover, socket_path: Path, interval: float = 1.0):
+        if sci.contexts:
+            raise SlipcoverError('Coverage contexts are not collected by the coverage server')
+
+        self.sci = sci
+        self.socket_path = Path(socket_path)
+        self.interval = interval
+        self._connect()
+
+        # the Slipcover holds its own lock across fork(); hold ours as well, so that a fork()
+        # while sending doesn't leave it held, nor a message half sent
+        os.register_at_fork(before=self._before_fork, after_in_parent=self._after_fork_in_parent,
+                            after_in_child=self._after_fork)
+
+
+    def _connect(self) -> None:
+        self.lock = threading.Lock()
+        self.sock: Optional[socket.socket] = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(str(self.socket_path))
+        except OSError:
+            self.sock.close()
+            raise
+
+        self._send({'meta': self.sci.get_meta()})
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def _before_fork(self) -> None:
+        self.lock.acquire()
+
+
+    def _after_fork_in_parent(self) -> None:
+        self.lock.release()
+
+
+    def _after_fork(self) -> None:
+        self.lock.release()
+        if self.sock is None:
+            return
+
+        self.sock.close()   # the parent's connection
+        self.sci.signal_child_process()
+        try:
+            self._connect()
+        except OSError as e:
+            warnings.warn(f"Unable to connect to {self.socket_path}: {e}")
+            self.sock = None
+
+
+    def _send(self, message: dict) -> None:
+        with self.lock:
+            if self.sock is None:
+                return
+            try:
+                self.sock.sendall(json.dumps(message).encode() + b'\n')
+            except OSError as e:
+                warnings.warn(f"Unable to send coverage to {self.socket_path}: {e}")
+                self.sock.close()
+                self.sock = None
+
+
+    def send(self, add_unseen_source: bool = False) -> None:
+        """Sends any coverage not yet sent."""
+        if files := _encode_delta(self.sci.get_delta(add_unseen_source)):
+            self._send({'files': files})
+
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.send()
+
+
+    def close(self) -> None:
+        """Sends any remaining coverage and disconnects."""
+        if self.sock is None:
+            return
+
+        self.stop_event.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+        self.send(add_unseen_source=True)
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
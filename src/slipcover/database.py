@@ -0,0 +1,300 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .slipcover import Slipcover, SlipcoverError, add_summaries, from_line_ranges
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT,
+    branch_coverage INTEGER NOT NULL,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- branches are numbered per file, so that each run can record them as bitmaps
+CREATE TABLE IF NOT EXISTS branches (
+    file INTEGER NOT NULL REFERENCES files(id),
+    idx INTEGER NOT NULL,
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    PRIMARY KEY (file, idx),
+    UNIQUE (file, src, dst)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    file INTEGER NOT NULL REFERENCES files(id),
+    lines BLOB NOT NULL,
+    executed_lines BLOB NOT NULL,
+    branches BLOB,
+    executed_branches BLOB,
+    PRIMARY KEY (run, file)
+);
+CREATE INDEX IF NOT EXISTS coverage_by_file ON coverage (file, run);
+-- coverage of all runs up to 'run' merged, per file; rows are only added for the runs in
+-- which a file's coverage changed, so that the latest at or before a run gives its total
+CREATE TABLE IF NOT EXISTS cumulative (
+    file INTEGER NOT NULL REFERENCES files(id),
+    run INTEGER NOT NULL REFERENCES runs(id),
+    lines BLOB NOT NULL,
+    executed_lines BLOB NOT NULL,
+    branches BLOB,
+    executed_branches BLOB,
+    PRIMARY KEY (file, run)
+);
+"""
+
+_SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+def is_database(path: Path) -> bool:
+    """Returns whether a file looks like an SQLite database."""
+    try:
+        with Path(path).open('rb') as f:
+            return f.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def _bits(blob: Optional[bytes]) -> int:
+    return int.from_bytes(blob, 'little') if blob else 0
+
+
+def _blob(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def _to_bitmap(numbers: Iterable[int]) -> bytes:
+    bits = 0
+    for n in numbers:
+        bits |= 1 << n
+    return _blob(bits)
+
+
+def _from_bitmap(bits: int) -> List[int]:
+    return [n for n, b in enumerate(bin(bits)[:1:-1]) if b == '1']
+
+
+def _merge_blobs(a: tuple, b: tuple) -> tuple:
+    """Merges (lines, executed_lines, branches, executed_branches) bitmaps; branches are None
+       only if neither has them."""
+    return tuple(None if x is None and y is None else _blob(_bits(x) | _bits(y)) for x, y in zip(a, b))
+
+
+class CoverageDatabase:
+    """Stores coverage from successive runs in an SQLite database.
+
+    Each run is recorded as per-file bitmaps of the lines (and branches) seen and executed,
+    indexed both by run and by file, so that ranges of runs can be merged, or a file's
+    history queried, without reading every run's coverage.  The coverage of all runs up to
+    each run is also kept, updated only for the files whose coverage a run changes, so that
+    merging runs from the first one on reads a single row per file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+
+            # databases written before the cumulative table existed
+            if self.conn.execute("SELECT NOT EXISTS (SELECT 1 FROM cumulative) "
+                                 "AND EXISTS (SELECT 1 FROM coverage)").fetchone()[0]:
+                for run, file_id, *bitmaps in self.conn.execute(
+                        "SELECT run, file, lines, executed_lines, branches, executed_branches "
+                        "FROM coverage ORDER BY run").fetchall():
+                    self._add_cumulative(run, file_id, tuple(bitmaps))
+
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    def __enter__(self) -> "CoverageDatabase":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def _file_id(self, name: str) -> int:
+        self.conn.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+        return self.conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()[0]
+
+
+    def _branch_indices(self, file_id: int, branches: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], int]:
+        """Returns the indices for a file's branches, numbering any new ones."""
+        indices = {(src, dst): idx for idx, src, dst in
+                   self.conn.execute("SELECT idx, src, dst FROM branches WHERE file = ?", (file_id,))}
+        for src, dst in branches:
+            if (src, dst) not in indices:
+                indices[(src, dst)] = len(indices)
+                self.conn.execute("INSERT INTO branches (file, idx, src, dst) VALUES (?, ?, ?, ?)",
+                                  (file_id, indices[(src, dst)], src, dst))
+        return indices
+
+
+    def _add_cumulative(self, run: int, file_id: int, bitmaps: tuple) -> None:
+        """Merges a file's coverage in a run into the totals from that run on."""
+        prev = self.conn.execute("""SELECT lines, executed_lines, branches, executed_branches
+                                    FROM cumulative WHERE file = ? AND run <= ?
+                                    ORDER BY run DESC LIMIT 1""", (file_id, run)).fetchone()
+        total = _merge_blobs(prev, bitmaps) if prev else bitmaps
+        if total != prev:
+            self.conn.execute("""INSERT OR REPLACE INTO cumulative
+                                 (file, run, lines, executed_lines, branches, executed_branches)
+                                 VALUES (?, ?, ?, ?, ?, ?)""", (file_id, run, *total))
+
+        # when merging into an earlier run, as for a forked child process
+        for later, *later_total in self.conn.execute("""SELECT run, lines, executed_lines, branches,
+                                                              executed_branches
+                                                       FROM cumulative WHERE file = ? AND run > ?""",
+                                                    (file_id, run)).fetchall():
+            self.conn.execute("""UPDATE cumulative SET lines = ?, executed_lines = ?, branches = ?,
+                                                       executed_branches = ?
+                                 WHERE file = ? AND run = ?""",
+                              (*_merge_blobs(tuple(later_total), bitmaps), file_id, later))
+
+
+    def add_run(self, meta: dict, files: Iterable[Tuple[str, dict]], run: Optional[int] = None) -> int:
+        """Records a run's coverage, returning its run number.
+
+        'meta' and 'files' are as in the output of Slipcover.get_coverage(); 'files' may also be
+        Slipcover.iter_file_coverage(), as it is consumed one file at a time.  If 'run' is given,
+        the coverage is merged into that (existing) run, as for a forked child process.
+        """
+        if meta.get('show_contexts', False):
+            raise SlipcoverError('Storing coverage with show_contexts=True unsupported')
+
+        branch_coverage = bool(meta.get('branch_coverage', False))
+        line_ranges = meta.get('line_ranges', False)
+
+        with self.conn:
+            if run is None:
+                run = self.conn.execute("INSERT INTO runs (timestamp, branch_coverage, meta) VALUES (?, ?, ?)",
+                                        (meta.get('timestamp'), branch_coverage, json.dumps(meta))).lastrowid
+            else:
+                row = self.conn.execute("SELECT branch_coverage FROM runs WHERE id = ?", (run,)).fetchone()
+                if row is None:
+                    raise SlipcoverError(f'No run {run} in {self.path}')
+                if row[0] and not branch_coverage:
+                    raise SlipcoverError('Cannot merge coverage: branch coverage missing')
+
+            for filename, f_cov in files:
+                file_id = self._file_id(filename)
+                executed, missing = f_cov['executed_lines'], f_cov['missing_lines']
+                if line_ranges:
+                    executed, missing = from_line_ranges(executed), from_line_ranges(missing)
+
+                lines = _to_bitmap(executed + missing)
+                executed_lines = _to_bitmap(executed)
+
+                branches = executed_branches = None
+                if branch_coverage:
+                    executed = [tuple(b) for b in f_cov['executed_branches']]
+                    missing = [tuple(b) for b in f_cov['missing_branches']]
+                    indices = self._branch_indices(file_id, executed + missing)
+                    branches = _to_bitmap(indices[b] for b in executed + missing)
+                    executed_branches = _to_bitmap(indices[b] for b in executed)
+
+                old = self.conn.execute("""SELECT lines, executed_lines, branches, executed_branches
+                                           FROM coverage WHERE run = ? AND file = ?""",
+                                        (run, file_id)).fetchone()
+                bitmaps = (lines, executed_lines, branches, executed_branches)
+                self.conn.execute("""INSERT OR REPLACE INTO coverage
+                                     (run, file, lines, executed_lines, branches, executed_branches)
+                                     VALUES (?, ?, ?, ?, ?, ?)""",
+                                  (run, file_id, *(_merge_blobs(old, bitmaps) if old else bitmaps)))
+                self._add_cumulative(run, file_id, bitmaps)
+
+        return run
+
+
+    def runs(self) -> List[dict]:
+        """Returns the runs recorded, oldest first."""
+        return [{'run': run, 'timestamp': timestamp, 'branch_coverage': bool(branch_coverage)}
+                for run, timestamp, branch_coverage in
+                self.conn.execute("SELECT id, timestamp, branch_coverage FROM runs ORDER BY id")]
+
+
+    @staticmethod
+    def _range(first_run: Optional[int], last_run: Optional[int]) -> Tuple[int, int]:
+        return (first_run if first_run is not None else 0,
+                last_run if last_run is not None else 2**63-1)
+
+
+    def get_coverage(self, first_run: Optional[int] = None, last_run: Optional[int] = None) -> dict:
+        """Returns the coverage of runs first_run through last_run (by default, all of them)
+           merged together, in the format of Slipcover.get_coverage().
+        """
+        first, last = self._range(first_run, last_run)
+
+        branch_coverage = self.conn.execute("""SELECT COUNT(*) > 0 AND MIN(branch_coverage)
+                                               FROM runs WHERE id BETWEEN ? AND ?""", (first, last)).fetchone()[0]
+        branch_coverage = bool(branch_coverage)
+
+        files = dict()
+        # rows are ordered by file, so files are merged one at a time
+        if not self.conn.execute("SELECT EXISTS (SELECT 1 FROM runs WHERE id < ?)", (first,)).fetchone()[0]:
+            # from the first run on, the totals as of the last run have it all
+            rows = self.conn.execute("""SELECT files.name, c.file, lines, executed_lines,
+                                               branches, executed_branches
+                                        FROM cumulative AS c JOIN files ON files.id = c.file
+                                        WHERE c.run = (SELECT MAX(run) FROM cumulative
+                                                       WHERE file = c.file AND run <= ?)
+                                        ORDER BY c.file""", (last,))
+        else:
+            rows = self.conn.execute("""SELECT files.name, coverage.file, lines, executed_lines,
+                                               branches, executed_branches
+                                        FROM coverage JOIN files ON files.id = coverage.file
+                                        WHERE run BETWEEN ? AND ? ORDER BY coverage.file""", (first, last))
+
+        current = None
+        def add_file():
+            name, file_id, lines, executed_lines, branches, executed_branches = current
+            f_cov = {
+                'executed_lines': _from_bitmap(executed_lines),
+                'missing_lines': _from_bitmap(lines & ~executed_lines)
+            }
+            if branch_coverage:
+                by_index = {idx: [src, dst] for idx, src, dst in
+                            self.conn.execute("SELECT idx, src, dst FROM branches WHERE file = ?", (file_id,))}
+                f_cov['executed_branches'] = sorted(by_index[i] for i in _from_bitmap(executed_branches))
+                f_cov['missing_branches'] = sorted(by_index[i] for i in _from_bitmap(branches & ~executed_branches))
+            files[name] = f_cov
+
+        for name, file_id, *bitmaps in rows:
+            if current is not None and current[1] != file_id:
+                add_file()
+                current = None
+
+            if current is None:
+                current = [name, file_id, 0, 0, 0, 0]
+            for i, b in enumerate(bitmaps, start=2):
+                current[i] |= _bits(b)
+
+        if current is not None:
+            add_file()
+
+        cov = {
+            'meta': Slipcover._make_meta(branch_coverage),
+            'files': files
+        }
+        add_summaries(cov)
+        return cov
+
+
+    def last_executed(self, filename: str, line: int) -> Optional[int]:
+        """Returns the most recent run in which a line executed, or None if it never did."""
+        for run, executed_lines in self.conn.execute("""SELECT run, executed_lines
+                                                        FROM coverage JOIN files ON files.id = coverage.file
+                                                        WHERE files.name = ? ORDER BY run DESC""", (filename,)):
+            if _bits(executed_lines) >> line & 1:
+                return run
+        return None
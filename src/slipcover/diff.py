@@ -0,0 +1,80 @@
+import re
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Set
+
+from .slipcover import SlipcoverError
+
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_diff(lines: Iterable[str], base_dir: Path = None) -> Dict[str, Set[int]]:
+    """Parses a unified diff, returning the lines added or changed in each (new) file.
+
+    File names are resolved relative to 'base_dir' (by default, the current directory);
+    deleted files are omitted.
+    """
+    base_dir = Path.cwd() if base_dir is None else Path(base_dir)
+    changed: Dict[str, Set[int]] = defaultdict(set)
+
+    filename = None
+    lineno = None
+    old_left = new_left = 0     # lines left in the current hunk
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        if old_left > 0 or new_left > 0:
+            if line.startswith('+'):
+                if filename:
+                    changed[filename].add(lineno)
+                lineno += 1
+                new_left -= 1
+            elif line.startswith('-'):
+                old_left -= 1
+            elif line.startswith(' ') or line == '':    # context
+                lineno += 1
+                old_left -= 1
+                new_left -= 1
+            # '\ No newline at end of file' doesn't count
+
+        elif line.startswith('+++ '):
+            name = line[4:].split('\t')[0]
+            if name == '/dev/null':
+                filename = None
+            else:
+                if name.startswith('b/'):
+                    name = name[2:]
+                filename = str((base_dir / name).resolve())
+
+        elif (m := _HUNK_RE.match(line)):
+            old_left = int(m.group(1)) if m.group(1) is not None else 1
+            lineno = int(m.group(2))
+            new_left = int(m.group(3)) if m.group(3) is not None else 1
+
+    return dict(changed)
+
+
+def git_changed_lines(base: str) -> Dict[str, Set[int]]:
+    """Returns the lines changed in the working tree, relative to the git revision 'base'."""
+
+    def git(*args) -> str:
+        try:
+            return subprocess.run(['git', *args], check=True, capture_output=True, text=True).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, 'stderr', None)
+            raise SlipcoverError(f"Unable to run git {' '.join(args)}: {stderr.strip() if stderr else e}")
+
+    top = Path(git('rev-parse', '--show-toplevel').strip())
+    diff = git('diff', '--no-color', '--no-ext-diff', '--unified=0', base, '--')
+    return parse_diff(diff.splitlines(), base_dir=top)
+
+
+def patch_changed_lines(patch: Path) -> Dict[str, Set[int]]:
+    """Returns the lines changed according to a unified diff (patch) file."""
+    try:
+        with Path(patch).open(encoding='utf-8', errors='replace') as f:
+            return parse_diff(f)
+    except OSError as e:
+        raise SlipcoverError(f"Unable to read {patch}: {e}")
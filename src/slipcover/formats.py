@@ -0,0 +1,454 @@
+import contextlib
+import heapq
+import io
+import itertools
+import json
+import re
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+from .version import __version__
+from .slipcover import SlipcoverError, total_summary, to_line_ranges, from_line_ranges
+
+
+FileCoverage = Tuple[str, dict]
+
+
+# compressed outputs are selected by file name suffix, and compressed inputs detected by contents
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma', '.lzma': 'lzma', '.zst': 'zstd'}
+
+_MAGIC = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'lzma', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+
+def compression_for(path: Path) -> Optional[str]:
+    """Returns the compression selected by a file name's suffix, if any."""
+    return COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def _compressor_module(compression: str):
+    if compression == 'gzip':
+        import gzip
+        return gzip
+    if compression == 'bz2':
+        import bz2
+        return bz2
+    if compression == 'lzma':
+        import lzma
+        return lzma
+    if compression == 'zstd':
+        try:
+            from compression import zstd    # Python 3.14+
+            return zstd
+        except ImportError:
+            pass
+        try:
+            import zstandard
+            return zstandard
+        except ImportError:
+            raise SlipcoverError("zstd compression requires Python 3.14+ or the 'zstandard' package")
+    raise SlipcoverError(f"Unknown compression {compression}")
+
+
+def check_compression(path: Path) -> None:
+    """Raises SlipcoverError if the compression selected by a file name's suffix is unavailable."""
+    if compression := compression_for(path):
+        _compressor_module(compression)
+
+
+@contextlib.contextmanager
+def open_write(target: Union[Path, BinaryIO], compression: Optional[str] = None) -> Iterator[TextIO]:
+    """Opens a file, given by path or as a binary file object, for writing text, optionally
+       compressed; by default, compression is selected by the file name's suffix.
+       A file object passed in is flushed, but left open.
+    """
+    if compression is None and isinstance(target, (str, Path)):
+        compression = compression_for(Path(target))
+
+    if compression:
+        with _compressor_module(compression).open(target, 'wt', encoding='utf-8') as f:
+            yield f
+    elif isinstance(target, (str, Path)):
+        with open(target, 'w', encoding='utf-8') as f:
+            yield f
+    else:
+        f = io.TextIOWrapper(target, encoding='utf-8')
+        try:
+            yield f
+        finally:
+            f.flush()
+            f.detach()
+
+    if not isinstance(target, (str, Path)) and not target.closed:
+        target.flush()
+
+
+@contextlib.contextmanager
+def open_read(source: Union[Path, BinaryIO]) -> Iterator[TextIO]:
+    """Opens a file, given by path or as a binary file object, for reading text,
+       transparently decompressing it if its contents are compressed.
+    """
+    with contextlib.ExitStack() as stack:
+        if isinstance(source, (str, Path)):
+            source = stack.enter_context(open(source, 'rb'))
+        if not hasattr(source, 'peek'):
+            source = io.BufferedReader(source)
+
+        head = source.peek(6)[:6]
+        compression = next((c for magic, c in _MAGIC.items() if head.startswith(magic)), None)
+        if compression:
+            yield stack.enter_context(_compressor_module(compression).open(source, 'rt', encoding='utf-8'))
+        else:
+            f = io.TextIOWrapper(source, encoding='utf-8')
+            try:
+                yield f
+            finally:
+                f.detach()
+
+
+def _lines(f_cov: dict) -> Iterator[Tuple[int, bool]]:
+    """Yields (line, executed) for all of a file's lines, in order."""
+    return heapq.merge(((l, True) for l in f_cov['executed_lines']),
+                       ((l, False) for l in f_cov['missing_lines']))
+
+
+def _branches(f_cov: dict) -> Dict[int, list]:
+    """Returns a file's branches, as a map of source line to [(destination, taken)]."""
+    branches = defaultdict(list)
+    for (src, dst), taken in heapq.merge(((tuple(b), True) for b in f_cov['executed_branches']),
+                                         ((tuple(b), False) for b in f_cov['missing_branches'])):
+        branches[src].append((dst, taken))
+    return branches
+
+
+def write_lcov(files: Iterable[FileCoverage], outfile: TextIO) -> None:
+    """Writes coverage in LCOV's tracefile format.
+
+    'files' yields (file name, coverage) pairs as in the 'files' entry of Slipcover.get_coverage(),
+    such as Slipcover.iter_file_coverage() or JsonCoverageReader.files(); only one file's
+    coverage is held at a time.
+    """
+    for filename, f_cov in files:
+        print("TN:", file=outfile)
+        print(f"SF:{filename}", file=outfile)
+
+        for line, executed in _lines(f_cov):
+            print(f"DA:{line},{int(executed)}", file=outfile)
+
+        if 'executed_branches' in f_cov:
+            executed_lines = set(f_cov['executed_lines'])
+            for src, dsts in _branches(f_cov).items():
+                for i, (_, taken) in enumerate(dsts):
+                    hits = int(taken) if src in executed_lines else '-'
+                    print(f"BRDA:{src},0,{i},{hits}", file=outfile)
+
+            print(f"BRF:{len(f_cov['executed_branches']) + len(f_cov['missing_branches'])}", file=outfile)
+            print(f"BRH:{len(f_cov['executed_branches'])}", file=outfile)
+
+        print(f"LF:{len(f_cov['executed_lines']) + len(f_cov['missing_lines'])}", file=outfile)
+        print(f"LH:{len(f_cov['executed_lines'])}", file=outfile)
+        print("end_of_record", file=outfile)
+
+
+class _Totals:
+    def __init__(self):
+        self.lines_valid = self.lines_covered = 0
+        self.branches_valid = self.branches_covered = 0
+
+    def add(self, f_cov: dict) -> None:
+        self.lines_covered += len(f_cov['executed_lines'])
+        self.lines_valid += len(f_cov['executed_lines']) + len(f_cov['missing_lines'])
+        if 'executed_branches' in f_cov:
+            self.branches_covered += len(f_cov['executed_branches'])
+            self.branches_valid += len(f_cov['executed_branches']) + len(f_cov['missing_branches'])
+
+    def rates(self) -> str:
+        line_rate = self.lines_covered / self.lines_valid if self.lines_valid else 1
+        branch_rate = self.branches_covered / self.branches_valid if self.branches_valid else 1
+        return f'line-rate="{line_rate:.4g}" branch-rate="{branch_rate:.4g}" complexity="0"'
+
+
+def _package_name(filename: str) -> str:
+    parent = Path(filename).parent.as_posix()
+    return '.' if parent == '.' else parent.replace('/', '.')
+
+
+def _write_class(filename: str, f_cov: dict, outfile: TextIO) -> None:
+    """Writes a file's coverage as a Cobertura class."""
+    file_totals = _Totals()
+    file_totals.add(f_cov)
+    print(f'\t\t\t\t<class name={quoteattr(Path(filename).name)} filename={quoteattr(filename)} '
+          f'{file_totals.rates()}>', file=outfile)
+    print('\t\t\t\t\t<methods/>\n\t\t\t\t\t<lines>', file=outfile)
+
+    branches = _branches(f_cov) if 'executed_branches' in f_cov else {}
+    for line, executed in _lines(f_cov):
+        attrs = f'number="{line}" hits="{int(executed)}"'
+        if line in branches:
+            taken = sum(t for _, t in branches[line])
+            total = len(branches[line])
+            attrs += f' branch="true" condition-coverage="{100*taken//total}% ({taken}/{total})"'
+            if missing := [("exit" if dst == 0 else str(dst)) for dst, t in branches[line] if not t]:
+                attrs += f' missing-branches="{",".join(missing)}"'
+        print(f'\t\t\t\t\t\t<line {attrs}/>', file=outfile)
+
+    print('\t\t\t\t\t</lines>\n\t\t\t\t</class>', file=outfile)
+
+
+def write_cobertura(files: Callable[[], Iterable[FileCoverage]], outfile: TextIO, *,
+                    source: Optional[str] = None) -> None:
+    """Writes coverage in Cobertura's XML format.
+
+    Cobertura places totals ahead of the per-file details, so 'files' is a callable returning
+    a new (file name, coverage) iterable each time: it is called once to compute the totals and
+    again to write out the files, holding only one file's coverage at a time.  Files are grouped
+    into packages by directory; if a directory's files aren't listed together (as when listed
+    in import order), their classes are spooled to a temporary file, so as to group them.
+    """
+    totals = _Totals()
+    packages: Dict[str, _Totals] = dict()
+    contiguous = True
+    last = None
+    for filename, f_cov in files():
+        totals.add(f_cov)
+        if (name := _package_name(filename)) != last:
+            if name in packages:
+                contiguous = False
+            else:
+                packages[name] = _Totals()
+            last = name
+        packages[name].add(f_cov)
+
+    print('<?xml version="1.0" ?>', file=outfile)
+    print('<!DOCTYPE coverage SYSTEM "http://cobertura.sourceforge.net/xml/coverage-04.dtd">', file=outfile)
+    print(f'<coverage version="{__version__}" timestamp="{int(time.time()*1000)}" '
+          f'lines-valid="{totals.lines_valid}" lines-covered="{totals.lines_covered}" '
+          f'branches-valid="{totals.branches_valid}" branches-covered="{totals.branches_covered}" '
+          f'{totals.rates()}>', file=outfile)
+    print(f'\t<sources>\n\t\t<source>{escape(source or str(Path.cwd()))}</source>\n\t</sources>', file=outfile)
+    print('\t<packages>', file=outfile)
+
+    def package_start(name: str) -> None:
+        print(f'\t\t<package name={quoteattr(name)} {packages[name].rates()}>\n\t\t\t<classes>', file=outfile)
+
+    def package_end() -> None:
+        print('\t\t\t</classes>\n\t\t</package>', file=outfile)
+
+    if contiguous:
+        package = None
+        for filename, f_cov in files():
+            if (name := _package_name(filename)) != package:
+                if package is not None:
+                    package_end()
+                package = name
+                package_start(name)
+
+            _write_class(filename, f_cov, outfile)
+
+        if package is not None:
+            package_end()
+
+    else:
+        # package -> (offset, length) of each of its classes in the spool
+        segments: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        with tempfile.TemporaryFile() as spool:
+            for filename, f_cov in files():
+                text = io.StringIO()
+                _write_class(filename, f_cov, text)
+                data = text.getvalue().encode('utf-8')
+                segments[_package_name(filename)].append((spool.tell(), len(data)))
+                spool.write(data)
+
+            for name in packages:
+                package_start(name)
+                for offset, length in segments[name]:
+                    spool.seek(offset)
+                    outfile.write(spool.read(length).decode('utf-8'))
+                package_end()
+
+    print('\t</packages>\n</coverage>', file=outfile)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonCoverageReader:
+    """Reads a SlipCover JSON coverage file incrementally.
+
+    files() yields each (file name, coverage) pair as it is parsed, so that only one file's
+    coverage is held in memory at a time.  The 'meta' and 'summary' entries are made available
+    as attributes once read; SlipCover writes 'meta' ahead of 'files', but other writers may not.
+    """
+
+    def __init__(self, fp: TextIO, chunk_size: int = 64*1024):
+        self.meta: Optional[dict] = None
+        self.summary: Optional[dict] = None
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: int) -> bool:
+        data = self._fp.read(size)
+        if not data:
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skips whitespace, returning the next character."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill(self._chunk_size):
+                raise json.JSONDecodeError("Unexpected end of data", self._buf, self._pos)
+
+    def _expect(self, c: str) -> None:
+        if self._peek() != c:
+            raise json.JSONDecodeError(f"Expecting '{c}'", self._buf, self._pos)
+        self._pos += 1
+
+    def _more(self, close: str) -> bool:
+        """Consumes a ',' separator, returning whether another element follows."""
+        if self._peek() == ',':
+            self._pos += 1
+            return True
+        self._expect(close)
+        return False
+
+    def _value(self):
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a number may have been cut short at the end of the buffer
+                if end < len(self._buf) or self._buf[self._pos] in '{["':
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                pass
+
+            # grow reads geometrically, so that large values aren't re-parsed too often
+            if not self._fill(size):
+                value, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+                return value
+            size *= 2
+
+    def files(self) -> Iterator[FileCoverage]:
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'files':
+                self._expect('{')
+                if self._peek() == '}':
+                    self._pos += 1
+                else:
+                    while True:
+                        filename = self._value()
+                        self._expect(':')
+                        yield filename, self._value()
+                        if not self._more('}'):
+                            break
+            elif key == 'meta':
+                self.meta = self._value()
+            elif key == 'summary':
+                self.summary = self._value()
+            else:
+                self._value()
+
+            if not self._more('}'):
+                break
+
+
+def json_file_coverage(path: Path) -> Callable[[], Iterator[FileCoverage]]:
+    """Returns a callable that incrementally reads the files' coverage from a (possibly
+       compressed) SlipCover JSON file.
+    """
+    def files():
+        with open_read(path) as f:
+            yield from read_json(f)[1]
+
+    return files
+
+
+_LINE_LISTS = ('executed_lines', 'missing_lines')
+
+
+def write_json(meta: dict, files: Iterable[FileCoverage], outfile: TextIO, *,
+               indent: Optional[int] = None, line_ranges: bool = False) -> None:
+    """Writes coverage in SlipCover's JSON format, one file at a time.
+
+    'files' yields (file name, coverage) pairs, including their 'summary' entries, as from
+    Slipcover.iter_file_coverage(); the overall summary is computed as they are written.
+    Without line_ranges, the output is the same as that of json.dump() on the corresponding
+    Slipcover.get_coverage() result.  With it, the output declares 'line_ranges' in its 'meta'
+    entry, and lists of lines are written as [first, last] ranges; coverage whose 'meta' already
+    declares 'line_ranges' is written as is.
+    """
+    convert = line_ranges and not meta.get('line_ranges', False)
+    if convert:
+        meta = {**meta, 'line_ranges': True}
+
+    def dumps(value, level: int) -> str:
+        if indent is None:
+            return json.dumps(value)
+        return json.dumps(value, indent=indent).replace('\n', '\n' + ' '*(indent*level))
+
+    if indent is None:
+        nl1 = nl2 = ''
+        sep = ', '
+    else:
+        nl1, nl2 = '\n' + ' '*indent, '\n' + ' '*(2*indent)
+        sep = ','
+
+    outfile.write(f'{{{nl1}"meta": {dumps(meta, 1)}{sep}{nl1}"files": {{')
+
+    summaries = []
+    for i, (filename, f_cov) in enumerate(files):
+        summaries.append(f_cov['summary'])
+        if convert:
+            f_cov = {**f_cov, **{k: to_line_ranges(f_cov[k]) for k in _LINE_LISTS}}
+
+        outfile.write(f'{sep if i else ""}{nl2}{json.dumps(filename)}: {dumps(f_cov, 2)}')
+
+    outfile.write(f'{nl1 if summaries else ""}}}{sep}{nl1}"summary": {dumps(total_summary(summaries), 1)}'
+                  f'{"" if indent is None else chr(10)}}}')
+
+
+def read_json(fp: TextIO, expand_ranges: bool = True) -> Tuple[dict, Iterator[FileCoverage]]:
+    """Starts reading a SlipCover JSON coverage file incrementally, returning its 'meta' entry
+       and an iterator over its (file name, coverage) pairs; unless expand_ranges is False,
+       any line ranges are expanded into lists of lines.  If 'files' precedes 'meta', all of
+       the files' coverage is read into memory before returning.
+    """
+    reader = JsonCoverageReader(fp)
+    files = reader.files()
+
+    # SlipCover writes 'meta' ahead of 'files', so it has been read by the time the first file is
+    first = next(files, None)
+    if first is not None and reader.meta is None:
+        # written by something else; read all files, in case 'meta' follows them
+        files = iter([first, *files])
+    else:
+        files = itertools.chain([first] if first else [], files)
+
+    meta = reader.meta if reader.meta is not None else {}
+
+    if expand_ranges and meta.get('line_ranges', False):
+        files = ((filename, {**f_cov, **{k: from_line_ranges(f_cov[k]) for k in _LINE_LISTS}})
+                 for filename, f_cov in files)
+        meta = {k: v for k, v in meta.items() if k != 'line_ranges'}
+
+    return meta, files
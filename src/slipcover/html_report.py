@@ -0,0 +1,213 @@
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .version import __version__
+from .slipcover import SourceCache, from_line_ranges
+
+
+# Changing this causes all pages to be regenerated
+_FORMAT_VERSION = 1
+
+MANIFEST = "slipcover-html.json"
+
+# Below this many pages to write, starting worker processes costs more than it saves
+_MIN_PARALLEL = 32
+
+_STYLE = """
+body { font-family: sans-serif; margin: 1em 2em; }
+table.index { border-collapse: collapse; }
+table.index td, table.index th { padding: .2em .8em; text-align: right; }
+table.index td.name, table.index th.name { text-align: left; }
+table.index tr:nth-child(even) { background: #f4f4f4; }
+pre { margin: 0; }
+.src td { font-family: monospace; white-space: pre; padding: 0 .5em; }
+.src td.n { color: #888; text-align: right; user-select: none; }
+.run { background: #dfd; }
+.mis { background: #fdd; }
+.par { background: #ffc; }
+"""
+
+
+def _page_name(filename: str) -> str:
+    """Returns the name of the HTML page for a source file."""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:12]
+    stem = "".join(c if c.isalnum() else '_' for c in Path(filename).name)
+    return f"{stem}_{digest}.html"
+
+
+def _input_hash(filename: str, f_cov: dict, source: bytes) -> str:
+    """Hashes the inputs to a file's page: its source and its coverage."""
+    h = hashlib.sha256()
+    h.update(json.dumps([_FORMAT_VERSION, __version__, filename, f_cov], sort_keys=True).encode('utf-8'))
+    h.update(source)
+    return h.hexdigest()
+
+
+def _read_source(filename: str, source_cache: Optional[SourceCache]) -> bytes:
+    """Reads a file's source, through the cache if given; missing files read as empty."""
+    try:
+        if source_cache is not None:
+            # names are reported relative to the current directory, but cached as instrumented
+            return source_cache.get(str(Path(filename).absolute()))
+        return Path(filename).read_bytes()
+    except OSError:
+        return b''
+
+
+def _pct(summary: dict) -> str:
+    return f"{summary['percent_covered']:.0f}%"
+
+
+def _render_file(filename: str, f_cov: dict, out_path: str, line_ranges: bool = False,
+                 source: Optional[bytes] = None) -> None:
+    """Writes the HTML page for a source file, reading its source unless given;
+       may run in worker processes."""
+    if source is None:
+        try:
+            source = Path(filename).read_bytes()
+        except OSError:
+            source = b''
+
+    source = source.decode('utf-8', errors='replace').splitlines()
+
+    expand = from_line_ranges if line_ranges else lambda lines: lines
+    executed = set(expand(f_cov['executed_lines']))
+    missing = set(expand(f_cov['missing_lines']))
+
+    missing_branches: Dict[int, List[int]] = {}
+    for src, dst in f_cov.get('missing_branches', ()):
+        missing_branches.setdefault(src, []).append(dst)
+
+    rows = []
+    for n, text in enumerate(source, start=1):
+        if n in missing:
+            cls = ' class="mis"'
+        elif n in missing_branches:
+            cls = ' class="par"'
+        elif n in executed:
+            cls = ' class="run"'
+        else:
+            cls = ''
+
+        title = ''
+        if n in missing_branches:
+            targets = ", ".join("exit" if d == 0 else str(d) for d in sorted(missing_branches[n]))
+            title = f' title="didn\'t jump to {targets}"'
+
+        rows.append(f'<tr{cls}{title}><td class="n">{n}</td><td>{html.escape(text)}</td></tr>')
+
+    with open(out_path, "w", encoding='utf-8') as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(filename)}</title><style>{_STYLE}</style></head>
+<body>
+<p><a href="index.html">index</a></p>
+<h1>{html.escape(filename)}: {_pct(f_cov['summary'])}</h1>
+<table class="src">
+{chr(10).join(rows)}
+</table>
+</body></html>
+""")
+
+
+def _render_files(work: list) -> None:
+    for args in work:
+        _render_file(*args)
+
+
+def _write_index(coverage: dict, out_dir: Path, pages: Dict[str, str]) -> None:
+    branch_coverage = coverage.get('meta', {}).get('branch_coverage', False)
+
+    headers = ["File", "Lines", "Missing"] + (["Branches", "Missing"] if branch_coverage else []) + ["Cover"]
+    rows = []
+    for filename, f_cov in sorted(coverage['files'].items()):
+        s = f_cov['summary']
+        cells = [s['covered_lines'] + s['missing_lines'], s['missing_lines']]
+        if branch_coverage:
+            cells += [s['covered_branches'] + s['missing_branches'], s['missing_branches']]
+
+        rows.append(f'<tr><td class="name"><a href="{pages[filename]}">{html.escape(filename)}</a></td>' +
+                    "".join(f"<td>{c}</td>" for c in cells) + f"<td>{_pct(s)}</td></tr>")
+
+    s = coverage['summary']
+    with open(out_dir / "index.html", "w", encoding='utf-8') as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Coverage report</title><style>{_STYLE}</style></head>
+<body>
+<h1>Coverage report: {_pct(s)}</h1>
+<p>Created by SlipCover v{__version__}, {html.escape(coverage.get('meta', {}).get('timestamp', ''))}</p>
+<table class="index">
+<tr>{"".join(f'<th{" class=name" if i == 0 else ""}>{h}</th>' for i, h in enumerate(headers))}</tr>
+{chr(10).join(rows)}
+</table>
+</body></html>
+""")
+
+
+def write_html(coverage: dict, out_dir: Path, *, jobs: Optional[int] = None,
+               source_cache: Optional[SourceCache] = None) -> dict:
+    """Writes an HTML report of the given coverage (as returned by Slipcover.get_coverage)
+       into a directory.
+
+    Pages are only written for files whose source (by content) or coverage changed since the
+    last report written to that directory; these are rendered across 'jobs' processes (by
+    default, one per CPU).  Source is read through 'source_cache', if given, such as the
+    Slipcover's that instrumented it.  Returns the numbers of pages written, kept and removed.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        with (out_dir / MANIFEST).open() as f:
+            old_manifest = json.load(f)
+            if old_manifest.get('format') != _FORMAT_VERSION:
+                old_manifest = {}
+    except (OSError, ValueError):
+        old_manifest = {}
+
+    line_ranges = coverage.get('meta', {}).get('line_ranges', False)
+    old_files = old_manifest.get('files', {})
+    new_files = {}
+    work = []
+    for filename, f_cov in coverage['files'].items():
+        page = _page_name(filename)
+        source = _read_source(filename, source_cache)
+        new_files[filename] = {'page': page, 'hash': _input_hash(filename, f_cov, source)}
+
+        if old_files.get(filename) != new_files[filename] or not (out_dir / page).exists():
+            # rendered from the source hashed, even if the file changes meanwhile
+            work.append((filename, f_cov, str(out_dir / page), line_ranges, source))
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs > 1 and len(work) >= _MIN_PARALLEL:
+        # hand out work in chunks, as pages are typically quick to render
+        chunk = max(1, min(100, len(work) // (4*jobs)))
+        chunks = [work[i:i+chunk] for i in range(0, len(work), chunk)]
+        # 'spawn' because we may be running in a process whose os.fork() is shimmed;
+        # multiprocessing rather than concurrent.futures, as this may run from atexit
+        with multiprocessing.get_context('spawn').Pool(jobs) as pool:
+            pool.map(_render_files, chunks)
+    else:
+        _render_files(work)
+
+    removed = 0
+    for filename, entry in old_files.items():
+        if filename not in new_files:
+            try:
+                (out_dir / entry['page']).unlink()
+                removed += 1
+            except OSError:
+                pass
+
+    _write_index(coverage, out_dir, {f: e['page'] for f, e in new_files.items()})
+
+    with (out_dir / MANIFEST).open("w") as f:
+        json.dump({'format': _FORMAT_VERSION, 'files': new_files}, f)
+
+    return {'written': len(work), 'kept': len(new_files) - len(work), 'removed': removed}
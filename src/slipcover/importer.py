@@ -1,8 +1,9 @@
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from .slipcover import Slipcover
 from .version import __version__
 from . import branch as br
 from pathlib import Path
+import os
 import sys
 import sysconfig
 
@@ -38,11 +39,17 @@ class SlipcoverLoader(Loader):
     def get_code(self, name):   # expected by pyrun
         return self.orig_loader.get_code(name)
 
+    def get_source(self, name):   # used by linecache, etc.; shares the source we read
+        if isinstance(self.orig_loader, machinery.SourceFileLoader):
+            import importlib.util
+            return importlib.util.decode_source(self.sci.source_cache.get(str(self.origin), self.orig_loader))
+        return self.orig_loader.get_source(name)
+
     def exec_module(self, module):
         import ast
         # branch coverage requires pre-instrumentation from source
         if self.sci.branch and isinstance(self.orig_loader, machinery.SourceFileLoader) and self.origin.exists():
-            t = br.preinstrument(ast.parse(self.origin.read_bytes()))
+            t = br.preinstrument(ast.parse(self.sci.source_cache.get(str(self.origin), self.orig_loader)))
             code = compile(t, str(self.origin), "exec")
         else:
             code = self.orig_loader.get_code(module.__name__)
@@ -107,16 +114,73 @@ class MatchEverything:
         return True
 
 
+class DiffMatcher:
+    """Matches only files with changed lines, among those matched by another matcher."""
+
+    def __init__(self, changed: dict, file_matcher=None):
+        self.changed = changed    # resolved file name -> lines changed
+        self.file_matcher = file_matcher if file_matcher else MatchEverything()
+
+    def matches(self, filename : Optional[Path]):
+        if filename is None or filename == 'built-in':
+            return False
+
+        return str(Path(filename).resolve()) in self.changed and self.file_matcher.matches(filename)
+
+
 class SlipcoverMetaPathFinder(MetaPathFinder):
     def __init__(self, sci, file_matcher, debug=False):
         self.debug = debug
         self.sci = sci
         self.file_matcher = file_matcher
 
+        # Caches of whether to instrument each origin, and of lookups for which no finder
+        # returned a spec (or the spec was for an extension); the latter depend upon sys.path
+        # and sys.meta_path, so we clear them if those change, and upon the contents of the
+        # directories searched, so each is kept along with their modification times.
+        self._origin_matches: Dict[str, bool] = {}
+        self._not_found: Dict[Tuple[str, Optional[Tuple[str, ...]]], tuple] = {}
+        self._sys_path: List[str] = []
+        self._meta_path: List[Any] = []
+
+    def invalidate_caches(self) -> None:
+        """Clears our caches; called by importlib.invalidate_caches()."""
+        self._origin_matches.clear()
+        self._not_found.clear()
+
+    @staticmethod
+    def _path_stamp(path: Optional[Tuple[str, ...]]) -> tuple:
+        """Returns the modification times of the directories searched for a module, which
+           change as modules are created (or removed) within them."""
+        def mtime(entry: str) -> Optional[int]:
+            try:
+                return os.stat(entry if entry else '.').st_mtime_ns
+            except (OSError, TypeError, ValueError):
+                return None
+
+        return tuple(mtime(entry) for entry in (path if path is not None else sys.path))
+
+    def _matches(self, origin: Optional[str]) -> bool:
+        try:
+            return self._origin_matches[origin]
+        except KeyError:
+            match = self._origin_matches[origin] = self.file_matcher.matches(origin)
+            return match
+
     def find_spec(self, fullname, path, target=None):
         if self.debug:
             print(f"Looking for {fullname}")
 
+        if sys.path != self._sys_path or sys.meta_path != self._meta_path:
+            self._not_found.clear()
+            self._sys_path = list(sys.path)
+            self._meta_path = list(sys.meta_path)
+
+        key = (fullname, tuple(path) if path is not None else None)
+        stamp = self._path_stamp(key[1])
+        if self._not_found.get(key) == stamp:
+            return None
+
         for f in sys.meta_path:
             # skip ourselves
             if isinstance(f, SlipcoverMetaPathFinder):
@@ -131,15 +195,17 @@ class SlipcoverMetaPathFinder(MetaPathFinder):
 
             # can't instrument extension files
             if isinstance(spec.loader, machinery.ExtensionFileLoader):
+                self._not_found[key] = stamp
                 return None
 
-            if self.file_matcher.matches(spec.origin):
+            if self._matches(spec.origin):
                 if self.debug:
                     print(f"instrumenting {fullname} from {spec.origin}")
                 spec.loader = SlipcoverLoader(self.sci, spec.loader, spec.origin)
 
             return spec
 
+        self._not_found[key] = stamp
         return None
 
 
@@ -170,8 +236,7 @@ def wrap_pytest(sci: Slipcover, file_matcher: FileMatcher):
 
         assert funcWrapperName not in module.__dict__, f"function {funcWrapperName} already defined"
 
-        with open(module.__file__) as f:
-            t = ast.parse(f.read())
+        t = ast.parse(sci.source_cache.get(module.__file__, module.__loader__))
 
         funcNames = set() # names of the functions we modified
         for n in ast.walk(t):
@@ -0,0 +1,138 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class DeinstrumentPolicy(ABC):
+    """Decides when probes reaching their D miss threshold trigger de-instrumentation.
+
+    A probe that sees its D miss threshold calls back into Slipcover, which reports its D misses
+    to the policy and asks it whether to de-instrument now.  If not, the probe is re-armed.
+    Changes to the threshold apply to all probes, including those already waiting.
+    """
+
+    @abstractmethod
+    def threshold(self) -> int:
+        """Returns the current D miss threshold for probes."""
+
+    def record_d_misses(self, d_misses: int) -> None:
+        """Notes that a probe reaching its threshold saw 'd_misses' D misses."""
+        pass
+
+    def should_deinstrument(self) -> bool:
+        """Returns whether a probe having reached its threshold should trigger de-instrumentation."""
+        return True
+
+    def record_sweep(self, elapsed_ns: int, lines: int) -> None:
+        """Notes that a de-instrumentation sweep took 'elapsed_ns' to process 'lines' lines/branches."""
+        pass
+
+    def stats(self) -> dict:
+        """Returns statistics on this policy's decisions."""
+        return {'policy': type(self).__name__, 'threshold': self.threshold()}
+
+
+class FixedThreshold(DeinstrumentPolicy):
+    """Always de-instruments upon reaching a fixed threshold."""
+
+    def __init__(self, threshold: int = 50):
+        self._threshold = threshold
+        self.sweeps = 0
+        self.sweep_ns = 0
+
+    def threshold(self) -> int:
+        return self._threshold
+
+    def record_sweep(self, elapsed_ns: int, lines: int) -> None:
+        self.sweeps += 1
+        self.sweep_ns += elapsed_ns
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'sweeps': self.sweeps, 'sweep_seconds': self.sweep_ns/1e9}
+
+
+class AdaptiveThreshold(DeinstrumentPolicy):
+    """Adapts the threshold to keep time spent de-instrumenting within a budget.
+
+    De-instrumentation is deferred if, based on the (exponentially averaged) cost of recent sweeps,
+    sweeping now would take more than 'max_overhead' of the time elapsed since the last sweep,
+    unless the D misses reported since (each estimated to cost 'd_miss_ns') already cost more
+    than a sweep would.  Deferrals double the threshold (up to 'max_threshold'); sweeps that are
+    cheap in comparison halve it (down to 'min_threshold'), so that hot loops are de-instrumented
+    quickly while rarely executed lines don't cause a stream of sweeps.
+    """
+
+    def __init__(self, initial: int = 50, min_threshold: int = 1, max_threshold: int = 10_000,
+                 max_overhead: float = .05, d_miss_ns: float = 50, clock=time.perf_counter_ns):
+        assert 0 <= min_threshold <= initial <= max_threshold
+        self._threshold = initial
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_overhead = max_overhead
+        self.d_miss_ns = d_miss_ns
+        self.clock = clock
+
+        self.avg_sweep_ns: Optional[float] = None
+        self.last_sweep = clock()
+
+        self.d_misses = 0               # since the last sweep
+        self.total_d_misses = 0
+
+        self.sweeps = 0
+        self.deferrals = 0
+        self.sweep_ns = 0
+        self.min_seen = self.max_seen = initial
+
+    def threshold(self) -> int:
+        return self._threshold
+
+    def _set_threshold(self, threshold: int) -> None:
+        self._threshold = max(self.min_threshold, min(self.max_threshold, threshold))
+        self.min_seen = min(self.min_seen, self._threshold)
+        self.max_seen = max(self.max_seen, self._threshold)
+
+    def record_d_misses(self, d_misses: int) -> None:
+        self.d_misses += d_misses
+        self.total_d_misses += d_misses
+
+    def should_deinstrument(self) -> bool:
+        if self.avg_sweep_ns is None:
+            return True
+
+        since_last = self.clock() - self.last_sweep
+        if self.avg_sweep_ns <= self.max_overhead * since_last:
+            return True
+
+        # D misses are coming in fast enough that they cost more than sweeping
+        if self.d_misses * self.d_miss_ns >= self.avg_sweep_ns:
+            return True
+
+        self.deferrals += 1
+        self._set_threshold(2*self._threshold)
+        return False
+
+    def record_sweep(self, elapsed_ns: int, lines: int) -> None:
+        now = self.clock()
+        since_last = now - elapsed_ns - self.last_sweep
+
+        self.avg_sweep_ns = elapsed_ns if self.avg_sweep_ns is None \
+                            else (self.avg_sweep_ns + elapsed_ns) / 2
+
+        # the sweep was cheap in comparison to the D misses it saves: de-instrument sooner
+        if elapsed_ns * 4 <= self.max_overhead * since_last:
+            self._set_threshold(self._threshold // 2)
+
+        self.last_sweep = now
+        self.d_misses = 0
+        self.sweeps += 1
+        self.sweep_ns += elapsed_ns
+
+    def stats(self) -> dict:
+        return {**super().stats(),
+                'sweeps': self.sweeps,
+                'deferrals': self.deferrals,
+                'd_misses': self.total_d_misses,
+                'sweep_seconds': self.sweep_ns/1e9,
+                'avg_sweep_seconds': (self.avg_sweep_ns or 0)/1e9,
+                'min_threshold': self.min_seen,
+                'max_threshold': self.max_seen}
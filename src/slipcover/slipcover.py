@@ -2,9 +2,17 @@ from __future__ import annotations
 import sys
 import dis
 import types
-from typing import Dict, Set, List, Tuple
-from collections import defaultdict, Counter
+import bisect
+import heapq
+import textwrap
+from typing import Dict, Set, List, Tuple, Optional, Iterable, Iterator, Union
+from collections import defaultdict, Counter, OrderedDict
+import os
 import threading
+import time
+import weakref
+import sysconfig
+import contextvars
 
 if sys.version_info[0:2] < (3,12):
     from . import probe
@@ -12,6 +20,8 @@ if sys.version_info[0:2] < (3,12):
 
 from pathlib import Path
 from . import branch as br
+from .policy import DeinstrumentPolicy, FixedThreshold
+from .contexts import CoverageContexts
 from .version import __version__
 
 # FIXME provide __all__
@@ -55,37 +65,101 @@ class PathSimplifier:
             return path 
 
 
+def to_line_ranges(lines: Iterable[int]) -> List[List[int]]:
+    """Compresses a sorted list of lines into [first, last] ranges."""
+    ranges: List[List[int]] = []
+    for line in lines:
+        if ranges and ranges[-1][1] == line-1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    return ranges
+
+
+def from_line_ranges(ranges: Iterable[List[int]]) -> List[int]:
+    """Expands [first, last] line ranges into a list of lines."""
+    return [line for first, last in ranges for line in range(first, last+1)]
+
+
+def line_count(lines: list, line_ranges: bool = False) -> int:
+    """Returns the number of lines in a list of lines or of [first, last] ranges."""
+    return sum(last-first+1 for first, last in lines) if line_ranges else len(lines)
+
+
+def _union_ranges(a: List[List[int]], b: List[List[int]]) -> List[List[int]]:
+    result: List[List[int]] = []
+    for first, last in heapq.merge(a, b):
+        if result and first <= result[-1][1]+1:
+            result[-1][1] = max(result[-1][1], last)
+        else:
+            result.append([first, last])
+    return result
+
+
+def _subtract_ranges(a: List[List[int]], b: List[List[int]]) -> List[List[int]]:
+    result: List[List[int]] = []
+    i = 0
+    for first, last in a:
+        while i < len(b) and b[i][1] < first:
+            i += 1
+
+        j = i
+        while first <= last and j < len(b) and b[j][0] <= last:
+            if b[j][0] > first:
+                result.append([first, b[j][0]-1])
+            first = max(first, b[j][1]+1)
+            j += 1
+
+        if first <= last:
+            result.append([first, last])
+    return result
+
+
 def format_missing(missing_lines: List[int], executed_lines: List[int],
-                   missing_branches: List[tuple]) -> List[str]:
+                   missing_branches: List[tuple], line_ranges: bool = False) -> List[str]:
     """Formats ranges of missing lines, including non-code (e.g., comments) ones that fall
-       between missed ones"""
+       between missed ones.  With line_ranges, lines are given as [first, last] ranges."""
+
+    if not line_ranges:
+        missing_lines = to_line_ranges(missing_lines)   # assumed sorted
+        executed_lines = to_line_ranges(executed_lines)
 
-    missing_set = set(missing_lines)
-    missing_branches = [(a,b) for a,b in missing_branches if a not in missing_set and b not in missing_set]
+    def in_ranges(ranges, starts, line):
+        i = bisect.bisect_right(starts, line)-1
+        return i >= 0 and ranges[i][1] >= line
+
+    missing_starts = [first for first, _ in missing_lines]
+    missing_branches = [(a,b) for a,b in missing_branches
+                        if not in_ranges(missing_lines, missing_starts, a) and \
+                           not in_ranges(missing_lines, missing_starts, b)]
+
+    executed_starts = [first for first, _ in executed_lines]
+    def any_executed(first, last):
+        i = bisect.bisect_right(executed_starts, last)-1
+        return i >= 0 and executed_lines[i][1] >= first
 
     def format_branch(br):
         return f"{br[0]}->exit" if br[1] == 0 else f"{br[0]}->{br[1]}"
 
     def find_ranges():
-        executed = set(executed_lines)
-        it = iter(missing_lines)    # assumed sorted
-        a = next(it, None)
-        while a is not None:
+        it = iter(missing_lines)
+        r = next(it, None)
+        while r is not None:
+            a, b = r
             while missing_branches and missing_branches[0][0] < a:
                 yield format_branch(missing_branches.pop(0))
 
-            b = a
             n = next(it, None)
             while n is not None:
-                if any(l in executed for l in range(b+1, n+1)):
+                if any_executed(b+1, n[0]):
                     break
 
-                b = n
+                b = n[1]
                 n = next(it, None)
 
             yield str(a) if a == b else f"{a}-{b}"
 
-            a = n
+            r = n
 
         while missing_branches:
             yield format_branch(missing_branches.pop(0))
@@ -93,129 +167,217 @@ def format_missing(missing_lines: List[int], executed_lines: List[int],
     return ", ".join(find_ranges())
 
 
-def print_coverage(coverage, *, outfile=sys.stdout, missing_width=None, skip_covered=False) -> None:
-    """Prints coverage information for human consumption."""
-    from tabulate import tabulate
+class _MissingWrapper(textwrap.TextWrapper):
+    """Wraps text as tabulate's maxcolwidths does.  The 'missing' column is plain ASCII,
+       so this avoids tabulate's (costly) handling of wide characters and ANSI codes."""
 
-    if not coverage.get('files', None): # includes empty coverage['files']
-        return
+    def _handle_long_word(self, reversed_chunks, cur_line, cur_len, width):
+        # like tabulate, doesn't look for hyphens when breaking long words
+        space_left = 1 if width < 1 else width - cur_len
 
-    branch_coverage = coverage.get('meta', {}).get('branch_coverage', False)
+        if self.break_long_words and space_left > 0:
+            chunk = reversed_chunks[-1]
+            cur_line.append(chunk[:space_left])
+            reversed_chunks[-1] = chunk[space_left:]
+        elif not cur_line:
+            cur_line.append(reversed_chunks.pop())
+
+
+def _table_rows(files: List[Tuple[str, dict]], branch_coverage: bool, line_ranges: bool,
+                missing_width: Optional[int], skip_covered: bool) -> List[list]:
+    """Returns print_coverage()'s table rows for the given files."""
+    wrapper = _MissingWrapper(width=missing_width) if missing_width else None
+
+    rows = []
+    for f, f_info in files:
+        exec_l = line_count(f_info['executed_lines'], line_ranges)
+        miss_l = line_count(f_info['missing_lines'], line_ranges)
+
+        if branch_coverage:
+            exec_b = len(f_info['executed_branches'])
+            miss_b = len(f_info['missing_branches'])
+            pct_b = 100*exec_b/(exec_b+miss_b) if (exec_b+miss_b) else 0
+
+        pct = f_info['summary']['percent_covered']
+
+        if skip_covered and pct == 100.0:
+            continue
+
+        missing = format_missing(f_info['missing_lines'], f_info['executed_lines'],
+                                 f_info['missing_branches'] if 'missing_branches' in f_info else [],
+                                 line_ranges=line_ranges)
+        if wrapper and not missing.isdigit():   # tabulate doesn't wrap numbers
+            missing = "\n".join(wrapper.wrap(missing))
 
-    def table():
-        for f, f_info in sorted(coverage['files'].items()):
-            exec_l = len(f_info['executed_lines'])
-            miss_l = len(f_info['missing_lines'])
+        rows.append([f, exec_l+miss_l, miss_l,
+                     *([exec_b+miss_b, miss_b, round(pct_b)] if branch_coverage else []),
+                     round(pct), missing])
 
-            if branch_coverage:
-                exec_b = len(f_info['executed_branches'])
-                miss_b = len(f_info['missing_branches'])
-                pct_b = 100*exec_b/(exec_b+miss_b) if (exec_b+miss_b) else 0
+    return rows
 
-            pct = f_info['summary']['percent_covered']
 
-            if skip_covered and pct == 100.0:
-                continue
+def _table_rows_star(args) -> List[list]:
+    return _table_rows(*args)
 
-            yield [f, exec_l+miss_l, miss_l,
-                   *([exec_b+miss_b, miss_b, round(pct_b)] if branch_coverage else []),
-                   round(pct),
-                   format_missing(f_info['missing_lines'], f_info['executed_lines'],
-                                  f_info['missing_branches'] if 'missing_branches' in f_info else [])]
 
-        if len(coverage['files']) > 1:
-            yield ['---'] + [''] * (6 if branch_coverage else 4)
+# Below this many files, starting worker processes costs more than it saves
+_PARALLEL_MIN_FILES = 2000
+
+
+def print_coverage(coverage, *, outfile=sys.stdout, missing_width=None, skip_covered=False,
+                   jobs: Optional[int] = 1) -> None:
+    """Prints coverage information for human consumption.
+
+    With jobs other than 1, the table rows for large numbers of files are generated across
+    that many worker processes (None meaning one per CPU); the output is the same.
+    """
+    from tabulate import tabulate
+
+    if not coverage.get('files', None): # includes empty coverage['files']
+        return
+
+    branch_coverage = coverage.get('meta', {}).get('branch_coverage', False)
+    line_ranges = coverage.get('meta', {}).get('line_ranges', False)
+
+    files = sorted(coverage['files'].items())
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs > 1 and len(files) >= _PARALLEL_MIN_FILES:
+        import multiprocessing
+        chunk = -(-len(files) // (4*jobs))
+        work = [(files[i:i+chunk], branch_coverage, line_ranges, missing_width, skip_covered)
+                for i in range(0, len(files), chunk)]
+        # 'spawn' because the CLI shims os.fork(); multiprocessing because this may run from atexit
+        with multiprocessing.get_context('spawn').Pool(jobs) as pool:
+            rows = [row for rows in pool.map(_table_rows_star, work) for row in rows]
+    else:
+        rows = _table_rows(files, branch_coverage, line_ranges, missing_width, skip_covered)
 
-            s = coverage['summary']
+    if len(coverage['files']) > 1:
+        rows.append(['---'] + [''] * (6 if branch_coverage else 4))
 
-            if branch_coverage:
-                exec_b = s['covered_branches']
-                miss_b = s['missing_branches']
-                pct_b = 100*exec_b/(exec_b+miss_b) if (exec_b+miss_b) else 0
+        s = coverage['summary']
 
-            yield ['(summary)', s['covered_lines']+s['missing_lines'], s['missing_lines'],
-                   *([exec_b+miss_b, miss_b, round(pct_b)] if branch_coverage else []),
-                   round(s['percent_covered']), '']
+        if branch_coverage:
+            exec_b = s['covered_branches']
+            miss_b = s['missing_branches']
+            pct_b = 100*exec_b/(exec_b+miss_b) if (exec_b+miss_b) else 0
 
+        rows.append(['(summary)', s['covered_lines']+s['missing_lines'], s['missing_lines'],
+                     *([exec_b+miss_b, miss_b, round(pct_b)] if branch_coverage else []),
+                     round(s['percent_covered']), ''])
 
 
     print("", file=outfile)
     headers = ["File", "#lines", "#l.miss",
                *(["#br.", "#br.miss", "brCov%", "totCov%"] if branch_coverage else ["Cover%"]),
                "Missing"]
-    maxcolwidths = [None] * (len(headers)-1) + [missing_width]
-    print(tabulate(table(), headers=headers, maxcolwidths=maxcolwidths), file=outfile)
+    print(tabulate(rows, headers=headers), file=outfile)
 
 
-def add_summaries(cov: dict) -> None:
-    """Adds (or updates) 'summary' entries in coverage information."""
-    # global summary
-    g_summary = defaultdict(int)
-    g_nom = g_den = 0
+def file_summary(f_cov: dict, line_ranges: bool = False) -> dict:
+    """Returns the 'summary' entry for a file's coverage information."""
+    summary = {
+        'covered_lines': line_count(f_cov['executed_lines'], line_ranges),
+        'missing_lines': line_count(f_cov['missing_lines'], line_ranges),
+    }
 
-    if 'files' in cov:
-        for f_cov in cov['files'].values():
-            summary = { # per-file summary
-                'covered_lines': len(f_cov['executed_lines']),
-                'missing_lines': len(f_cov['missing_lines']),
-            }
+    nom = summary['covered_lines']
+    den = nom + summary['missing_lines']
 
-            nom = summary['covered_lines']
-            den = nom + summary['missing_lines']
+    if 'executed_branches' in f_cov:
+        summary.update({
+            'covered_branches': len(f_cov['executed_branches']),
+            'missing_branches': len(f_cov['missing_branches'])
+        })
 
-            if 'executed_branches' in f_cov:
-                summary.update({
-                    'covered_branches': len(f_cov['executed_branches']),
-                    'missing_branches': len(f_cov['missing_branches'])
-                })
+        nom += summary['covered_branches']
+        den += summary['covered_branches'] + summary['missing_branches']
 
-                nom += summary['covered_branches']
-                den += summary['covered_branches'] + summary['missing_branches']
+    summary['percent_covered'] = 100.0 if den == 0 else 100*nom/den
+    return summary
 
-            summary['percent_covered'] = 100.0 if den == 0 else 100*nom/den
-            f_cov['summary'] = summary
 
-            for k in summary:
-                g_summary[k] += summary[k]
-            g_nom += nom
-            g_den += den
+def total_summary(summaries: Iterable[dict]) -> dict:
+    """Returns the overall 'summary' entry for the given per-file summaries."""
+    g_summary = defaultdict(int)
+    for summary in summaries:
+        for k in summary:
+            g_summary[k] += summary[k]
 
+    g_nom = g_summary.get('covered_lines', 0) + g_summary.get('covered_branches', 0)
+    g_den = g_nom + g_summary.get('missing_lines', 0) + g_summary.get('missing_branches', 0)
     g_summary['percent_covered'] = 100.0 if g_den == 0 else 100*g_nom/g_den
-    cov['summary'] = g_summary
+    return g_summary
+
+
+def add_summaries(cov: dict) -> None:
+    """Adds (or updates) 'summary' entries in coverage information."""
+    line_ranges = cov.get('meta', {}).get('line_ranges', False)
+    if 'files' in cov:
+        for f_cov in cov['files'].values():
+            f_cov['summary'] = file_summary(f_cov, line_ranges)
+
+    cov['summary'] = total_summary(f_cov['summary'] for f_cov in cov.get('files', {}).values())
 
 
 def merge_coverage(a: dict, b: dict) -> dict:
     """Merges coverage result 'b' into 'a'."""
+    return merge_coverage_files(a, b.get('meta', {}), b['files'].items())
+
+
+def merge_coverage_files(a: dict, b_meta: dict, b_files: Iterable[Tuple[str, dict]]) -> dict:
+    """Merges coverage result 'b', given as its 'meta' entry and its (file name, coverage) pairs,
+       into 'a'; 'b_files' is consumed one file at a time.
+    """
 
     if a.get('meta', {}).get('software', None) != 'slipcover':
         raise SlipcoverError('Cannot merge coverage: only SlipCover format supported.')
 
     if a.get('meta', {}).get('show_contexts', False) or \
-       b.get('meta', {}).get('show_contexts', False):
+       b_meta.get('show_contexts', False):
         raise SlipcoverError('Merging coverage with show_contexts=True unsupported')
 
     branch_coverage = a.get('meta', {}).get('branch_coverage', False)
-    if branch_coverage and not b.get('meta', {}).get('branch_coverage', False):
+    if branch_coverage and not b_meta.get('branch_coverage', False):
         raise SlipcoverError('Cannot merge coverage: branch coverage missing')
 
     a_files = a['files']
-    b_files = b['files']
-
-    def both(f, field):
-        return (a_files[f][field] if f in a_files else []) + b_files[f][field]
-
-    for f in b_files:
-        executed_lines = set(both(f, 'executed_lines'))
-        missing_lines = set(both(f, 'missing_lines'))
-        missing_lines -= executed_lines
-        update = {
-            'executed_lines': sorted(executed_lines),
-            'missing_lines': sorted(missing_lines)
-        }
+
+    # lines are merged in a's format, be it lists of lines or [first, last] ranges
+    line_ranges = a.get('meta', {}).get('line_ranges', False)
+    b_line_ranges = b_meta.get('line_ranges', False)
+
+    for f, b_f in b_files:
+        if line_ranges != b_line_ranges:
+            convert = to_line_ranges if line_ranges else from_line_ranges
+            b_f = {**b_f, 'executed_lines': convert(b_f['executed_lines']),
+                   'missing_lines': convert(b_f['missing_lines'])}
+
+        def both(field):
+            return (a_files[f][field] if f in a_files else []) + b_f[field]
+
+        if line_ranges:
+            a_f = a_files.get(f, {'executed_lines': [], 'missing_lines': []})
+            executed_lines = _union_ranges(a_f['executed_lines'], b_f['executed_lines'])
+            missing_lines = _union_ranges(a_f['missing_lines'], b_f['missing_lines'])
+            update = {
+                'executed_lines': executed_lines,
+                'missing_lines': _subtract_ranges(missing_lines, executed_lines)
+            }
+        else:
+            executed_lines = set(both('executed_lines'))
+            missing_lines = set(both('missing_lines'))
+            missing_lines -= executed_lines
+            update = {
+                'executed_lines': sorted(executed_lines),
+                'missing_lines': sorted(missing_lines)
+            }
 
         if branch_coverage:
-            executed_branches = set(tuple(br) for br in both(f, 'executed_branches'))
-            missing_branches = set(tuple(br) for br in both(f, 'missing_branches'))
+            executed_branches = set(tuple(br) for br in both('executed_branches'))
+            missing_branches = set(tuple(br) for br in both('missing_branches'))
             missing_branches -= executed_branches
             update.update({
                 'executed_branches': sorted(list(br) for br in executed_branches),
@@ -228,18 +390,248 @@ def merge_coverage(a: dict, b: dict) -> dict:
     return a
 
 
+class ThreadHitBuffers:
+    """Collects lines/branches seen into per-thread buffers, so that threads recording them
+       needn't synchronize, as is needed on free-threaded (PEP 703) builds, where we can't
+       rely on the GIL.  The buffers are drained (merged) upon request.
+
+       Only list.append/slicing/del are used on buffers shared with another thread; these are
+       atomic on both regular and free-threaded builds.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._buffers: List[Tuple[threading.Thread, list]] = []
+        self._lock = threading.Lock()
+
+
+    def _new_buffer(self) -> list:
+        buf = self._local.buffer = []
+        with self._lock:
+            self._buffers.append((threading.current_thread(), buf))
+        return buf
+
+
+    def add(self, filename: str, line_or_branch) -> None:
+        """Records a line or branch seen by the current thread."""
+        try:
+            buf = self._local.buffer
+        except AttributeError:
+            buf = self._new_buffer()
+
+        buf.append((filename, line_or_branch))
+
+
+    def drain(self) -> Dict[str, set]:
+        """Returns the lines/branches recorded since the last call, by file."""
+        newly_seen: Dict[str, set] = defaultdict(set)
+
+        with self._lock:
+            # forget buffers of threads gone (their content is drained below)
+            buffers = self._buffers
+            self._buffers = [(t, buf) for t, buf in buffers if t.is_alive()]
+
+        for _, buf in buffers:
+            # the owner thread may be appending concurrently, but only to the end
+            n = len(buf)
+            items = buf[:n]
+            del buf[:n]
+
+            for filename, line_or_branch in items:
+                newly_seen[filename].add(line_or_branch)
+
+        return newly_seen
+
+
+def _hold_lock_across_fork(sci: "Slipcover") -> None:
+    """Holds a Slipcover's lock while forking, so that a fork() while another thread holds
+       it (such as during a sweep) doesn't leave it held in the child, nor its state half updated.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+
+    # fork handlers can't be unregistered, so as not to keep the Slipcover alive
+    ref = weakref.ref(sci)
+    held = []
+
+    def before():
+        if (s := ref()) is not None:
+            s.lock.acquire()
+            held.append(s.lock)
+
+    def after():
+        while held:
+            held.pop().release()
+
+    os.register_at_fork(before=before, after_in_parent=after, after_in_child=after)
+
+
+class DeinstrumentThread:
+    """Performs de-instrumentation on a dedicated thread, so that the thread whose probe
+       reached the D miss threshold needn't wait for it.  Requests arriving while a
+       de-instrumentation is pending or in progress are coalesced."""
+
+    def __init__(self, sci: "Slipcover"):
+        self.sci = sci
+        self.cv = threading.Condition()
+        self.requests = 0   # requests received
+        self.served = 0     # requests satisfied by de-instrumentations done
+        self.sweeps = 0
+        self.running = True
+
+        self.thread = threading.Thread(target=self._run, name="SlipcoverDeinstrument", daemon=True)
+        self.thread.start()
+
+
+    def request(self) -> None:
+        """Requests a de-instrumentation."""
+        with self.cv:
+            self.requests += 1
+            self.cv.notify_all()
+
+
+    def _run(self) -> None:
+        while True:
+            with self.cv:
+                self.cv.wait_for(lambda: self.requests > self.served or not self.running)
+                if not self.running:
+                    return
+                pending = self.requests
+
+            try:
+                self.sci.deinstrument_seen()
+            except Exception as e:
+                import warnings
+                warnings.warn(f"SlipCover: error de-instrumenting: {e}", RuntimeWarning)
+
+            with self.cv:
+                self.sweeps += 1
+                self.served = pending
+                self.cv.notify_all()
+
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits for all requests made so far to be satisfied; returns False upon timeout."""
+        with self.cv:
+            target = self.requests
+            return self.cv.wait_for(lambda: self.served >= target or not self.running, timeout)
+
+
+    def stop(self) -> None:
+        """Stops the thread, abandoning any pending requests."""
+        with self.cv:
+            self.running = False
+            self.cv.notify_all()
+
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+    def stats(self) -> dict:
+        with self.cv:
+            return {'requests': self.requests, 'sweeps': self.sweeps}
+
+
+class SourceCache:
+    """Keeps the source of recently read files, so that it's read only once, whether for
+       branch pre-instrumentation, for finding the lines of files not executed, or for reports.
+       Entries are validated against the file's modification time and size, and the least
+       recently used are evicted to stay within 'max_bytes'.
+    """
+
+    def __init__(self, max_bytes: int = 32*2**20):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._cache: OrderedDict[str, Tuple[Optional[Tuple[int, int]], bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _stamp(filename: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(filename)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+
+    def get(self, filename: str, loader=None) -> bytes:
+        """Returns a file's source, reading it through the loader's get_data, if given,
+           so that it works for loaders other than from the file system (e.g., zipimport)."""
+        stamp = SourceCache._stamp(filename)
+
+        with self._lock:
+            if (entry := self._cache.get(filename)) and entry[0] == stamp:
+                self._cache.move_to_end(filename)
+                return entry[1]
+
+        if loader is not None and hasattr(loader, 'get_data'):
+            data = loader.get_data(filename)
+        else:
+            data = Path(filename).read_bytes()
+
+        with self._lock:
+            if (old := self._cache.pop(filename, None)):
+                self.total_bytes -= len(old[1])
+
+            if len(data) <= self.max_bytes:
+                self._cache[filename] = (stamp, data)
+                self.total_bytes += len(data)
+
+                while self.total_bytes > self.max_bytes:
+                    _, (_, evicted) = self._cache.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+
+        return data
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.total_bytes = 0
+
+
 class Slipcover:
     def __init__(self, immediate: bool = False,
                  d_miss_threshold: int = 50, branch: bool = False,
-                 disassemble: bool = False, source: List[str] = None):
+                 disassemble: bool = False, source: List[str] = None,
+                 deinstrument_policy: DeinstrumentPolicy = None,
+                 background_deinstrument: bool = False,
+                 per_thread_buffers: Optional[bool] = None,
+                 context_var: contextvars.ContextVar = None,
+                 only_lines: Dict[str, Set[int]] = None,
+                 source_cache: SourceCache = None):
+        # Recording coverage per context requires probes to report whenever they're reached
+        # in a context other than the last reported (or, on 3.12+, until seen in every
+        # context), so no de-instrumentation.
+        self.contexts = CoverageContexts(context_var) if context_var else None
+        if self.contexts:
+            immediate = False
+            d_miss_threshold = -2
+            deinstrument_policy = None
+            background_deinstrument = False
+
         self.immediate = immediate
         self.d_miss_threshold = d_miss_threshold
         self.branch = branch
         self.disassemble = disassemble
         self.source = source
 
+        # if given, limits instrumentation and reporting to these lines (by resolved file name)
+        self.only_lines = only_lines
+        self._only_lines_cache: Dict[str, Optional[set]] = dict()
+
+        # source read for instrumentation, kept for reuse
+        self.source_cache = source_cache if source_cache is not None else SourceCache()
+
+        # decides when D misses trigger de-instrumentation
+        if deinstrument_policy is None:
+            deinstrument_policy = FixedThreshold(d_miss_threshold)
+        self.deinstrument_policy = deinstrument_policy
+
         # mutex protecting this state
         self.lock = threading.RLock()
+        _hold_lock_across_fork(self)
 
         # notes which code lines have been instrumented
         self.code_lines: Dict[str, set] = defaultdict(set)
@@ -248,32 +640,120 @@ class Slipcover:
         # notes which lines and branches have been seen.
         self.all_seen: Dict[str, set] = defaultdict(set)
 
+        # once get_delta() is first called, notes what was found (code) and seen since
+        self._delta: Optional[Dict[str, Tuple[set, set]]] = None
+
+        # On free-threaded builds, record lines/branches seen in per-thread buffers.
+        # Only sys.monitoring (3.12+) supports that; probes record to self.newly_seen.
+        if per_thread_buffers is None:
+            per_thread_buffers = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+        self.thread_buffers = ThreadHitBuffers() if per_thread_buffers and \
+                                                    sys.version_info[0:2] >= (3,12) else None
+
         # notes lines/branches seen since last de-instrumentation
         self._get_newly_seen()
 
+        if self.contexts:
+            # Probes record directly to contexts
+            self.newly_seen = self.contexts
+
         if sys.version_info[0:2] >= (3,12):
-            def handle_line(code, line):
-                if br.is_branch(line):
-                    self.newly_seen[code.co_filename].add(br.decode_branch(line))
-                elif line:
-                    self.newly_seen[code.co_filename].add(line)
-                return sys.monitoring.DISABLE
+            if self.contexts:
+                contexts = self.contexts
+
+                # Lines/branches are only disabled once seen in every context known; when a new
+                # context shows up, all are re-enabled so as to detect them for that context.
+                # Since the lines executed in a new context may already be disabled, we also
+                # check for new contexts as functions start.  sys.monitoring can only re-enable
+                # disabled events all at once, so the restart is global; CoverageContexts bounds
+                # the number of contexts, and with them, of restarts.
+                def handle_line(code, line):
+                    if br.is_branch(line):
+                        line = br.decode_branch(line)
+                    elif not line:
+                        return sys.monitoring.DISABLE
+
+                    n_contexts = len(contexts.seen)
+                    seen_in_all = contexts.add(code.co_filename, line)
+                    if len(contexts.seen) != n_contexts:
+                        sys.monitoring.restart_events()
+
+                    return sys.monitoring.DISABLE if seen_in_all else None
+
+                def handle_start(code, offset):
+                    if contexts.check_new_context():
+                        sys.monitoring.restart_events()
+
+                sys.monitoring.register_callback(sys.monitoring.COVERAGE_ID,
+                                                 sys.monitoring.events.PY_START, handle_start)
+
+            elif self.thread_buffers:
+                add = self.thread_buffers.add
+
+                # Returning DISABLE is safe without the GIL, as the interpreter "stops the world"
+                # to change instrumentation; we never replace code objects on 3.12+.
+                def handle_line(code, line):
+                    if br.is_branch(line):
+                        add(code.co_filename, br.decode_branch(line))
+                    elif line:
+                        add(code.co_filename, line)
+                    return sys.monitoring.DISABLE
+            else:
+                def handle_line(code, line):
+                    if br.is_branch(line):
+                        self.newly_seen[code.co_filename].add(br.decode_branch(line))
+                    elif line:
+                        self.newly_seen[code.co_filename].add(line)
+                    return sys.monitoring.DISABLE
 
             if sys.monitoring.get_tool(sys.monitoring.COVERAGE_ID) != "SlipCover":
                 sys.monitoring.use_tool_id(sys.monitoring.COVERAGE_ID, "SlipCover") # FIXME add free_tool_id
 
             sys.monitoring.register_callback(sys.monitoring.COVERAGE_ID,
                                              sys.monitoring.events.LINE, handle_line)
+
+            # notes the (top-level) code objects instrumented, by file
+            self.instrumented: Dict[str, set] = defaultdict(set)
         else:
             # maps to guide CodeType replacements
             self.replace_map: Dict[types.CodeType, types.CodeType] = dict()
             self.instrumented: Dict[str, set] = defaultdict(set)
 
+            # the original code for each (top-level) code object in self.instrumented
+            self.original_code: Dict[types.CodeType, types.CodeType] = dict()
+
+            # the D miss threshold shared by all probes, following the policy's
+            self.d_miss_threshold_cell = probe.new_threshold(self.deinstrument_policy.threshold())
+
+            # counts files de-instrumented upon having been completely covered
+            self.files_completed = 0
+
             # provides an index (line_or_branch -> offset) for each code object
             self.code2index: Dict[types.CodeType, list] = dict()
 
+            # the code objects in code2index, by file, so that a file's can be dropped together
+            self.indexed_code: Dict[str, list] = defaultdict(list)
+
+            # Instrumented code for code objects already seen, along with their lines and branches,
+            # so that identical code (e.g., generated by exec) is only instrumented once.  Code
+            # objects compare by content (except for file name), including their constants.
+            # Entries are also indexed by their instrumented code, to follow de-instrumentation.
+            self.code_memo: Dict[tuple, list] = dict()
+            self.code_memo_by_code: Dict[types.CodeType, list] = dict()
+            self.code_memo_keys: Dict[str, list] = defaultdict(list)    # by file
+            self.code_memo_hits = 0
+            self.code_memo_misses = 0
+
+        # original code for files de-instrumented with deinstrument_file(), by file
+        self.deinstrumented_files: Dict[str, list] = dict()
+
         self.modules = []
 
+        # performs de-instrumentation off the application threads, if requested
+        self.deinstrument_thread = DeinstrumentThread(self) \
+                                   if background_deinstrument and not immediate and \
+                                      sys.version_info[0:2] < (3,12) else None
+
     def _get_newly_seen(self):
         """Returns the current set of ``new'' lines, leaving a new container in place."""
 
@@ -282,10 +762,21 @@ class Slipcover:
         # C extensions' atomicity for updates within self.newly_seen.  The lock here
         # is just to protect callers of this method (so that the exchange is atomic).
 
+        # Without the GIL, that trust is misplaced: per-thread buffers are used instead,
+        # and merged here.
+
+        if self.contexts:
+            # self.contexts records (and keeps) everything seen
+            return defaultdict(set)
+
         with self.lock:
             newly_seen = self.newly_seen if hasattr(self, "newly_seen") else None
             self.newly_seen: Dict[str, set] = defaultdict(set)
 
+            if self.thread_buffers and newly_seen is not None:
+                for file, seen in self.thread_buffers.drain().items():
+                    newly_seen[file].update(seen)
+
         return newly_seen
 
 
@@ -329,6 +820,48 @@ class Slipcover:
                 yield co.co_consts[br_index]
 
 
+    def _only_lines_for(self, filename: str) -> Optional[set]:
+        """Returns the lines to which to limit instrumentation in a file, or None for no limits."""
+        if self.only_lines is None:
+            return None
+
+        if (only := self._only_lines_cache.get(filename)) is None:
+            only = self._only_lines_cache[filename] = \
+                self.only_lines.get(str(Path(filename).resolve()), set())
+
+        return only
+
+
+    def _restrict(self, filename: str, lines_or_branches: Iterable) -> Iterable:
+        """Restricts lines (or branches, by their source line) to those in only_lines, if given."""
+        only = self._only_lines_for(filename)
+        if only is None:
+            return lines_or_branches
+
+        return (x for x in lines_or_branches if (x[0] if isinstance(x, tuple) else x) in only)
+
+
+    def _record_code(self, filename: str, lines: Iterable[int], branches: Iterable[Tuple[int, int]]) -> None:
+        """Records the lines and branches found while instrumenting a module (or function)."""
+        with self.lock:
+            lines = set(self._restrict(filename, lines))
+            branches = set(self._restrict(filename, branches))
+            self.code_lines[filename].update(lines)
+            self.code_branches[filename].update(branches)
+
+            if self._delta is not None:
+                self._delta[filename][0].update(lines, branches)
+
+
+    def _add_seen(self, newly_seen: Dict[str, set]) -> None:
+        """Adds lines and branches newly seen to those seen; must be called with the lock held."""
+        for file, new_set in newly_seen.items():
+            self.all_seen[file].update(new_set)
+
+            if self._delta is not None:
+                self._delta[file][1].update(new_set)
+
+
     if sys.version_info[0:2] >= (3,12):
         def instrument(self, co: types.CodeType, parent: types.CodeType = 0) -> types.CodeType:
             """Instruments a code object for coverage detection.
@@ -340,21 +873,42 @@ class Slipcover:
                 co = co.__code__
 
             assert isinstance(co, types.CodeType)
+
+            # lines and branches are collected while instrumenting, rather than walking again
+            lines: List[int] = []
+            branches: List[Tuple[int, int]] = []
+            self._instrument(co, lines, branches)
+
+            if not parent:
+                self._record_code(co.co_filename, lines, branches)
+                with self.lock:
+                    self.instrumented[co.co_filename].add(co)
+
+            return co
+
+
+        def _instrument(self, co: types.CodeType, lines: List[int], branches: List[Tuple[int, int]]) -> None:
             # print(f"instrumenting {co.co_name}")
 
-            sys.monitoring.set_local_events(sys.monitoring.COVERAGE_ID, co, sys.monitoring.events.LINE)
+            co_lines = [line for _, line in findlinestarts(co)]
+            co_branches = [br.decode_branch(line) for line in co_lines if br.is_branch(line)]
+            if co_branches:
+                co_lines = [line for line in co_lines if not br.is_branch(line)]
+
+            only = self._only_lines_for(co.co_filename)
+            if only is None or any(line in only for line in co_lines) or \
+               any(branch[0] in only for branch in co_branches):
+                sys.monitoring.set_local_events(sys.monitoring.COVERAGE_ID, co,
+                                                sys.monitoring.events.LINE | \
+                                                (sys.monitoring.events.PY_START if self.contexts else 0))
 
             # handle functions-within-functions
             for c in co.co_consts:
                 if isinstance(c, types.CodeType):
-                    self.instrument(c, co)
+                    self._instrument(c, lines, branches)
 
-            if not parent:
-                with self.lock:
-                    self.code_lines[co.co_filename].update(Slipcover.lines_from_code(co))
-                    self.code_branches[co.co_filename].update(Slipcover.branches_from_code(co))
-
-            return co
+            lines.extend(co_lines)
+            branches.extend(co_branches)
 
     else:
         def instrument(self, co: types.CodeType, parent: types.CodeType = 0) -> types.CodeType:
@@ -368,6 +922,50 @@ class Slipcover:
                 return co.__code__
 
             assert isinstance(co, types.CodeType)
+
+            # lines and branches are collected while instrumenting, rather than walking again
+            lines: List[int] = []
+            branches: List[Tuple[int, int]] = []
+            new_code = self._instrument(co, lines, branches)
+
+            if not parent:
+                self._record_code(co.co_filename, lines, branches)
+
+                if new_code is not co:
+                    with self.lock:
+                        self.instrumented[co.co_filename].add(new_code)
+                        self.original_code[new_code] = co
+
+            return new_code
+
+
+        def _instrument(self, co: types.CodeType, lines: List[int], branches: List[Tuple[int, int]]) -> types.CodeType:
+            memo_key = (co, co.co_filename, getattr(co, 'co_qualname', None))
+            if (memo := self.code_memo.get(memo_key)) is not None:
+                self.code_memo_hits += 1
+                new_code, memo_lines, memo_branches = memo
+                lines.extend(memo_lines)
+                branches.extend(memo_branches)
+                return new_code
+
+            self.code_memo_misses += 1
+            lines_start, branches_start = len(lines), len(branches)
+            new_code = self._instrument_code(co, lines, branches)
+
+            memo = [new_code, lines[lines_start:], branches[branches_start:]]
+            with self.lock:
+                # another thread may have instrumented the same code meanwhile; keep its entry
+                if (other := self.code_memo.get(memo_key)) is not None:
+                    return other[0]
+
+                self.code_memo[memo_key] = memo
+                self.code_memo_by_code[new_code] = memo
+                self.code_memo_keys[co.co_filename].append(memo_key)
+
+            return new_code
+
+
+        def _instrument_code(self, co: types.CodeType, lines: List[int], branches: List[Tuple[int, int]]) -> types.CodeType:
             # print(f"instrumenting {co.co_name}")
 
             ed = bc.Editor(co)
@@ -375,20 +973,33 @@ class Slipcover:
             # handle functions-within-functions
             for i, c in enumerate(co.co_consts):
                 if isinstance(c, types.CodeType):
-                    ed.set_const(i, self.instrument(c, co))
-
-            probe_signal_index = ed.add_const(probe.signal)
+                    if (nc := self._instrument(c, lines, branches)) is not c:
+                        ed.set_const(i, nc)
 
             off_list = list(findlinestarts(co))
+            lines.extend(line for _, line in off_list)
             if self.branch:
-                off_list.extend(list(ed.find_const_assignments(br.BRANCH_NAME)))
+                br_list = list(ed.find_const_assignments(br.BRANCH_NAME))
+                branches.extend(co.co_consts[br_index] for _, _, br_index in br_list)
+
+                off_list.extend(br_list)
                 # sort line probes (2-tuples) before branch probes (3-tuples) because
                 # line probes don't overwrite bytecode like branch probes do, so if there
                 # are two being inserted at the same offset, the accumulated offset 'delta' applies
                 off_list.sort(key = lambda x: (x[0], len(x)))
 
+            if (only := self._only_lines_for(co.co_filename)) is not None:
+                off_list = [item for item in off_list
+                            if (item[1] if len(item) == 2 else co.co_consts[item[2]][0]) in only]
+
+                if not off_list and ed.consts is None:
+                    # nothing to instrument here, nor in any nested code
+                    return co
+
             insert_labels = []
             probes = []
+            d_miss_threshold = self.d_miss_threshold_cell
+            context_var = self.contexts.var if self.contexts else None
 
             delta = 0
             for off_item in off_list:
@@ -402,11 +1013,11 @@ class Slipcover:
 
                     insert_labels.append(lineno)
 
-                    tr = probe.new(self, co.co_filename, lineno, self.d_miss_threshold)
+                    tr = probe.new(self, co.co_filename, lineno, d_miss_threshold, context_var)
                     probes.append(tr)
-                    tr_index = ed.add_const(tr)
+                    tr_index = ed.add_const(probe.bind(tr))
 
-                    delta += ed.insert_function_call(offset+delta, probe_signal_index, (tr_index,))
+                    delta += ed.insert_function_call(offset+delta, tr_index, ())
 
                 else: # from find_const_assignments
                     begin_off, end_off, branch_index = off_item
@@ -414,11 +1025,11 @@ class Slipcover:
 
                     insert_labels.append(branch)
 
-                    tr = probe.new(self, co.co_filename, branch, self.d_miss_threshold)
+                    tr = probe.new(self, co.co_filename, branch, d_miss_threshold, context_var)
                     probes.append(tr)
-                    ed.set_const(branch_index, tr)
+                    ed.set_const(branch_index, probe.bind(tr))
 
-                    delta += ed.insert_function_call(begin_off+delta, probe_signal_index, (branch_index,),
+                    delta += ed.insert_function_call(begin_off+delta, branch_index, (),
                                                      repl_length = end_off-begin_off)
 
             ed.add_const('__slipcover__')  # mark instrumented
@@ -432,20 +1043,15 @@ class Slipcover:
                 dis.dis(new_code)
 
             if self.immediate:
+                # 3.11+ executes an adaptive copy of the bytecode, held within the code object
+                code_bytes = new_code if sys.version_info[0:2] >= (3,11) else new_code.co_code
                 for tr, off in zip(probes, ed.get_inserts()):
-                    probe.set_immediate(tr, new_code.co_code, off)
+                    probe.set_immediate(tr, code_bytes, off)
             else:
                 index = list(zip(ed.get_inserts(), insert_labels))
-
-            with self.lock:
-                if not parent:
-                    self.code_lines[co.co_filename].update(Slipcover.lines_from_code(co))
-                    self.code_branches[co.co_filename].update(Slipcover.branches_from_code(co))
-
-                    self.instrumented[co.co_filename].add(new_code)
-
-                if not self.immediate:
+                with self.lock:
                     self.code2index[new_code] = index
+                    self.indexed_code[co.co_filename].append(new_code)
 
             return new_code
 
@@ -465,6 +1071,9 @@ class Slipcover:
         assert isinstance(co, types.CodeType)
         # print(f"de-instrumenting {co.co_name}")
 
+        if co not in self.code2index:
+            return co   # not instrumented (see only_lines)
+
         ed = bc.Editor(co)
 
         co_consts = co.co_consts
@@ -478,24 +1087,31 @@ class Slipcover:
 
         for (offset, lineno) in index:
             if lineno in lines and (func := ed.get_inserted_function(offset)):
-                func_index, func_arg_index, *_ = func
-                if co_consts[func_index] == probe.signal:
-                    probe.mark_removed(co_consts[func_arg_index])
+                func_index, *_ = func
+                if probe.is_bound(co_consts[func_index]):
+                    probe.mark_removed(co_consts[func_index].__self__)
                     ed.disable_inserted_function(offset)
 
         new_code = ed.finish()
         if new_code is co:
             return co
 
-        # no offsets changed, so the old code's index is still usable
-        self.code2index[new_code] = index
-
         with self.lock:
+            # no offsets changed, so the old code's index is still usable
+            self.code2index[new_code] = index
+            self.indexed_code[co.co_filename].append(new_code)
+
             self.replace_map[co] = new_code
 
+            # identical code instrumented later should get the de-instrumented version
+            if (memo := self.code_memo_by_code.pop(co, None)) is not None:
+                memo[0] = new_code
+                self.code_memo_by_code[new_code] = memo
+
             if co in self.instrumented[co.co_filename]:
                 self.instrumented[co.co_filename].remove(co)
                 self.instrumented[co.co_filename].add(new_code)
+                self.original_code[new_code] = self.original_code.pop(co)
 
         return new_code
 
@@ -515,21 +1131,25 @@ class Slipcover:
                     file = file.absolute()
                     filename = str(file)
                     try:
-                        if filename not in self.code_lines:
-                            t = ast.parse(file.read_text())
+                        if filename not in self.code_lines and self._only_lines_for(filename) != set():
+                            t = ast.parse(self.source_cache.get(filename))
                             if self.branch:
                                 t = br.preinstrument(t)
                             code = compile(t, filename, "exec")
-                            self.code_lines[filename] = set(Slipcover.lines_from_code(code))
+                            self.code_lines[filename] = set(self._restrict(filename, Slipcover.lines_from_code(code)))
                             if self.branch:
-                                self.code_branches[filename] = set(Slipcover.branches_from_code(code))
+                                self.code_branches[filename] = set(self._restrict(filename, Slipcover.branches_from_code(code)))
+
+                            if self._delta is not None:
+                                self._delta[filename][0].update(self.code_lines[filename],
+                                                                self.code_branches[filename])
 
                     except Exception as e: # for SyntaxError and such... FIXME curate list and catch only those
                         print(f"Warning: unable to include {filename}: {e}")
 
 
     @staticmethod
-    def _make_meta(branch_coverage: bool) -> dict:
+    def _make_meta(branch_coverage: bool, show_contexts: bool = False) -> dict:
         import datetime
 
         return {
@@ -537,54 +1157,124 @@ class Slipcover:
             'version': __version__,
             'timestamp': datetime.datetime.now().isoformat(),
             'branch_coverage': branch_coverage,
-            'show_contexts': False
+            'show_contexts': show_contexts
         }
 
 
+    def get_meta(self) -> dict:
+        """Returns the 'meta' entry describing the coverage collected."""
+        return Slipcover._make_meta(self.branch, bool(self.contexts))
+
+
     def signal_child_process(self):
         self.source = None  # only the parent process needs to run _add_unseen_source_files
+
+        # threads don't survive fork(), so start a new one
+        if self.deinstrument_thread:
+            self.deinstrument_thread = DeinstrumentThread(self)
+
         with self.lock:
             self._get_newly_seen()
             self.all_seen.clear()
+            self._delta = None
+            if self.contexts:
+                self.contexts.clear()
 
 
-    def get_coverage(self):
-        """Returns coverage information collected."""
+    def _file_coverage(self, f: str) -> dict:
+        """Returns the coverage information for a file; must be called with the lock held."""
+        f_code_lines = self.code_lines[f]
+        if f in self.all_seen:
+            branches_seen = {x for x in self.all_seen[f] if isinstance(x, tuple)}
+            lines_seen = self.all_seen[f] - branches_seen
+        else:
+            lines_seen = branches_seen = set()
+
+        if self.only_lines is not None:
+            lines_seen &= f_code_lines
+            branches_seen &= self.code_branches[f]
+
+        f_files = {
+            'executed_lines': sorted(lines_seen),
+            'missing_lines': sorted(f_code_lines - lines_seen),
+        }
+
+        if self.branch:
+            f_files['executed_branches'] = sorted(branches_seen)
+            f_files['missing_branches'] = sorted(self.code_branches[f] - branches_seen)
+
+        if self.contexts:
+            f_files['contexts'] = self.contexts.line_contexts(f)
+
+        f_files['summary'] = file_summary(f_files)
+        return f_files
+
+
+    def iter_file_coverage(self) -> Iterator[Tuple[str, dict]]:
+        """Yields (file name, coverage information) for each file, as found in the
+           'files' entry of get_coverage(), but one file at a time.
+        """
 
         with self.lock:
             # FIXME calling _get_newly_seen will prevent de-instrumentation if still running!
-            newly_seen = self._get_newly_seen()
+            self._add_seen(self._get_newly_seen())
 
-            for file, lines in newly_seen.items():
-                self.all_seen[file].update(lines)
+            if self.contexts:
+                self._add_seen(self.contexts.files())
 
             if self.source:
                 self._add_unseen_source_files()
 
-            simp = PathSimplifier()
+            filenames = list(self.code_lines)
 
-            files = dict()
-            for f, f_code_lines in self.code_lines.items():
-                if f in self.all_seen:
-                    branches_seen = {x for x in self.all_seen[f] if isinstance(x, tuple)}
-                    lines_seen = self.all_seen[f] - branches_seen
-                else:
-                    lines_seen = branches_seen = set()
+        simp = PathSimplifier()
+        for f in filenames:
+            with self.lock:
+                f_files = self._file_coverage(f)
 
-                f_files = {
-                    'executed_lines': sorted(lines_seen),
-                    'missing_lines': sorted(f_code_lines - lines_seen),
-                }
+            yield simp.simplify(f), f_files
+
+
+    def get_delta(self, add_unseen_source: bool = False) -> Dict[str, Tuple[set, set]]:
+        """Returns what changed since the previous call, as {file name: (lines and branches
+           found, lines and branches seen)}; the first call returns everything so far.
+
+           As in all_seen, lines are ints and branches (from, to) tuples.  If add_unseen_source
+           is set, files in the source directories not yet imported are also included.
+        """
+        if self.contexts:
+            raise SlipcoverError('Coverage deltas unsupported when recording contexts')
+
+        with self.lock:
+            newly_seen = self._get_newly_seen()
+            if sys.version_info[0:2] >= (3,12) or self.immediate or not any(newly_seen.values()):
+                self._add_seen(newly_seen)
+            else:
+                # de-instrument what's new, as it is taken from under the sweeps; when idle,
+                # this doesn't sweep, so that periodic calls don't add sweeps of their own
+                self._deinstrument_seen(newly_seen)
+
+            if add_unseen_source and self.source:
+                self._add_unseen_source_files()
+
+            if self._delta is None:
+                delta = {f: (self.code_lines.get(f, set()) | self.code_branches.get(f, set()),
+                             set(self.all_seen.get(f, ())))
+                         for f in set(self.code_lines) | set(self.all_seen)}
+            else:
+                delta = dict(self._delta)
 
-                if self.branch:
-                    f_files['executed_branches'] = sorted(branches_seen)
-                    f_files['missing_branches'] = sorted(self.code_branches[f] - branches_seen)
+            self._delta = defaultdict(lambda: (set(), set()))
+            return delta
 
-                files[simp.simplify(f)] = f_files
 
+    def get_coverage(self):
+        """Returns coverage information collected."""
+
+        with self.lock:
             cov = {
-                'meta': Slipcover._make_meta(self.branch),
-                'files': files
+                'meta': self.get_meta(),
+                'files': dict(self.iter_file_coverage())
             }
 
             add_summaries(cov)
@@ -644,41 +1334,239 @@ class Slipcover:
         self.modules.append(m)
 
 
-    def deinstrument_seen(self) -> None:
+    def d_miss_threshold_reached(self, d_misses: int = 0) -> Optional[int]:
+        """Invoked by a probe upon reaching its D miss threshold, having seen 'd_misses' D misses.
+
+        Returns None if de-instrumentation took place, or a new threshold for the probe
+        to wait for if the policy deferred it.
+        """
+        if self.deinstrument_thread:
+            # don't wait for self.lock, which an ongoing de-instrumentation may be holding;
+            # the thread will coalesce requests, so we don't consult the policy
+            self.deinstrument_thread.request()
+            return None
+
         with self.lock:
-            newly_seen = self._get_newly_seen()
+            self.deinstrument_policy.record_d_misses(d_misses)
+            if self.deinstrument_policy.should_deinstrument():
+                self.deinstrument_seen()
+                return None
+
+            self._update_threshold()
+            return max(1, self.deinstrument_policy.threshold())
+
+
+    def _update_threshold(self) -> None:
+        """Passes the policy's current threshold on to the probes already in place."""
+        probe.set_threshold(self.d_miss_threshold_cell, self.deinstrument_policy.threshold())
+
+
+    def _is_complete(self, filename: str) -> bool:
+        """Returns whether all lines and branches found in a file have been seen."""
+        seen = self.all_seen.get(filename, set())
+        return self.code_lines.get(filename, set()) <= seen and \
+               self.code_branches.get(filename, set()) <= seen
+
+
+    def _file_name(self, file: Union[str, Path, types.ModuleType]) -> str:
+        """Returns the name under which a file (or a module's file) is instrumented."""
+        if isinstance(file, types.ModuleType):
+            if getattr(file, '__file__', None) is None:
+                raise SlipcoverError(f'Module {file.__name__} has no file')
+            file = file.__file__
+
+        filename = str(file)
+        if not self.instrumented.get(filename) and filename not in self.deinstrumented_files:
+            filename = str(Path(filename).resolve())
+
+        return filename
+
+
+    if sys.version_info[0:2] < (3,12):
+        def _map_code(self, old: types.CodeType, new: types.CodeType) -> None:
+            """Directs code, and the code nested within it, to be replaced; must be called with the lock held."""
+            self.replace_map[old] = new
+
+            # instrumentation leaves existing constants in place, so nested code lines up
+            for c, nc in zip(old.co_consts, new.co_consts):
+                if isinstance(c, types.CodeType) and isinstance(nc, types.CodeType) and c is not nc:
+                    self._map_code(c, nc)
+
+
+    def deinstrument_file(self, file: Union[str, Path, types.ModuleType]) -> bool:
+        """Restores the original code of a file (or module) instrumented, no longer measuring its
+           coverage until re-instrumented with reinstrument_file().  Returns whether it was instrumented.
+
+           As with de-instrumentation, functions are switched over to the original code where
+           they can be found (in registered modules and on the stack); code already running
+           continues to be measured.
+        """
+        with self.lock:
+            if not self._deinstrument_file(self._file_name(file)):
+                return False
+
+            if sys.version_info[0:2] < (3,12):
+                self._replace_code()
+
+            return True
+
+
+    def _deinstrument_file(self, filename: str) -> bool:
+        """Implements deinstrument_file(), but (on 3.11 and older) leaves replacing references to
+           code in replace_map to the caller; must be called with the lock held.
+        """
+        if not (codes := self.instrumented.pop(filename, None)):
+            return False
+
+        if sys.version_info[0:2] >= (3,12):
+            def disable(co):
+                sys.monitoring.set_local_events(sys.monitoring.COVERAGE_ID, co, 0)
+                for c in co.co_consts:
+                    if isinstance(c, types.CodeType):
+                        disable(c)
+
+            for co in codes:
+                disable(co)
+
+            self.deinstrumented_files[filename] = list(codes)
+            return True
 
-            for file, new_set in newly_seen.items():
-                for co in self.instrumented[file]:
-                    self.deinstrument(co, new_set)
+        originals = []
+        for co in codes:
+            original = self.original_code.pop(co)
+            self._map_code(co, original)
+            originals.append(original)
+
+        self.deinstrumented_files[filename] = originals
+
+        # drop the file's instrumented code (along with its probes), including versions
+        # superseded by de-instrumentation
+        for co in self.indexed_code.pop(filename, ()):
+            self.code2index.pop(co, None)
+
+        # so that the file's code is instrumented afresh if re-instrumented (or reloaded)
+        for key in self.code_memo_keys.pop(filename, ()):
+            self.code_memo_by_code.pop(self.code_memo.pop(key)[0], None)
+
+        return True
+
+
+    def reinstrument_file(self, file: Union[str, Path, types.ModuleType]) -> bool:
+        """Instruments again a file (or module) de-instrumented with deinstrument_file(), resuming
+           the measurement of its coverage.  Returns whether it had been de-instrumented.
+        """
+        with self.lock:
+            filename = self._file_name(file)
+            if (originals := self.deinstrumented_files.pop(filename, None)) is None:
+                return False
+
+            if self.instrumented.get(filename):
+                return True     # instrumented again since, as by reloading it
+
+            for original in originals:
+                new_code = self.instrument(original)
+
+                if sys.version_info[0:2] < (3,12):
+                    # lines already seen needn't be measured again
+                    if not self.immediate and (seen := self.all_seen.get(filename)):
+                        new_code = self.deinstrument(new_code, seen)
+
+                    self._map_code(original, new_code)
+
+            if sys.version_info[0:2] < (3,12):
+                self._replace_code()
+
+            return True
+
+
+    def get_stats(self) -> dict:
+        """Returns statistics about this Slipcover's operation."""
+        with self.lock:
+            stats = {
+                'deinstrument': self.deinstrument_policy.stats()
+            }
+
+            if self.deinstrument_thread:
+                stats['deinstrument_thread'] = self.deinstrument_thread.stats()
+
+            if sys.version_info[0:2] < (3,12):
+                stats['files_completed'] = self.files_completed
+
+                lookups = self.code_memo_hits + self.code_memo_misses
+                stats['code_memo'] = {
+                    'hits': self.code_memo_hits,
+                    'misses': self.code_memo_misses,
+                    'hit_rate': self.code_memo_hits / lookups if lookups else 0.0
+                }
+
+            return stats
+
+
+    def _replace_code(self) -> None:
+        """Replaces references to code, as directed by replace_map; must be called with the lock held."""
+        if not self.replace_map:
+            return
+
+        def replace(f):
+            # follows replacements of replacements, as when code de-instrumented in this
+            # sweep is then restored; code objects compare equal regardless of their file name
+            code = f.__code__
+            while (new_code := self.replace_map.get(code)) is not None and \
+                  new_code.co_filename == code.co_filename:
+                code = new_code
+
+            if code is not f.__code__:
+                f.__code__ = code
+
+        visited = set()
+
+        # XXX the set of function objects could be pre-computed at register_module;
+        # also, the same could be done for functions objects in globals()
+        for m in self.modules:
+            for f in Slipcover.find_functions(m.__dict__.values(), visited):
+                replace(f)
+
+        globals_seen = []
+        for frame in sys._current_frames().values():
+            while frame:
+                if not frame.f_globals in globals_seen:
+                    globals_seen.append(frame.f_globals)
+                    for f in Slipcover.find_functions(frame.f_globals.values(), visited):
+                        replace(f)
+
+                for f in Slipcover.find_functions(frame.f_locals.values(), visited):
+                    replace(f)
+
+                frame = frame.f_back
+
+        # all references should have been replaced now... right?
+        self.replace_map.clear()
+
+
+    def deinstrument_seen(self) -> None:
+        with self.lock:
+            self._deinstrument_seen(self._get_newly_seen())
 
-                self.all_seen[file].update(new_set)
 
-            # Replace references to code
-            if self.replace_map:
-                visited = set()
+    def _deinstrument_seen(self, newly_seen: Dict[str, set]) -> None:
+        """De-instruments lines and branches newly seen; must be called with the lock held."""
+        begin = time.perf_counter_ns()
 
-                # XXX the set of function objects could be pre-computed at register_module;
-                # also, the same could be done for functions objects in globals()
-                for m in self.modules:
-                    for f in Slipcover.find_functions(m.__dict__.values(), visited):
-                        if f.__code__ in self.replace_map:
-                            f.__code__ = self.replace_map[f.__code__]
+        for file, new_set in newly_seen.items():
+            for co in self.instrumented[file]:
+                self.deinstrument(co, new_set)
 
-                globals_seen = []
-                for frame in sys._current_frames().values():
-                    while frame:
-                        if not frame.f_globals in globals_seen:
-                            globals_seen.append(frame.f_globals)
-                            for f in Slipcover.find_functions(frame.f_globals.values(), visited):
-                                if f.__code__ in self.replace_map:
-                                    f.__code__ = self.replace_map[f.__code__]
+        self._add_seen(newly_seen)
 
-                        for f in Slipcover.find_functions(frame.f_locals.values(), visited):
-                            if f.__code__ in self.replace_map:
-                                f.__code__ = self.replace_map[f.__code__]
+        # Files whose lines and branches have all been seen get their original code back,
+        # so that they no longer hold probes nor take part in these sweeps
+        for file in newly_seen:
+            if self.instrumented.get(file) and self._is_complete(file):
+                self._deinstrument_file(file)
+                self.files_completed += 1
 
-                        frame = frame.f_back
+        self._replace_code()
 
-                # all references should have been replaced now... right?
-                self.replace_map.clear()
+        self.deinstrument_policy.record_sweep(time.perf_counter_ns() - begin,
+                                              sum(len(new_set) for new_set in newly_seen.values()))
+        self._update_threshold()
@@ -0,0 +1,115 @@
+import pytest
+import asyncio
+import contextvars
+import slipcover.contexts as ctx
+
+
+def test_contexts_add():
+    var = contextvars.ContextVar("test_var", default="x")
+    c = ctx.CoverageContexts(var)
+
+    assert c.add("foo.py", 1)           # only one context known
+    assert c.add("foo.py", 1)
+
+    with ctx.coverage_context("y", var):
+        assert not c.add("foo.py", 2)   # not seen in "x"
+        assert c.add("foo.py", 1)
+        c["foo.py"].add(3)              # as probes do
+
+    assert not c.add("foo.py", 3)
+    assert c.add("foo.py", 2)
+
+    assert {"foo.py": {1, 2, 3}} == c.files()
+    assert {"1": ["x", "y"], "2": ["x", "y"], "3": ["x", "y"]} == c.line_contexts("foo.py")
+
+
+def test_contexts_var_without_default():
+    var = contextvars.ContextVar("test_var")
+    c = ctx.CoverageContexts(var)
+
+    c.add("foo.py", (1, 2))
+    c.add("foo.py", 1)
+
+    assert {"1": [""]} == c.line_contexts("foo.py")   # branches not included
+    assert {"foo.py": {1, (1, 2)}} == c.files()
+
+
+def test_asgi_middleware():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(ctx.current_context.get())
+
+    mw = ctx.ASGIContextMiddleware(app)
+
+    asyncio.run(mw({'type': 'http', 'method': 'GET', 'path': '/foo'}, None, None))
+    asyncio.run(mw({'type': 'lifespan'}, None, None))
+
+    mw = ctx.ASGIContextMiddleware(app, get_context=lambda scope: scope['path'])
+    asyncio.run(mw({'type': 'websocket', 'path': '/ws'}, None, None))
+
+    assert ["GET /foo", "", "/ws"] == seen
+    assert "" == ctx.current_context.get()
+
+
+def test_contexts_check_new_context():
+    var = contextvars.ContextVar("test_var", default="x")
+    c = ctx.CoverageContexts(var)
+
+    assert c.check_new_context()
+    assert not c.check_new_context()
+
+    c.add("foo.py", 1)
+    with ctx.coverage_context("y", var):
+        assert c.check_new_context()
+        assert not c.add("foo.py", 2)   # "x" hasn't seen it
+
+
+def test_contexts_bounded():
+    var = contextvars.ContextVar("test_var", default="x")
+    c = ctx.CoverageContexts(var, max_contexts=2)
+
+    for name in ["a", "b", "c", "d"]:
+        with ctx.coverage_context(name, var):
+            c.check_new_context()
+            c.add("foo.py", 1)
+
+    assert {"a", "b", ctx.OTHER_CONTEXT} == set(c.seen)
+    assert {"1": ["<other>", "a", "b"]} == c.line_contexts("foo.py")
+
+
+def test_asgi_route_context():
+    class Route:
+        path_format = "/items/{id}"
+
+    assert "GET /items/{id}" == ctx.asgi_route_context({'type': 'http', 'method': 'GET',
+                                                        'path': '/items/42', 'route': Route()})
+    assert "GET /items/42" == ctx.asgi_route_context({'type': 'http', 'method': 'GET', 'path': '/items/42'})
+
+
+def test_asgi_route_context_after_routing():
+    class Route:
+        def __init__(self, path_format, endpoint):
+            self.path_format = path_format
+            self.endpoint = ctx.ASGIContextMiddleware(endpoint, get_context=ctx.asgi_route_context)
+
+    seen = []
+
+    async def endpoint(scope, receive, send):
+        seen.append(ctx.current_context.get())
+
+    routes = [Route("/items/{id}", endpoint)]
+
+    async def router(scope, receive, send):
+        # as Starlette's Router does, noting the route matched in the scope
+        route = next(r for r in routes if scope['path'].startswith(r.path_format.split('{')[0]))
+        scope['route'] = route
+        seen.append(ctx.current_context.get())
+        await route.endpoint(scope, receive, send)
+
+    app = ctx.ASGIContextMiddleware(router)
+    for item in (1, 2):
+        asyncio.run(app({'type': 'http', 'method': 'GET', 'path': f'/items/{item}'}, None, None))
+
+    # the outer middleware runs before routing; one placed after it sees the route
+    assert ["GET /items/1", "GET /items/{id}", "GET /items/2", "GET /items/{id}"] == seen
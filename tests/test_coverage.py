@@ -160,6 +160,125 @@ def test_threads():
     assert [] == cov['missing_lines']
 
 
+def test_thread_hit_buffers():
+    import threading
+
+    buffers = sc.ThreadHitBuffers()
+    N_THREADS = 8
+    N = 5_000
+
+    def record(t):
+        for i in range(N):
+            buffers.add(f"file{t % 2}", t*N + i)
+
+    threads = [threading.Thread(target=record, args=(t,)) for t in range(N_THREADS)]
+    for t in threads:
+        t.start()
+
+    seen = dict()
+    while any(t.is_alive() for t in threads):
+        for f, lines in buffers.drain().items():
+            assert not (seen.setdefault(f, set()) & lines), "reported twice"
+            seen[f].update(lines)
+
+    for t in threads:
+        t.join()
+
+    for f, lines in buffers.drain().items():
+        seen.setdefault(f, set()).update(lines)
+
+    assert {'file0', 'file1'} == seen.keys()
+    assert set(range(N_THREADS*N)) == seen['file0'] | seen['file1']
+    assert not buffers.drain()
+
+
+def test_source_cache(tmp_path):
+    import os
+
+    cache = sc.SourceCache(max_bytes=100)
+
+    class CountingLoader:
+        def __init__(self):
+            self.calls = 0
+
+        def get_data(self, filename):
+            self.calls += 1
+            return Path(filename).read_bytes()
+
+    a = tmp_path / "a.py"
+    a.write_bytes(b"x = 1\n" * 10)
+    loader = CountingLoader()
+    assert a.read_bytes() == cache.get(str(a), loader)
+    assert a.read_bytes() == cache.get(str(a), loader)
+    assert 1 == loader.calls
+
+    # changed files are read again
+    a.write_bytes(b"y = 2\n" * 11)
+    os.utime(a, ns=(0, 0))
+    assert a.read_bytes() == cache.get(str(a), loader)
+    assert 2 == loader.calls
+    assert 66 == cache.total_bytes
+
+    # least recently used are evicted to stay within the limit
+    b = tmp_path / "b.py"
+    b.write_bytes(b"z = 3\n" * 10)
+    assert b.read_bytes() == cache.get(str(b), loader)
+    assert 60 == cache.total_bytes
+    assert a.read_bytes() == cache.get(str(a), loader)
+    assert 4 == loader.calls
+
+
+@pytest.mark.parametrize("do_branch", [False, True])
+def test_instrument_records_lines_and_branches(do_branch):
+    t = ast_parse("""
+        def f(x):
+            def g(y):
+                return [z for z in range(y) if z % 2]
+
+            if x > 0:
+                return g(x)
+            return 0
+
+        class C:
+            def m(self):
+                for i in range(3):
+                    pass
+    """)
+    if do_branch:
+        t = br.preinstrument(t)
+    code = compile(t, "foo.py", "exec")
+
+    sci = sc.Slipcover(branch=do_branch)
+    sci.instrument(code)
+
+    assert set(sc.Slipcover.lines_from_code(code)) == sci.code_lines["foo.py"]
+    assert set(sc.Slipcover.branches_from_code(code)) == sci.code_branches["foo.py"]
+    assert bool(sci.code_branches["foo.py"]) == do_branch
+
+
+@pytest.mark.skipif(PYTHON_VERSION < (3,12), reason="per-thread buffers require sys.monitoring")
+def test_threads_per_thread_buffers():
+    sci = sc.Slipcover(per_thread_buffers=True)
+    assert sci.thread_buffers
+
+    base_line = current_line()
+    def foo(n):
+        return sum(range(n))
+
+    sci.instrument(foo)
+
+    import threading
+    threads = [threading.Thread(target=foo, args=(10,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    cov = sci.get_coverage()['files'][simple_current_file()]
+    assert [2] == [l-base_line for l in cov['executed_lines']]
+    assert [] == cov['missing_lines']
+
+
 def test_async_inline():
     sci = sc.Slipcover()
     result = None
@@ -187,6 +306,115 @@ def test_async_inline():
     assert [] == cov['missing_lines']
 
 
+def test_contexts_asyncio():
+    import asyncio
+    import contextvars
+
+    var = contextvars.ContextVar("test_context")
+    sci = sc.Slipcover(context_var=var)
+
+    base_line = current_line()
+    async def handle(n):
+        if n > 0:
+            await asyncio.sleep(0)
+            return 1
+        return 0    # 5
+
+    async def serve(name, n):
+        var.set(name)
+        return await handle(n)
+
+    sci.instrument(handle)
+
+    async def main():
+        return await asyncio.gather(serve("positive", 1), serve("zero", 0), serve("positive", 2))
+
+    assert [1, 0, 1] == asyncio.run(main())
+
+    cov = sci.get_coverage()
+    assert cov['meta']['show_contexts']
+
+    f_cov = cov['files'][simple_current_file()]
+    assert [2, 3, 4, 5] == [l-base_line for l in f_cov['executed_lines']]
+    assert [] == f_cov['missing_lines']
+
+    contexts = {int(l)-base_line: ctx for l, ctx in f_cov['contexts'].items()}
+    assert ['positive', 'zero'] == contexts[2]
+    assert ['positive'] == contexts[3]
+    assert ['positive'] == contexts[4]
+    assert ['zero'] == contexts[5]
+
+
+
+def test_contexts_repeated_hits():
+    import contextvars
+    from slipcover.contexts import CoverageContexts, coverage_context
+
+    var = contextvars.ContextVar("test_context", default="a")
+    sci = sc.Slipcover(context_var=var)
+
+    lookups = 0
+    class Counting(CoverageContexts):
+        def __getitem__(self, filename):
+            nonlocal lookups
+            lookups += 1
+            return super().__getitem__(filename)
+
+    sci.contexts.__class__ = Counting
+
+    base_line = current_line()
+    def foo(n):
+        x = 0
+        for i in range(n):
+            x += i
+        return x
+
+    sci.instrument(foo)
+    foo(1_000)
+    with coverage_context("b", var):
+        foo(1_000)
+    foo(1)
+
+    # reported only when first reached in a context (on 3.11 and older, the context last
+    # reported), rather than each time executed
+    assert lookups < 20
+
+    f_cov = sci.get_coverage()['files'][simple_current_file()]
+    contexts = {int(l)-base_line: ctx for l, ctx in f_cov['contexts'].items()}
+    assert {2: ['a', 'b'], 3: ['a', 'b'], 4: ['a', 'b'], 5: ['a', 'b']} == contexts
+
+def test_contexts_cmdline(tmp_path):
+    out_file = tmp_path / "out.json"
+    script = tmp_path / "t.py"
+    script.write_text("""\
+import slipcover
+
+def foo(x):
+    if x:
+        return 1
+    return 0
+
+with slipcover.coverage_context("a"):
+    foo(True)
+
+with slipcover.coverage_context("b"):
+    foo(False)
+""")
+
+    subprocess.run([sys.executable, '-m', 'slipcover', '--contexts', '--json', '--out', out_file, script],
+                   check=True)
+    with open(out_file, "r") as f:
+        cov = json.load(f)
+
+    assert cov['meta']['show_contexts']
+    f_cov = cov['files'][str(script)]
+    assert [1, 3, 4, 5, 6, 8, 9, 11, 12] == f_cov['executed_lines']
+    assert ['a', 'b'] == f_cov['contexts']['4']
+    assert ['a'] == f_cov['contexts']['5']
+    assert ['b'] == f_cov['contexts']['6']
+    assert [''] == f_cov['contexts']['1']
+
+
 @pytest.mark.parametrize("do_branch", [True, False])
 def test_async_file(tmp_path, do_branch):
     code = tmp_path / "t.py"
@@ -366,6 +594,60 @@ def test_get_coverage_detects_lines():
     assert [] == cov['executed_lines']
 
 
+@pytest.mark.parametrize("do_branch", [False, True])
+def test_deinstrument_and_reinstrument_file(tmp_path, do_branch):
+    source = tmp_path / "t.py"
+    source.write_text("def foo(n):\n"
+                      "    if n > 0:\n"
+                      "        return 1\n"
+                      "    return 0\n"
+                      "\n"
+                      "def bar():\n"
+                      "    return 2\n")
+
+    t = ast_parse(source.read_text())
+    if do_branch:
+        t = br.preinstrument(t)
+
+    sci = sc.Slipcover(branch=do_branch)
+    m = types.ModuleType('t')
+    m.__file__ = str(source)
+    sci.register_module(m)
+    exec(sci.instrument(compile(t, str(source), "exec")), m.__dict__)
+    other = str(tmp_path / "other.py")
+    sci.instrument(compile("x = 1\n", other, "exec"))
+
+    def executed():
+        cov = sci.get_coverage()['files'][str(source)]
+        return cov['executed_lines'], cov['missing_lines']
+
+    assert 1 == m.foo(1)
+    assert sci.deinstrument_file(m)
+    assert not sci.deinstrument_file(m)
+
+    if PYTHON_VERSION < (3,12):
+        assert '__slipcover__' not in m.foo.__code__.co_consts
+        assert not sci.instrumented.get(str(source))
+        # only this file's code is dropped from the memo
+        assert {other} == {key[1] for key in sci.code_memo}
+
+    # not measured while de-instrumented
+    assert 0 == m.foo(0)
+    assert 2 == m.bar()
+    assert ([1, 2, 3, 6], [4, 7]) == executed()
+
+    assert sci.reinstrument_file(str(source))
+    assert not sci.reinstrument_file(source)
+
+    if PYTHON_VERSION < (3,12):
+        assert '__slipcover__' in m.foo.__code__.co_consts
+
+    assert 0 == m.foo(0)
+    assert ([1, 2, 3, 4, 6], [7]) == executed()
+    if do_branch:
+        assert [(2, 3), (2, 4)] == sci.get_coverage()['files'][str(source)]['executed_branches']
+
+
 def test_format_missing():
     fm = sc.format_missing
 
@@ -392,6 +674,117 @@ def test_format_missing():
     assert "2, 4" == fm([2,4], [1,3,5], [(2,3), (3,4)])
 
 
+def test_line_ranges_match_lists():
+    import random
+    rng = random.Random(42)
+    for _ in range(200):
+        lines = sorted(rng.sample(range(1, 60), rng.randint(0, 40)))
+        executed = sorted(rng.sample(lines, rng.randint(0, len(lines))))
+        missing = sorted(set(lines) - set(executed))
+        missing_branches = sorted((a, rng.choice([0, a+1])) for a in rng.sample(lines, min(3, len(lines))))
+
+        assert lines == sc.from_line_ranges(sc.to_line_ranges(lines))
+        assert sc.format_missing(missing, executed, missing_branches) == \
+               sc.format_missing(sc.to_line_ranges(missing), sc.to_line_ranges(executed), missing_branches,
+                                 line_ranges=True)
+
+    def make(executed, missing, line_ranges):
+        cov = {'meta': {'software': 'slipcover', 'line_ranges': line_ranges}, 'files': {
+            'a.py': {'executed_lines': sc.to_line_ranges(executed) if line_ranges else executed,
+                     'missing_lines': sc.to_line_ranges(missing) if line_ranges else missing}
+        }}
+        sc.add_summaries(cov)
+        return cov
+
+    for _ in range(200):
+        a_exec, b_exec = (sorted(rng.sample(range(1, 40), rng.randint(0, 20))) for _ in range(2))
+        a_miss, b_miss = (sorted(set(rng.sample(range(1, 40), rng.randint(0, 20))) - set(ex))
+                          for ex in (a_exec, b_exec))
+
+        lists = sc.merge_coverage(make(a_exec, a_miss, False), make(b_exec, b_miss, False))
+        for b_ranges in [True, False]:
+            ranges = sc.merge_coverage(make(a_exec, a_miss, True), make(b_exec, b_miss, b_ranges))
+
+            f_lists, f_ranges = lists['files']['a.py'], ranges['files']['a.py']
+            assert sc.to_line_ranges(f_lists['executed_lines']) == f_ranges['executed_lines']
+            assert sc.to_line_ranges(f_lists['missing_lines']) == f_ranges['missing_lines']
+            assert lists['summary'] == ranges['summary']
+
+
+@pytest.mark.parametrize("width", [1, 3, 8, 20, 80])
+def test_print_coverage_wraps_like_tabulate(width):
+    import io
+    import random
+    from tabulate import tabulate
+
+    rng = random.Random(width)
+    for _ in range(20):
+        lines = sorted(rng.sample(range(1, 300), rng.randint(0, 100)))
+        executed = sorted(rng.sample(lines, rng.randint(0, len(lines))))
+        missing = sorted(set(lines) - set(executed))
+        cov = {'meta': {'software': 'slipcover'},
+               'files': {'a.py': {'executed_lines': executed, 'missing_lines': missing}}}
+        sc.add_summaries(cov)
+
+        with io.StringIO() as out:
+            sc.print_coverage(cov, outfile=out, missing_width=width)
+
+            pct = cov['files']['a.py']['summary']['percent_covered']
+            expected = tabulate([['a.py', len(lines), len(missing), round(pct),
+                                  sc.format_missing(missing, executed, [])]],
+                                headers=["File", "#lines", "#l.miss", "Cover%", "Missing"],
+                                maxcolwidths=[None]*4 + [width])
+            assert "\n" + expected + "\n" == out.getvalue()
+
+
+def test_print_coverage_parallel(monkeypatch):
+    import io
+    import random
+
+    rng = random.Random(0)
+    cov = {'meta': {'software': 'slipcover', 'branch_coverage': False}, 'files': {}}
+    for i in range(20):
+        lines = sorted(rng.sample(range(1, 100), 50))
+        executed = sorted(rng.sample(lines, 25))
+        cov['files'][f"m{i}.py"] = {'executed_lines': executed,
+                                    'missing_lines': sorted(set(lines) - set(executed))}
+    sc.add_summaries(cov)
+
+    with io.StringIO() as serial:
+        sc.print_coverage(cov, outfile=serial, missing_width=20)
+        expected = serial.getvalue()
+
+    monkeypatch.setattr(sc, '_PARALLEL_MIN_FILES', 1)
+    with io.StringIO() as parallel:
+        sc.print_coverage(cov, outfile=parallel, missing_width=20, jobs=2)
+        assert expected == parallel.getvalue()
+
+
+def test_print_coverage_line_ranges():
+    cov = {'meta': {'software': 'slipcover', 'branch_coverage': True}, 'files': {
+        'a.py': {'executed_lines': [1, 2, 3, 7], 'missing_lines': [4, 5, 8, 10],
+                 'executed_branches': [[3, 7]], 'missing_branches': [[3, 4], [7, 0]]},
+        'b.py': {'executed_lines': [], 'missing_lines': [1, 2],
+                 'executed_branches': [], 'missing_branches': []}
+    }}
+    sc.add_summaries(cov)
+
+    ranges = json.loads(json.dumps(cov))
+    ranges['meta']['line_ranges'] = True
+    for f_cov in ranges['files'].values():
+        f_cov['executed_lines'] = sc.to_line_ranges(f_cov['executed_lines'])
+        f_cov['missing_lines'] = sc.to_line_ranges(f_cov['missing_lines'])
+    sc.add_summaries(ranges)
+
+    assert cov['summary'] == ranges['summary']
+
+    import io
+    with io.StringIO() as out_lists, io.StringIO() as out_ranges:
+        sc.print_coverage(cov, outfile=out_lists)
+        sc.print_coverage(ranges, outfile=out_ranges)
+        assert out_lists.getvalue() == out_ranges.getvalue()
+
+
 def test_print_coverage(capsys):
     sci = sc.Slipcover()
 
@@ -977,6 +1370,43 @@ else:
     assert [] == cov['missing_lines']
 
 
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='fork() is Unix-specific')
+def test_fork_while_lock_held():
+    import os
+    import threading
+    import time
+
+    sci = sc.Slipcover()
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        # as a background sweep does
+        with sci.lock:
+            held.set()
+            release.wait()
+
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait()
+    threading.Timer(.2, release.set).start()
+
+    if (pid := os.fork()) == 0:
+        sci.signal_child_process()
+        os._exit(0)
+
+    t.join()
+    deadline = time.time() + 10
+    while (status := os.waitpid(pid, os.WNOHANG))[0] == 0:
+        if time.time() > deadline:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+            pytest.fail("child process deadlocked")
+        time.sleep(.05)
+
+    assert 0 == status[1]
+
 @pytest.mark.skipif(sys.platform == 'win32', reason='fork() and and other functions are Unix-specific')
 def test_fork_close(tmp_path, monkeypatch, capfd):
     source = (Path('tests') / 'pyt.py').resolve()
@@ -0,0 +1,165 @@
+import pytest
+import subprocess
+import signal
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Unix domain sockets are Unix-specific')
+
+from slipcover.daemon import CoverageServer, DaemonClient, request_shutdown, _encode_delta
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = CoverageServer(tmp_path / "cov.sock")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_encode_delta():
+    assert {'a.py': {'lines': [[1, 3]], 'branches': [(2, 3)], 'executed_lines': [[1, 1]]},
+            'b.py': {'executed_branches': [(1, 0)]}} == \
+           _encode_delta({'a.py': ({1, 2, 3, (2, 3)}, {1}), 'b.py': (set(), {(1, 0)}), 'c.py': (set(), set())})
+
+
+def test_server_merges(server):
+    server.add_meta({'branch_coverage': True})
+    server.add_files({'/x/a.py': {'lines': [[1, 4]], 'branches': [[2, 3], [2, 4]],
+                                  'executed_lines': [[1, 2]], 'executed_branches': [[2, 3]]}})
+    server.add_files({'/x/a.py': {'executed_lines': [[4, 4]]}})
+
+    cov = server.get_coverage()
+    assert cov['meta']['branch_coverage']
+    assert {'executed_lines': [1, 2, 4], 'missing_lines': [3],
+            'executed_branches': [(2, 3)], 'missing_branches': [(2, 4)]} == \
+           {k: v for k, v in cov['files']['/x/a.py'].items() if k != 'summary'}
+
+    # branches are only reported if every client measured them
+    server.add_meta({'branch_coverage': False})
+    assert 'executed_branches' not in server.get_coverage()['files']['/x/a.py']
+
+
+def test_client_sends_deltas(server, tmp_path):
+    import slipcover as sc
+
+    sci = sc.Slipcover()
+    code = sci.instrument(compile("x = 1\nif x > 1:\n    y = 2\n", str(tmp_path / "t.py"), "exec"))
+
+    client = DaemonClient(sci, server.socket_path, interval=60)
+    exec(code, dict())
+    client.send()
+
+    assert server.wait_for_clients(timeout=0) is False
+    deadline = time.time() + 10
+    while server.get_coverage()['files'].get(str(tmp_path / "t.py"), {}).get('executed_lines') != [1, 2] \
+          and time.time() < deadline:
+        time.sleep(.05)
+
+    # nothing new to send, nor to de-instrument
+    sweeps = sci.get_stats()['deinstrument'].get('sweeps')
+    assert {} == sci.get_delta()
+    assert sweeps == sci.get_stats()['deinstrument'].get('sweeps')
+
+    client.close()
+    assert server.wait_for_clients(timeout=10)
+    f_cov = server.get_coverage()['files'][str(tmp_path / "t.py")]
+    assert [1, 2] == f_cov['executed_lines']
+    assert [3] == f_cov['missing_lines']
+
+
+
+def test_fork_while_sending(server, tmp_path):
+    import os
+    import slipcover as sc
+
+    sci = sc.Slipcover()
+    code = sci.instrument(compile("def foo(n):\n"
+                                  "    for i in range(n):\n"
+                                  "        if i % 2:\n"
+                                  "            pass\n", str(tmp_path / "t.py"), "exec"))
+    g = dict()
+    exec(code, g)
+
+    # the sender thread is nearly always busy
+    client = DaemonClient(sci, server.socket_path, interval=0)
+    try:
+        for _ in range(20):
+            g['foo'](100)
+            if (pid := os.fork()) == 0:
+                g['foo'](3)
+                client.close()
+                os._exit(0)
+
+            deadline = time.time() + 10
+            while (status := os.waitpid(pid, os.WNOHANG))[0] == 0:
+                if time.time() > deadline:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    pytest.fail("child process deadlocked")
+                time.sleep(.01)
+
+            assert 0 == status[1]
+    finally:
+        client.close()
+
+def test_serve_and_daemon_options(tmp_path):
+    (tmp_path / "t.py").write_text("import os, sys\n"
+                                   "if sys.argv[1] == 'fork':\n"
+                                   "    if os.fork() == 0:\n"
+                                   "        x = 1\n"
+                                   "        os._exit(0)\n"
+                                   "    os.wait()\n"
+                                   "elif sys.argv[1] == 'a':\n"
+                                   "    x = 2\n"
+                                   "else:\n"
+                                   "    x = 3\n")
+
+    sock = tmp_path / "cov.sock"
+    daemon = subprocess.Popen([sys.executable, '-m', 'slipcover', '--serve', str(sock), '--branch',
+                               '--json', '--out', 'out.json'], cwd=tmp_path)
+    try:
+        deadline = time.time() + 30
+        while not sock.exists():
+            assert daemon.poll() is None
+            assert time.time() < deadline
+            time.sleep(.05)
+
+        for arg in ['fork', 'a']:
+            subprocess.run([sys.executable, '-m', 'slipcover', '--branch', '--daemon', str(sock), 't.py', arg],
+                           check=True, cwd=tmp_path)
+
+        # not connected to the server, nothing is written locally
+        assert not (tmp_path / "out.json").exists()
+
+        request_shutdown(sock)
+        assert 0 == daemon.wait(timeout=30)
+    finally:
+        if daemon.poll() is None:
+            daemon.send_signal(signal.SIGTERM)
+            daemon.wait()
+
+    cov = json.loads((tmp_path / "out.json").read_text())
+    assert cov['meta']['branch_coverage']
+    assert [1, 2, 3, 4, 5, 6, 7, 8] == cov['files']['t.py']['executed_lines']
+    assert [10] == cov['files']['t.py']['missing_lines']
+    assert not sock.exists()
+
+
+def test_serve_terminated(tmp_path):
+    sock = tmp_path / "cov.sock"
+    daemon = subprocess.Popen([sys.executable, '-m', 'slipcover', '--serve', str(sock), '--out', 'out.txt'],
+                              cwd=tmp_path)
+    deadline = time.time() + 30
+    while not sock.exists():
+        assert time.time() < deadline
+        time.sleep(.05)
+
+    daemon.send_signal(signal.SIGTERM)
+    assert 0 == daemon.wait(timeout=30)
+    assert (tmp_path / "out.txt").exists()
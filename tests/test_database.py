@@ -0,0 +1,134 @@
+import pytest
+import subprocess
+import sys
+import json
+from pathlib import Path
+import slipcover as sc
+from slipcover.database import CoverageDatabase, is_database
+from slipcover.slipcover import SlipcoverError
+
+
+def make_run(files, branch_coverage=True):
+    cov = {'meta': {'software': 'slipcover', 'branch_coverage': branch_coverage, 'timestamp': 'now'}, 'files': {}}
+    for name, (executed, missing, executed_br, missing_br) in files.items():
+        cov['files'][name] = {'executed_lines': executed, 'missing_lines': missing}
+        if branch_coverage:
+            cov['files'][name].update({'executed_branches': executed_br, 'missing_branches': missing_br})
+    sc.slipcover.add_summaries(cov)
+    return cov
+
+
+RUN1 = make_run({'a.py': ([1, 2], [3], [[2, 3]], [[2, 0]]), 'b.py': ([1], [2], [], [])})
+RUN2 = make_run({'a.py': ([1, 3], [2], [], [[2, 3], [2, 0]])})
+RUN3 = make_run({'b.py': ([1, 2], [], [], [])})
+
+
+def test_add_and_merge_runs(tmp_path):
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        assert 1 == db.add_run(RUN1['meta'], RUN1['files'].items())
+        assert 2 == db.add_run(RUN2['meta'], RUN2['files'].items())
+        assert 3 == db.add_run(RUN3['meta'], RUN3['files'].items())
+
+    assert is_database(tmp_path / "cov.db")
+
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        assert [1, 2, 3] == [r['run'] for r in db.runs()]
+
+        def files(cov):
+            return {f: {k: v for k, v in f_cov.items() if k != 'summary'} for f, f_cov in cov['files'].items()}
+
+        # a single run reads back as written
+        assert files(RUN1) == files(db.get_coverage(1, 1))
+
+        # merging a range matches merge_coverage
+        expected = sc.merge_coverage(json.loads(json.dumps(RUN1)), RUN2)
+        merged = db.get_coverage(1, 2)
+        assert files(expected) == files(merged)
+        assert expected['summary'] == merged['summary']
+
+        assert {'a.py': [1, 2, 3], 'b.py': [1, 2]} == \
+               {f: f_cov['executed_lines'] for f, f_cov in db.get_coverage()['files'].items()}
+        assert ['b.py'] == list(db.get_coverage(3)['files'])
+
+        assert 1 == db.last_executed('a.py', 2)
+        assert 2 == db.last_executed('a.py', 3)
+        assert None == db.last_executed('b.py', 3)
+        assert None == db.last_executed('c.py', 1)
+
+
+def test_merge_into_run(tmp_path):
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        run = db.add_run(RUN1['meta'], RUN1['files'].items())
+        assert run == db.add_run(RUN2['meta'], RUN2['files'].items(), run=run)
+
+        assert 1 == len(db.runs())
+        assert [1, 2, 3] == db.get_coverage()['files']['a.py']['executed_lines']
+
+        with pytest.raises(SlipcoverError):
+            no_branches = make_run({'a.py': ([1], [], [], [])}, branch_coverage=False)
+            db.add_run(no_branches['meta'], no_branches['files'].items(), run=run)
+
+
+
+def test_cumulative_coverage(tmp_path):
+    def files(cov):
+        return {f: {k: v for k, v in f_cov.items() if k != 'summary'} for f, f_cov in cov['files'].items()}
+
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        for cov in (RUN1, RUN2, RUN3, RUN1):
+            db.add_run(cov['meta'], cov['files'].items())
+
+        # totals are only recorded for the runs that changed them
+        assert [('a.py', 1), ('a.py', 2), ('b.py', 1), ('b.py', 3)] == \
+               db.conn.execute("""SELECT name, run FROM cumulative JOIN files ON files.id = file
+                                  ORDER BY name, run""").fetchall()
+
+        # ranges from the first run read the totals, others the runs; both agree
+        expected = sc.merge_coverage(json.loads(json.dumps(RUN1)), RUN2)
+        assert files(expected) == files(db.get_coverage(None, 2))
+        assert files(db.get_coverage(1, 4)) == files(db.get_coverage(2, 4)) == files(db.get_coverage())
+
+        # merging into an earlier run updates the later totals
+        db.add_run(RUN3['meta'], make_run({'c.py': ([1], [], [], [])})['files'].items(), run=1)
+        assert [1] == db.get_coverage(None, 3)['files']['c.py']['executed_lines']
+
+        expected = files(db.get_coverage())
+        db.conn.execute("DELETE FROM cumulative")
+        db.conn.commit()
+
+    # rebuilt if missing, as in databases from before it existed
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        assert expected == files(db.get_coverage())
+
+def test_mixed_branch_coverage(tmp_path):
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        db.add_run(RUN1['meta'], RUN1['files'].items())
+        no_branches = make_run({'a.py': ([3], [1, 2], [], [])}, branch_coverage=False)
+        db.add_run(no_branches['meta'], no_branches['files'].items())
+
+        assert db.get_coverage(1, 1)['meta']['branch_coverage']
+
+        cov = db.get_coverage()
+        assert not cov['meta']['branch_coverage']
+        assert {'executed_lines': [1, 2, 3], 'missing_lines': []} == \
+               {k: v for k, v in cov['files']['a.py'].items() if k != 'summary'}
+
+
+def test_db_option_and_merge(tmp_path):
+    (tmp_path / "t.py").write_text("import sys\nif len(sys.argv) > 1:\n    x = 1\nelse:\n    x = 2\n")
+
+    for args in [[], ['foo']]:
+        subprocess.run([sys.executable, '-m', 'slipcover', '--branch', '--db', 'cov.db', '--out', 'report.txt',
+                        't.py', *args], check=True, cwd=tmp_path)
+
+    with CoverageDatabase(tmp_path / "cov.db") as db:
+        assert 2 == len(db.runs())
+
+    def merge(*args):
+        subprocess.run([sys.executable, '-m', 'slipcover', '--merge', 'cov.db', *args, '--out', 'out.json'],
+                       check=True, cwd=tmp_path)
+        return json.loads((tmp_path / "out.json").read_text())['files']['t.py']
+
+    assert [1, 2, 5] == merge('--runs', '1')['executed_lines']
+    assert [1, 2, 3] == merge('--runs', '2:')['executed_lines']
+    assert [1, 2, 3, 5] == merge()['executed_lines']
@@ -0,0 +1,125 @@
+import pytest
+import subprocess
+import sys
+import json
+from pathlib import Path
+import slipcover.diff as diff
+from slipcover.slipcover import SlipcoverError
+
+
+DIFF = """\
+diff --git a/foo.py b/foo.py
+index 1234567..89abcde 100644
+--- a/foo.py
++++ b/foo.py
+@@ -1,4 +1,5 @@
+ import sys
+-x = 1
++x = 2
++y = 3
+ 
+ print(x)
+@@ -10 +11,0 @@ def bar():
+-    pass
+@@ -20,0 +21 @@ def baz():
++++ x
+diff --git a/gone.py b/gone.py
+deleted file mode 100644
+--- a/gone.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-a = 1
+-b = 2
+diff --git a/sub/new.py b/sub/new.py
+new file mode 100644
+--- /dev/null
++++ b/sub/new.py
+@@ -0,0 +1,2 @@
++a = 1
++b = 2
+"""
+
+
+def test_parse_diff(tmp_path):
+    changed = diff.parse_diff(DIFF.splitlines(keepends=True), base_dir=tmp_path)
+
+    assert {str((tmp_path / 'foo.py').resolve()): {2, 3, 21},
+            str((tmp_path / 'sub' / 'new.py').resolve()): {1, 2}} == changed
+
+
+def test_patch_changed_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'p.diff').write_text(DIFF)
+
+    changed = diff.patch_changed_lines(Path('p.diff'))
+    assert {2, 3, 21} == changed[str((tmp_path / 'foo.py').resolve())]
+
+    with pytest.raises(SlipcoverError):
+        diff.patch_changed_lines(tmp_path / 'missing.diff')
+
+
+def test_git_changed_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=t', '-c', 'user.email=t@t', *args],
+                       check=True, capture_output=True)
+
+    try:
+        git('init', '-q')
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("git unavailable")
+
+    (tmp_path / 't.py').write_text("a = 1\nb = 2\nc = 3\n")
+    git('add', 't.py')
+    git('commit', '-q', '-m', 'initial')
+
+    (tmp_path / 't.py').write_text("a = 1\nb = 20\nc = 3\nd = 4\n")
+
+    assert {str((tmp_path / 't.py').resolve()): {2, 4}} == diff.git_changed_lines('HEAD')
+
+    with pytest.raises(SlipcoverError):
+        diff.git_changed_lines('no-such-revision')
+
+
+@pytest.mark.parametrize("do_branch", [True, False])
+def test_diff_coverage_cmdline(tmp_path, monkeypatch, do_branch):
+    monkeypatch.chdir(tmp_path)
+
+    (tmp_path / "t.py").write_text("""\
+import t2
+
+def foo(x):
+    if x:
+        return 1
+    return 0    # 6
+
+foo(True)
+""")
+    (tmp_path / "t2.py").write_text("print('hi')\n")
+
+    (tmp_path / "p.diff").write_text("""\
+--- a/t.py
++++ b/t.py
+@@ -4,3 +4,3 @@ def foo(x):
+-    if x > 0:
++    if x:
+         return 1
+-    return None
++    return 0    # 6
+""")
+
+    out = tmp_path / "out.json"
+    p = subprocess.run([sys.executable, '-m', 'slipcover', *(['--branch'] if do_branch else []),
+                        '--diff-file', 'p.diff', '--json', '--out', out, '--fail-under', '60', 't.py'])
+    assert 2 == p.returncode
+
+    with out.open() as f:
+        cov = json.load(f)
+
+    assert ['t.py'] == list(cov['files'])
+    assert [4] == cov['files']['t.py']['executed_lines']
+    assert [6] == cov['files']['t.py']['missing_lines']
+    if do_branch:
+        assert [[4, 5]] == cov['files']['t.py']['executed_branches']
+        assert [[4, 6]] == cov['files']['t.py']['missing_branches']
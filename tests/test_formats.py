@@ -0,0 +1,234 @@
+import pytest
+import subprocess
+import sys
+import io
+import json
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import slipcover as sc
+import slipcover.formats as fmt
+
+
+COVERAGE = {
+    'meta': {'software': 'slipcover', 'branch_coverage': True},
+    'files': {
+        'a.py': {'executed_lines': [1, 2, 4], 'missing_lines': [3],
+                 'executed_branches': [[2, 4]], 'missing_branches': [[2, 3]]},
+        'pkg/b.py': {'executed_lines': [1], 'missing_lines': [],
+                     'executed_branches': [], 'missing_branches': []},
+        'pkg/c.py': {'executed_lines': [], 'missing_lines': [1, 2],
+                     'executed_branches': [], 'missing_branches': [[1, 0]]},
+    }
+}
+sc.slipcover.add_summaries(COVERAGE)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64*1024])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_json_reader(chunk_size, indent):
+    reader = fmt.JsonCoverageReader(io.StringIO(json.dumps(COVERAGE, indent=indent)), chunk_size=chunk_size)
+
+    files = reader.files()
+    first = next(files)
+    assert ('a.py', COVERAGE['files']['a.py']) == first
+    assert COVERAGE['meta'] == reader.meta
+
+    assert list(COVERAGE['files'].items())[1:] == list(files)
+    assert COVERAGE['summary'] == reader.summary
+
+
+def test_json_reader_empty_and_bad():
+    assert [] == list(fmt.JsonCoverageReader(io.StringIO('{}')).files())
+    assert [] == list(fmt.JsonCoverageReader(io.StringIO('{"files": {}}')).files())
+
+    with pytest.raises(json.JSONDecodeError):
+        list(fmt.JsonCoverageReader(io.StringIO('{"files": {"a.py": {}')).files())
+
+
+def test_write_lcov():
+    out = io.StringIO()
+    fmt.write_lcov(COVERAGE['files'].items(), out)
+
+    records = out.getvalue().split("end_of_record\n")
+    assert '' == records[-1]
+    assert records[0].splitlines() == [
+        "TN:", "SF:a.py",
+        "DA:1,1", "DA:2,1", "DA:3,0", "DA:4,1",
+        "BRDA:2,0,0,0", "BRDA:2,0,1,1",
+        "BRF:2", "BRH:1",
+        "LF:4", "LH:3"
+    ]
+    # branches from lines not executed are marked as such
+    assert "BRDA:1,0,0,-" in records[2].splitlines()
+
+
+def test_write_cobertura():
+    out = io.StringIO()
+    fmt.write_cobertura(lambda: COVERAGE['files'].items(), out, source='/src')
+
+    root = ET.fromstring(out.getvalue())
+    assert '7' == root.get('lines-valid')
+    assert '4' == root.get('lines-covered')
+    assert '3' == root.get('branches-valid')
+    assert '1' == root.get('branches-covered')
+    assert '/src' == root.find('sources/source').text
+
+    packages = root.findall('packages/package')
+    assert ['.', 'pkg'] == [p.get('name') for p in packages]
+    assert ['b.py', 'c.py'] == [c.get('name') for c in packages[1].findall('classes/class')]
+    assert '0.3333' == packages[1].get('line-rate')
+
+    line = packages[0].find("classes/class/lines/line[@number='2']")
+    assert {'number': '2', 'hits': '1', 'branch': 'true', 'condition-coverage': '50% (1/2)',
+            'missing-branches': '3'} == line.attrib
+
+    line = packages[1].find("classes/class[@name='c.py']/lines/line[@number='1']")
+    assert 'exit' == line.get('missing-branches')
+
+
+def test_convert_matches_direct_output(tmp_path):
+    (tmp_path / "t.py").write_text("x = 1\nif x:\n    y = 2\n")
+
+    subprocess.run([sys.executable, '-m', 'slipcover', '--branch', '--json', '--out', 'c.json',
+                    '--lcov', 'c.info', '--xml', 'c.xml', 't.py'], check=True, cwd=tmp_path)
+    subprocess.run([sys.executable, '-m', 'slipcover', '--convert', 'c.json',
+                    '--lcov', 'c2.info', '--xml', 'c2.xml'], check=True, cwd=tmp_path)
+
+    assert (tmp_path / "c.info").read_text() == (tmp_path / "c2.info").read_text()
+    assert "DA:3,1" in (tmp_path / "c.info").read_text()
+
+    xml = ET.parse(tmp_path / "c.xml").getroot()
+    xml2 = ET.parse(tmp_path / "c2.xml").getroot()
+    del xml.attrib['timestamp'], xml2.attrib['timestamp']
+    assert ET.tostring(xml) == ET.tostring(xml2)
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_write_json_matches_json_dumps(indent):
+    for cov in [COVERAGE, {'meta': {}, 'files': {}, 'summary': {'percent_covered': 100.0}}]:
+        out = io.StringIO()
+        fmt.write_json(cov['meta'], cov['files'].items(), out, indent=indent)
+        assert json.dumps(cov, indent=indent) == out.getvalue()
+
+
+def test_line_ranges():
+    assert [] == fmt.to_line_ranges([])
+    assert [[1, 3], [5, 5], [7, 8]] == fmt.to_line_ranges([1, 2, 3, 5, 7, 8])
+    assert [1, 2, 3, 5, 7, 8] == fmt.from_line_ranges([[1, 3], [5, 5], [7, 8]])
+
+    out = io.StringIO()
+    fmt.write_json(COVERAGE['meta'], COVERAGE['files'].items(), out, line_ranges=True)
+
+    written = json.loads(out.getvalue())
+    assert written['meta']['line_ranges']
+    assert [[1, 2], [4, 4]] == written['files']['a.py']['executed_lines']
+    assert COVERAGE['summary'] == written['summary']
+
+    out.seek(0)
+    meta, files = fmt.read_json(out)
+    assert COVERAGE['meta'] == meta
+    assert COVERAGE['files'] == dict(files)
+
+
+
+def test_read_json_files_before_meta():
+    out = io.StringIO()
+    fmt.write_json(COVERAGE['meta'], COVERAGE['files'].items(), out, line_ranges=True)
+    written = json.loads(out.getvalue())
+
+    # as written by other tools, which may not place 'meta' first
+    reordered = {'files': written['files'], 'meta': written['meta']}
+    meta, files = fmt.read_json(io.StringIO(json.dumps(reordered)))
+    assert COVERAGE['meta'] == meta
+    assert COVERAGE['files'] == dict(files)
+
+def test_merge_streams_json_and_ranges(tmp_path):
+    (tmp_path / "t.py").write_text("import sys\nif len(sys.argv) > 1:\n    x = 1\nelse:\n    x = 2\n")
+
+    for i, args in enumerate([[], ['foo']]):
+        subprocess.run([sys.executable, '-m', 'slipcover', '--branch', '--json', '--line-ranges',
+                        '--out', f'c{i}.json', 't.py', *args], check=True, cwd=tmp_path)
+
+    c0 = json.loads((tmp_path / "c0.json").read_text())
+    assert [[1, 2], [5, 5]] == c0['files']['t.py']['executed_lines']
+
+    subprocess.run([sys.executable, '-m', 'slipcover', '--merge', 'c0.json', 'c1.json', '--out', 'm.json'],
+                   check=True, cwd=tmp_path)
+    merged = json.loads((tmp_path / "m.json").read_text())
+    assert merged['meta']['line_ranges']
+    assert [[1, 3], [5, 5]] == merged['files']['t.py']['executed_lines']
+    assert [[2, 3], [2, 5]] == merged['files']['t.py']['executed_branches']
+
+
+@pytest.mark.parametrize("suffix", ['', '.gz', '.bz2', '.xz'])
+def test_compressed_roundtrip(tmp_path, suffix):
+    path = tmp_path / f"c.json{suffix}"
+    with fmt.open_write(path) as f:
+        fmt.write_json(COVERAGE['meta'], COVERAGE['files'].items(), f)
+
+    if suffix:
+        assert not path.read_bytes().startswith(b'{')
+
+    # detected by contents, not name
+    renamed = path.rename(tmp_path / "c.data")
+    with fmt.open_read(renamed) as f:
+        meta, files = fmt.read_json(f)
+        assert COVERAGE['files'] == dict(files)
+
+    with renamed.open('rb') as raw, fmt.open_read(raw) as f:
+        assert COVERAGE == json.load(f)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='fork() is Unix-specific')
+def test_compressed_output_and_merge(tmp_path):
+    (tmp_path / "t.py").write_text("import os, sys\n"
+                                   "if len(sys.argv) > 1:\n"
+                                   "    if os.fork() == 0:\n"
+                                   "        x = 1\n"
+                                   "        os._exit(0)\n"
+                                   "    os.wait()\n"
+                                   "else:\n"
+                                   "    x = 2\n")
+
+    subprocess.run([sys.executable, '-m', 'slipcover', '--json', '--out', 'a.json.gz', 't.py'],
+                   check=True, cwd=tmp_path)
+    subprocess.run([sys.executable, '-m', 'slipcover', '--json', '--out', 'b.json.xz', 't.py', 'fork'],
+                   check=True, cwd=tmp_path)
+
+    with fmt.open_read(tmp_path / "b.json.xz") as f:
+        # the forked child's coverage (line 4) was merged in
+        assert [1, 2, 3, 4, 5, 6] == json.load(f)['files']['t.py']['executed_lines']
+
+    subprocess.run([sys.executable, '-m', 'slipcover', '--merge', 'a.json.gz', 'b.json.xz', '--out', 'm.json.bz2'],
+                   check=True, cwd=tmp_path)
+    with fmt.open_read(tmp_path / "m.json.bz2") as f:
+        assert [1, 2, 3, 4, 5, 6, 8] == json.load(f)['files']['t.py']['executed_lines']
+
+
+
+def test_unavailable_compression_is_a_usage_error(tmp_path):
+    try:
+        fmt.check_compression(Path("c.json.zst"))
+        pytest.skip("zstd compression is available")
+    except sc.SlipcoverError:
+        pass
+
+    (tmp_path / "t.py").write_text("open('ran', 'w').close()\n")
+    p = subprocess.run([sys.executable, '-m', 'slipcover', '--out', 'c.json.zst', 't.py'],
+                       cwd=tmp_path, capture_output=True, text=True)
+    assert 2 == p.returncode
+    assert 'zstandard' in p.stderr
+    assert not (tmp_path / "ran").exists()
+
+def test_write_cobertura_groups_packages():
+    files = [('a/x.py', COVERAGE['files']['a.py']), ('b/y.py', COVERAGE['files']['pkg/b.py']),
+             ('a/z.py', COVERAGE['files']['pkg/c.py'])]
+
+    out = io.StringIO()
+    fmt.write_cobertura(lambda: iter(files), out)
+
+    root = ET.fromstring(out.getvalue())
+    packages = root.findall('packages/package')
+    assert ['a', 'b'] == [p.get('name') for p in packages]
+    assert ['x.py', 'z.py'] == [c.get('name') for c in packages[0].findall('classes/class')]
+    assert ['y.py'] == [c.get('name') for c in packages[1].findall('classes/class')]
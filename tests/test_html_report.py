@@ -0,0 +1,128 @@
+import pytest
+import subprocess
+import sys
+import json
+import os
+from pathlib import Path
+import slipcover.html_report as hr
+
+
+def make_coverage(files):
+    return {
+        'meta': {'branch_coverage': True, 'timestamp': 'now'},
+        'files': {
+            f: {'executed_lines': executed, 'missing_lines': missing,
+                'executed_branches': [], 'missing_branches': missing_branches,
+                'summary': {'covered_lines': len(executed), 'missing_lines': len(missing),
+                            'covered_branches': 0, 'missing_branches': len(missing_branches),
+                            'percent_covered': 100*len(executed)/(len(executed)+len(missing))}}
+            for f, (executed, missing, missing_branches) in files.items()
+        },
+        'summary': {'percent_covered': 50.0}
+    }
+
+
+def test_write_html(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path("a.py").write_text("if x:\n    y = '<b>'\nz = 1\n")
+    Path("b.py").write_text("pass\n")
+
+    cov = make_coverage({'a.py': ([1, 3], [2], [[1, 2]]), 'b.py': ([1], [], [])})
+
+    out = tmp_path / "html"
+    assert {'written': 2, 'kept': 0, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+
+    index = (out / "index.html").read_text()
+    assert 'a.py' in index and 'b.py' in index
+
+    page = (out / hr._page_name('a.py')).read_text()
+    assert '&lt;b&gt;' in page
+    assert '<tr class="par" title="didn\'t jump to 2"><td class="n">1</td>' in page
+    assert '<tr class="mis"><td class="n">2</td>' in page
+    assert '<tr class="run"><td class="n">3</td>' in page
+
+    # nothing changed, nothing written
+    assert {'written': 0, 'kept': 2, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+
+    # changed coverage only rewrites that page
+    cov = make_coverage({'a.py': ([1, 2, 3], [], []), 'b.py': ([1], [], [])})
+    assert {'written': 1, 'kept': 1, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+    assert 'class="mis"' not in (out / hr._page_name('a.py')).read_text()
+
+    # as does changed source
+    Path("b.py").write_text("pass # changed\n")
+    assert {'written': 1, 'kept': 1, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+
+    # but not touching it
+    os.utime("b.py", ns=(0, 0))
+    assert {'written': 0, 'kept': 2, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+
+    # an edit keeping its size and modification time is noticed
+    st = os.stat("b.py")
+    Path("b.py").write_text("pass # chanGed\n")
+    os.utime("b.py", ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert st.st_size == os.stat("b.py").st_size
+    assert {'written': 1, 'kept': 1, 'removed': 0} == hr.write_html(cov, out, jobs=1)
+    assert "chanGed" in (out / hr._page_name('b.py')).read_text()
+
+    # files no longer present have their pages removed
+    del cov['files']['a.py']
+    assert {'written': 0, 'kept': 1, 'removed': 1} == hr.write_html(cov, out, jobs=1)
+    assert not (out / hr._page_name('a.py')).exists()
+
+
+def test_write_html_parallel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(hr, '_MIN_PARALLEL', 1)
+
+    files = {}
+    for i in range(10):
+        Path(f"m{i}.py").write_text(f"x = {i}\ny = {i}\n")
+        files[f"m{i}.py"] = ([1], [2], [])
+
+    out = tmp_path / "html"
+    assert {'written': 10, 'kept': 0, 'removed': 0} == hr.write_html(make_coverage(files), out, jobs=2)
+    for i in range(10):
+        assert f"x = {i}" in (out / hr._page_name(f"m{i}.py")).read_text()
+
+
+def test_html_option(tmp_path):
+    (tmp_path / "t.py").write_text("x = 1\nif x:\n    y = 2\n")
+
+    out = tmp_path / "html"
+    subprocess.run([sys.executable, '-m', 'slipcover', '--json', '--out', str(tmp_path / "out.json"),
+                    '--html', str(out), 't.py'], check=True, cwd=tmp_path)
+
+    cov = json.loads((tmp_path / "out.json").read_text())
+    manifest = json.loads((out / hr.MANIFEST).read_text())
+    assert cov['files'].keys() == manifest['files'].keys()
+    assert (out / "index.html").exists()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_write_html_uses_source_cache(tmp_path, monkeypatch, jobs):
+    from slipcover.slipcover import SourceCache
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(hr, '_MIN_PARALLEL', 1)
+    Path("a.py").write_text("x = 1\n")
+    Path("b.py").write_text("y = 2\n")
+
+    cache = SourceCache()
+    cache.get(str(tmp_path / "a.py"))
+
+    reads = []
+    original_get = SourceCache.get
+    def get(self, filename, loader=None):
+        reads.append(filename)
+        return original_get(self, filename, loader)
+    monkeypatch.setattr(SourceCache, 'get', get)
+
+    cov = make_coverage({'a.py': ([1], [], []), 'b.py': ([1], [], [])})
+    hr.write_html(cov, tmp_path / "html", jobs=jobs, source_cache=cache)
+
+    assert "x = 1" in (tmp_path / "html" / hr._page_name('a.py')).read_text()
+    assert "y = 2" in (tmp_path / "html" / hr._page_name('b.py')).read_text()
+
+    # read once, to be hashed, and handed to any workers
+    assert [str(tmp_path / "a.py"), str(tmp_path / "b.py")] == sorted(reads)
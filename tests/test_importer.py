@@ -287,3 +287,65 @@ assert isinstance(sys.argv[0], str)
 """)
 
     subprocess.run([sys.executable, "-m", "slipcover", "--silent", cmdfile], check=True)
+
+
+def test_finder_caches_lookups(tmp_path, monkeypatch):
+    import importlib
+    import slipcover as sc
+
+    (tmp_path / "cached_mod.py").write_text("x = 1\n")
+    monkeypatch.syspath_prepend(tmp_path)
+
+    class CountingMatcher:
+        def __init__(self):
+            self.calls = 0
+
+        def matches(self, filename):
+            self.calls += 1
+            return True
+
+    class CountingFinder:
+        def __init__(self):
+            self.calls = 0
+
+        def find_spec(self, fullname, path, target=None):
+            self.calls += 1
+            return None
+
+    matcher = CountingMatcher()
+    counter = CountingFinder()
+    mpf = im.SlipcoverMetaPathFinder(sc.Slipcover(), matcher)
+    monkeypatch.setattr(sys, 'meta_path', [mpf, counter, *sys.meta_path])
+
+    for _ in range(2):
+        spec = mpf.find_spec('cached_mod', None)
+        assert isinstance(spec.loader, im.SlipcoverLoader)
+    assert matcher.calls == 1
+
+    counter.calls = 0
+    assert mpf.find_spec('no_such_module_here', None) is None
+    assert mpf.find_spec('no_such_module_here', None) is None
+    assert counter.calls == 1
+
+    importlib.invalidate_caches()
+    assert mpf.find_spec('no_such_module_here', None) is None
+    assert counter.calls == 2
+
+    monkeypatch.syspath_prepend(tmp_path / "other")
+    assert mpf.find_spec('no_such_module_here', None) is None
+    assert counter.calls == 3
+
+
+def test_finder_finds_module_created_after_failed_import(tmp_path, monkeypatch):
+    import slipcover as sc
+
+    monkeypatch.syspath_prepend(tmp_path)
+    mpf = im.SlipcoverMetaPathFinder(sc.Slipcover(), im.MatchEverything())
+    monkeypatch.setattr(sys, 'meta_path', [mpf, *sys.meta_path])
+
+    assert mpf.find_spec('late_module', None) is None
+
+    (tmp_path / "late_module.py").write_text("x = 1\n")
+    spec = mpf.find_spec('late_module', None)
+    assert spec is not None
+    assert isinstance(spec.loader, im.SlipcoverLoader)
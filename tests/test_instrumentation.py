@@ -78,6 +78,8 @@ def test_probe_deinstrument():
 
 
 def check_line_probes(code):
+    from slipcover import probe
+
     # Are all lines where we expect?
     for (offset, line) in sc.findlinestarts(code):
         assert bc.op_NOP == code.co_code[offset], f"NOP missing at offset {offset}"
@@ -88,11 +90,10 @@ def check_line_probes(code):
             op_offset, op_len, op, op_arg = next(it)
             assert op == bc.op_PUSH_NULL
 
+        # the probe is called without arguments
         op_offset, op_len, op, op_arg = next(it)
         assert op == bc.op_LOAD_CONST
-
-        op_offset, op_len, op, op_arg = next(it)
-        assert op == bc.op_LOAD_CONST
+        assert probe.is_bound(code.co_consts[op_arg])
 
         op_offset, op_len, op, op_arg = next(it)
         if PYTHON_VERSION >= (3,11):
@@ -450,10 +451,45 @@ def test_deinstrument_immediately():
 
     assert 6 == foo(3)
 
+    # 3.11+ executes an adaptive copy of co_code
+    code_bytes = foo.__code__._co_code_adaptive if PYTHON_VERSION >= (3,11) else foo.__code__.co_code
     for off, *_ in dis.findlinestarts(foo.__code__):
-        if bc.op_RESUME == foo.__code__.co_code[off]:
+        if bc.op_RESUME == code_bytes[off]:
             continue
-        assert foo.__code__.co_code[off] == bc.op_JUMP_FORWARD
+        assert code_bytes[off] == bc.op_JUMP_FORWARD
+
+
+@pytest.mark.skipif(platform.python_implementation() == 'PyPy', reason="Immediate de-instrumentation does not work with PyPy")
+def test_deinstrument_immediately_bypasses_probes():
+    from slipcover import probe
+
+    base_line = current_line()
+    def foo(n):
+        x = 0
+        for i in range(n):
+            x += i
+        return x
+
+    sci = sc.Slipcover(immediate=True)
+    sci.instrument(foo)
+
+    # enough calls for 3.11+ to have quickened (specialized) the code
+    for _ in range(10):
+        assert 3 == foo(3)
+
+    signals = []
+    def profile(frame, event, arg):
+        if event == 'c_call' and probe.is_bound(arg):
+            signals.append(frame.f_lineno)
+
+    sys.setprofile(profile)
+    try:
+        assert 3 == foo(3)
+    finally:
+        sys.setprofile(None)
+
+    assert [] == signals
+    assert [2, 3, 4, 5] == [l-base_line for l in sci.get_coverage()['files'][simple_current_file()]['executed_lines']]
 
 
 def test_deinstrument_with_many_consts():
@@ -528,7 +564,7 @@ def test_deinstrument_seen_upon_d_miss_threshold(do_branch):
     foo(0)
 
     assert old_code != foo.__code__, "Code never de-instrumented"
-    assert sum(pr.was_removed(t) for t in old_code.co_consts if type(t).__name__ == 'PyCapsule') > 0
+    assert sum(pr.was_removed(t.__self__) for t in old_code.co_consts if pr.is_bound(t)) > 0
 
     cov = sci.get_coverage()['files']['foo']
     assert [2,3,4,5] == cov['executed_lines']
@@ -653,3 +689,308 @@ def test_find_functions():
                                                   visited))
 
 
+
+
+def test_deinstrument_deferred_by_policy():
+    class NeverNow(sc.DeinstrumentPolicy):
+        def __init__(self):
+            self.asked = 0
+
+        def threshold(self):
+            return 5
+
+        def should_deinstrument(self):
+            self.asked += 1
+            return False
+
+    policy = NeverNow()
+    sci = sc.Slipcover(deinstrument_policy=policy)
+
+    def foo(n):
+        x = 0
+        for _ in range(n):
+            x += 1
+        return x
+
+    sci.instrument(foo)
+    old_code = foo.__code__
+
+    foo(23)
+
+    assert old_code == foo.__code__, "Code de-instrumented"
+    # the loop body's 22 D misses ask 4 times, as the probe is re-armed every 5;
+    # depending on the Python version, the 'for' line may also ask
+    assert policy.asked >= 4
+
+    cov = sci.get_coverage()['files'][simple_current_file()]
+    assert [] == cov['missing_lines']
+
+
+def test_threshold_change_reaches_existing_probes():
+    class Lowered(sc.DeinstrumentPolicy):
+        def __init__(self):
+            self.value = 1_000
+            self.d_misses = 0
+
+        def threshold(self):
+            return self.value
+
+        def record_d_misses(self, d_misses):
+            self.d_misses += d_misses
+
+    policy = Lowered()
+    sci = sc.Slipcover(deinstrument_policy=policy)
+
+    def foo(n):
+        x = 0
+        for _ in range(n):
+            x += 1
+        return x
+
+    sci.instrument(foo)
+    old_code = foo.__code__
+
+    foo(10)
+    assert old_code == foo.__code__, "Code de-instrumented"
+
+    # probes created with the old threshold follow the new one
+    policy.value = 5
+    sci._update_threshold()
+    foo(1)
+
+    assert old_code != foo.__code__, "Code never de-instrumented"
+    assert policy.d_misses >= 10
+
+
+
+def test_no_repeated_sweeps_for_probes_left_in_place():
+    sci = sc.Slipcover(deinstrument_policy=sc.FixedThreshold(5))
+
+    def foo(n):
+        x = 0
+        for _ in range(n):
+            x += 1
+        return x
+
+    sci.instrument(foo)
+    foo(1)
+
+    # collects the lines seen without de-instrumenting them, so their probes stay in place
+    sci.get_coverage()
+    foo(10_000)
+
+    assert sci.get_stats()['deinstrument']['sweeps'] <= 1
+
+def test_deinstrument_sweeps_recorded_in_stats():
+    sci = sc.Slipcover(d_miss_threshold=3)
+
+    def foo(n):
+        x = 0
+        for _ in range(n):
+            x += 1
+        return x
+
+    sci.instrument(foo)
+    foo(10)
+
+    stats = sci.get_stats()['deinstrument']
+    assert 'FixedThreshold' == stats['policy']
+    assert 3 == stats['threshold']
+    assert 1 == stats['sweeps']
+
+
+
+def test_code_memo_concurrent_instrumentation():
+    sci = sc.Slipcover()
+    code = compile("x = 1\n", "foo.py", "exec")
+
+    instrument_code = sci._instrument_code
+    raced = False
+    def racing(co, lines, branches):
+        # as if another thread instrumented the same code while this one did
+        nonlocal raced
+        if co is code and not raced:
+            raced = True
+            sci._instrument(co, [], [])
+        return instrument_code(co, lines, branches)
+
+    sci._instrument_code = racing
+
+    new_code = sci.instrument(code)
+    assert 1 == len(sci.code_memo_keys["foo.py"])
+    assert new_code is next(iter(sci.code_memo.values()))[0]
+
+    assert sci.deinstrument_file("foo.py")
+    assert not sci.code_memo
+
+@pytest.mark.parametrize("do_branch", [False, True])
+def test_complete_file_gets_original_code(do_branch):
+    t = ast_parse("""
+        def foo(n):
+            if n > 0:
+                return n
+            return 0
+    """)
+    if do_branch:
+        t = br.preinstrument(t)
+
+    sci = sc.Slipcover(branch=do_branch)
+    m = types.ModuleType('foo')
+    sci.register_module(m)
+    code = compile(t, "foo.py", "exec")
+    exec(sci.instrument(code), m.__dict__)
+    sci.instrument(compile("def bar():\n    return 1\n", "bar.py", "exec"))
+
+    assert 1 == m.foo(1)
+    sci.deinstrument_seen()
+
+    # not complete yet
+    assert '__slipcover__' in m.foo.__code__.co_consts
+    assert 0 == sci.get_stats()['files_completed']
+
+    assert 0 == m.foo(0)
+    sci.deinstrument_seen()
+
+    original_foo = next(c for c in code.co_consts if isinstance(c, types.CodeType))
+    assert m.foo.__code__ is original_foo
+    assert not sci.instrumented.get("foo.py")
+    assert not any(co.co_filename == "foo.py" for co in sci.code2index)
+    assert 1 == sci.get_stats()['files_completed']
+
+    # the other file's code, probes and memo entries are left alone
+    assert {"bar.py"} == {co.co_filename for co in sci.code2index}
+    assert {"bar.py"} == {key[1] for key in sci.code_memo}
+    assert {"bar.py"} == set(sci.code_memo_keys)
+
+    cov = sci.get_coverage()['files']['foo.py']
+    assert [1, 2, 3, 4] == cov['executed_lines']
+    assert [] == cov['missing_lines']
+
+
+@pytest.mark.parametrize("do_branch", [False, True])
+def test_deinstrument_in_background(do_branch):
+    import threading
+
+    t = ast_parse("""
+        def foo(n):
+            x = 0;
+            for _ in range(100):
+                x += n
+            return x    # line 5
+    """)
+    if do_branch:
+        t = br.preinstrument(t)
+    g = dict()
+    exec(compile(t, "foo", "exec"), g, g)
+    foo = g['foo']
+
+    sci = sc.Slipcover(branch=do_branch, background_deinstrument=True)
+    assert sci.deinstrument_thread
+
+    real_deinstrument_seen = sci.deinstrument_seen
+    sweep_threads = []
+    def deinstrument_seen():
+        sweep_threads.append(threading.current_thread())
+        real_deinstrument_seen()
+    sci.deinstrument_seen = deinstrument_seen
+
+    sci.instrument(foo)
+    old_code = foo.__code__
+
+    foo(0)
+    assert sci.deinstrument_thread.flush(timeout=10)
+
+    assert old_code != foo.__code__, "Code never de-instrumented"
+    assert sweep_threads and all(t is sci.deinstrument_thread.thread for t in sweep_threads)
+
+    stats = sci.get_stats()['deinstrument_thread']
+    assert stats['sweeps'] >= 1
+    assert stats['requests'] >= stats['sweeps']
+
+    cov = sci.get_coverage()['files']['foo']
+    assert [2,3,4,5] == cov['executed_lines']
+    assert [] == cov['missing_lines']
+
+    sci.deinstrument_thread.stop()
+    assert not sci.deinstrument_thread.thread.is_alive()
+
+
+def test_deinstrument_in_background_not_for_immediate():
+    sci = sc.Slipcover(immediate=True, background_deinstrument=True)
+    assert sci.deinstrument_thread is None
+
+
+def test_instrument_only_lines():
+    from pathlib import Path
+
+    base_line = current_line()
+    def foo(n):
+        def bar(n):
+            return n+1
+        x = 0
+        for i in range(bar(n)):
+            x += i
+        return x
+
+    from slipcover import probe
+
+    def count_probes(co):
+        return sum(probe.is_bound(c) for c in co.co_consts)
+
+    orig_bar = next(c for c in foo.__code__.co_consts if isinstance(c, types.CodeType))
+
+    sci = sc.Slipcover(only_lines={str(Path(current_file()).resolve()): {base_line+4, base_line+6}})
+    sci.instrument(foo)
+
+    assert 2 == count_probes(foo.__code__)
+    assert orig_bar in foo.__code__.co_consts   # no lines of interest, left alone
+
+    assert 6 == foo(3)
+    sci.deinstrument_seen()
+
+    cov = sci.get_coverage()['files'][simple_current_file()]
+    assert [4, 6] == [l-base_line for l in cov['executed_lines']]
+    assert [] == cov['missing_lines']
+
+
+def test_instrument_reuses_identical_code():
+    t = ast_parse("""
+        def foo(n):
+            if n > 0:
+                return n
+            return 0
+    """)
+
+    sci = sc.Slipcover()
+
+    def make_foo(filename):
+        # like code generated by exec, as done by dataclasses, templates, etc.
+        m = types.ModuleType('foo')
+        exec(compile(t, filename, "exec"), m.__dict__)
+        sci.register_module(m)
+        sci.instrument(m.foo)
+        return m.foo
+
+    functions = [make_foo("foo.py") for _ in range(3)]
+
+    assert functions[0].__code__ is functions[1].__code__ is functions[2].__code__
+    assert {'hits': 2, 'misses': 1, 'hit_rate': 2/3} == sci.get_stats()['code_memo']
+
+    instrumented = functions[0].__code__
+    assert 1 == functions[0](1)
+    sci.deinstrument_seen()
+    assert functions[1].__code__ is not instrumented
+
+    # instrumenting again gets the de-instrumented version
+    foo = make_foo("foo.py")
+    assert foo.__code__ is functions[1].__code__
+    assert 0 == foo(0)
+
+    # different file name: not reused
+    bar = make_foo("bar.py")
+    assert bar.__code__ is not foo.__code__
+
+    cov = sci.get_coverage()['files']
+    assert [2, 3, 4] == cov['foo.py']['executed_lines']
+    assert [] == cov['foo.py']['missing_lines']
+    assert [2, 3, 4] == cov['bar.py']['missing_lines']
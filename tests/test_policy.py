@@ -0,0 +1,101 @@
+import pytest
+import slipcover.policy as pol
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fixed_threshold():
+    p = pol.FixedThreshold(42)
+    assert 42 == p.threshold()
+    assert p.should_deinstrument()
+
+    p.record_sweep(1_000, 10)
+    stats = p.stats()
+    assert 'FixedThreshold' == stats['policy']
+    assert 1 == stats['sweeps']
+
+
+def test_adaptive_first_sweep_always():
+    p = pol.AdaptiveThreshold(initial=50, clock=FakeClock())
+    assert p.should_deinstrument()
+    assert 50 == p.threshold()
+
+
+def test_adaptive_defers_expensive_sweeps():
+    clock = FakeClock()
+    p = pol.AdaptiveThreshold(initial=50, max_overhead=.1, clock=clock)
+
+    clock.now = 1_000
+    p.record_sweep(1_000, 10)   # took all the time since start
+
+    clock.now += 5_000          # 1,000 > 10% of 5,000
+    assert not p.should_deinstrument()
+    assert 100 == p.threshold()
+
+    clock.now += 10_000         # 1,000 <= 10% of 15,000
+    assert p.should_deinstrument()
+
+    stats = p.stats()
+    assert 1 == stats['sweeps']
+    assert 1 == stats['deferrals']
+    assert 100 == stats['max_threshold']
+
+
+def test_adaptive_lowers_threshold_for_cheap_sweeps():
+    clock = FakeClock()
+    p = pol.AdaptiveThreshold(initial=8, min_threshold=2, max_overhead=.1, clock=clock)
+
+    for _ in range(5):
+        clock.now += 1_000_000
+        assert p.should_deinstrument()
+        clock.now += 10
+        p.record_sweep(10, 1)
+
+    assert 2 == p.threshold()
+    assert 2 == p.stats()['min_threshold']
+
+
+def test_adaptive_threshold_bounds():
+    clock = FakeClock()
+    p = pol.AdaptiveThreshold(initial=50, max_threshold=150, max_overhead=.1, clock=clock)
+
+    clock.now = 1_000
+    p.record_sweep(1_000, 1)
+
+    for _ in range(5):
+        assert not p.should_deinstrument()
+
+    assert 150 == p.threshold()
+
+    with pytest.raises(AssertionError):
+        pol.AdaptiveThreshold(initial=5, min_threshold=10)
+
+
+def test_policy_is_abstract():
+    with pytest.raises(TypeError):
+        pol.DeinstrumentPolicy()
+
+
+def test_adaptive_sweeps_when_d_misses_cost_more():
+    clock = FakeClock()
+    p = pol.AdaptiveThreshold(initial=50, max_overhead=.1, d_miss_ns=10, clock=clock)
+
+    clock.now = 1_000
+    p.record_sweep(1_000, 10)
+
+    clock.now += 5_000          # sweeping would be too expensive...
+    p.record_d_misses(50)
+    assert not p.should_deinstrument()
+
+    p.record_d_misses(50)       # ... until 100 D misses cost as much as the sweep
+    assert p.should_deinstrument()
+
+    p.record_sweep(1_000, 10)
+    assert 0 == p.d_misses
+    assert 100 == p.stats()['d_misses']